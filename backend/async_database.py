@@ -0,0 +1,61 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from . import database
+
+# Optional asyncio engine for the hot read/write endpoints (see async_routes.py).
+# Enabled with ASYNC_DB=1 (database.ASYNC_DB); needs greenlet plus asyncpg (PostgreSQL)
+# or aiosqlite (SQLite). Only imported when enabled. The sync engine in database.py
+# stays in use for everything else.
+
+_engine = None
+_sessionmaker = None
+
+
+def async_url(url):
+    scheme, rest = url.split("://", 1)
+    if "+" in scheme:
+        scheme = scheme.split("+", 1)[0]
+    if scheme == "sqlite":
+        return "sqlite+aiosqlite://" + rest
+    if scheme in ("postgresql", "postgres"):
+        return "postgresql+asyncpg://" + rest
+    raise ValueError(f"No async driver configured for {scheme}")
+
+
+def engine_options(url):
+    if url.startswith("sqlite"):
+        return {}
+    options = {
+        "pool_size": database.DB_POOL_SIZE,
+        "max_overflow": database.DB_MAX_OVERFLOW,
+        "pool_timeout": database.DB_POOL_TIMEOUT,
+        "pool_recycle": database.DB_POOL_RECYCLE,
+        "pool_pre_ping": database.DB_POOL_PRE_PING,
+    }
+    if database.DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(database.DB_STATEMENT_TIMEOUT_MS)}}
+    return options
+
+
+def get_async_engine():
+    global _engine, _sessionmaker
+    if _engine is None:
+        url = async_url(database.SQLALCHEMY_DATABASE_URL)
+        _engine = create_async_engine(url, **engine_options(url))
+        if _engine.dialect.name == "sqlite":
+            # Same WAL / busy_timeout pragmas as the sync engine
+            event.listen(_engine.sync_engine, "connect", database._set_sqlite_pragmas)
+        _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False, autoflush=False)
+    return _engine
+
+
+async def get_async_db():
+    get_async_engine()
+    async with _sessionmaker() as db:
+        yield db
+
+
+async def dispose():
+    if _engine is not None:
+        await _engine.dispose()
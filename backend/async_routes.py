@@ -0,0 +1,325 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import timedelta, datetime, date
+from typing import List, Optional
+import logging
+import os
+
+from . import models, database, queries, user_auth, events, serializers, http_cache, patient_import, jobs
+from .async_database import get_async_db, dispose
+from .schemas import (
+    PatientResponse, PatientPage,
+    AppointmentCreate, AppointmentResponse,
+    HomeOPDCreate, HomeOPDResponse, HomeOPDPage, LoginRequest,
+)
+
+# Async versions of the busiest endpoints. When ASYNC_DB is on, install() swaps them in
+# for the sync routes with the same path and method; request/response shapes are identical.
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def get_current_user_async(token: str = Depends(user_auth.oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    # Same checks as the sync dependency; in claims mode a cache hit runs no query
+    user = await db.run_sync(lambda session: user_auth.user_for_token(token, session))
+    return user if isinstance(user, user_auth.Principal) else user_auth.principal_from_user(user)
+
+
+# --- Auth ---
+@router.post("/login")
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(models.User).where(models.User.username == request.username))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+
+    # bcrypt is CPU bound, keep it off the event loop
+    if not await run_in_threadpool(user_auth.verify_password, request.password, user.password_hash):
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+
+    access_token = user_auth.create_access_token(
+        data={"sub": user.username, "role": user.role, "loc": user.location_name or "", "ver": user.token_version or 0},
+        expires_delta=timedelta(minutes=user_auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer", "user": {"username": user.username, "role": user.role, "location": user.location_name}}
+
+
+# --- Patients ---
+@router.get("/patients", response_model=List[PatientResponse])
+async def get_patients(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    hn: Optional[str] = None,
+    cid: Optional[str] = None,
+    name: Optional[str] = None,
+    clinic: Optional[str] = None,
+    hc_zone: Optional[str] = None,
+    exact: bool = False,
+    compact: bool = False,
+    current_user=Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if limit is None:
+        limit = queries.PATIENT_PAGE_SIZE
+    if limit < 1 or limit > queries.PATIENT_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {queries.PATIENT_PAGE_SIZE_MAX}")
+
+    cache = await http_cache.check_async(request, db, "patients", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+
+    if compact:
+        stmt = queries.filter_patients(select(*serializers.PATIENT_COLUMNS), current_user, hn=hn, cid=cid, name=name, clinic=clinic, hc_zone=hc_zone, exact=exact)
+        rows, next_cursor = queries.split_page((await db.execute(queries.patients_after(stmt, cursor, limit))).all(), limit)
+        response = serializers.FastJSONResponse(serializers.patient_rows(rows))
+    else:
+        stmt = queries.filter_patients(select(models.Patient), current_user, hn=hn, cid=cid, name=name, clinic=clinic, hc_zone=hc_zone, exact=exact)
+        rows, next_cursor = queries.split_page((await db.execute(queries.patients_after(stmt, cursor, limit))).scalars().all(), limit)
+
+    cache.apply(response)
+    if next_cursor is not None:
+        response.headers[queries.NEXT_CURSOR_HEADER] = str(next_cursor)
+    return response if compact else rows
+
+
+@router.get("/patients/page", response_model=PatientPage)
+async def get_patients_page(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    hn: Optional[str] = None,
+    cid: Optional[str] = None,
+    name: Optional[str] = None,
+    clinic: Optional[str] = None,
+    hc_zone: Optional[str] = None,
+    exact: bool = False,
+    include_total: bool = True,
+    current_user=Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if limit is None:
+        limit = queries.PATIENT_PAGE_SIZE
+    if limit < 1 or limit > queries.PATIENT_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {queries.PATIENT_PAGE_SIZE_MAX}")
+
+    cache = await http_cache.check_async(request, db, "patients", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    stmt = queries.filter_patients(select(models.Patient), current_user, hn=hn, cid=cid, name=name, clinic=clinic, hc_zone=hc_zone, exact=exact)
+
+    total = None
+    if include_total:
+        total = (await db.execute(select(func.count()).select_from(stmt.subquery()))).scalar_one()
+
+    rows, next_cursor = queries.split_page((await db.execute(queries.patients_after(stmt, cursor, limit))).scalars().all(), limit)
+    return {"items": rows, "next_cursor": next_cursor, "total": total}
+
+
+def _import_in_session(run):
+    # The import engine is sync pandas + executemany work: the routes below run it in the
+    # threadpool on a session of the sync engine, so the event loop keeps serving requests
+    with database.SessionLocal() as db:
+        try:
+            return run(db)
+        except Exception:
+            db.rollback()
+            raise
+
+
+@router.post("/patients/upload")
+async def upload_patients(stream: bool = False, background: bool = False, file: UploadFile = File(...), current_user=Depends(get_current_user_async)):
+    if current_user.role not in ['hospital', 'admin']:
+        raise HTTPException(status_code=403, detail="Only hospital/admin can upload")
+
+    if background:
+        path = await patient_import.spool_upload(file, directory=jobs.job_dir())
+        job_id = await run_in_threadpool(jobs.submit_import, path, file.filename, current_user.username)
+        return JSONResponse(status_code=202, content={"message": "Upload queued", "job_id": job_id, "status": "queued"})
+
+    path = None
+    try:
+        if stream:
+            path = await patient_import.spool_upload(file)
+            result = await run_in_threadpool(_import_in_session, lambda db: patient_import.import_file(db, path))
+        else:
+            contents = await file.read()
+            result = await run_in_threadpool(_import_in_session, lambda db: patient_import.import_upload(db, contents, file.filename))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Patient upload failed: %s", file.filename)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if path:
+            os.remove(path)
+    return {"message": f"Uploaded {result['inserted']} patients", **result}
+
+
+# --- Appointments ---
+@router.post("/appointments", response_model=AppointmentResponse)
+async def create_appointment(appt: AppointmentCreate, current_user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    if current_user.role not in ['hospital', 'admin']:
+        raise HTTPException(status_code=403, detail="Only hospital/admin can create appointments")
+
+    try:
+        date_obj = datetime.strptime(appt.appointment_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format YYYY-MM-DD")
+
+    new_appt = models.Appointment(
+        patient_id=appt.patient_id,
+        appointment_date=date_obj,
+        note=appt.note,
+        status="pending",
+        req_bp=appt.req_bp,
+        req_bs=appt.req_bs
+    )
+    db.add(new_appt)
+    zone = (await db.execute(select(models.Patient.hc_zone).where(models.Patient.id == appt.patient_id))).scalar()
+    await db.run_sync(lambda session: http_cache.touch(session, "appointments", [zone]))
+    await db.commit()
+
+    stmt = select(models.Appointment).options(joinedload(models.Appointment.patient)).where(models.Appointment.id == new_appt.id)
+    result = (await db.execute(stmt)).scalars().first()
+    events.publish_appointment("appointment.created", result)
+    return result
+
+
+@router.get("/appointments", response_model=List[AppointmentResponse])
+async def get_appointments(
+    request: Request,
+    response: Response,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    compact: bool = False,
+    current_user=Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    cache = await http_cache.check_async(request, db, "appointments", current_user)
+    if cache.not_modified:
+        return cache.not_modified_response()
+
+    if compact:
+        stmt = queries.filter_appointments(
+            select(*serializers.APPOINTMENT_COLUMNS, *serializers.PATIENT_COLUMNS), current_user,
+            start_date=start_date, end_date=end_date, load_patient=False
+        )
+        return cache.apply(serializers.FastJSONResponse(serializers.appointment_rows((await db.execute(stmt)).all())))
+
+    cache.apply(response)
+    stmt = queries.filter_appointments(select(models.Appointment), current_user, start_date=start_date, end_date=end_date)
+    return (await db.execute(stmt)).scalars().all()
+
+
+# --- Home OPD ---
+@router.post("/home-opd", response_model=HomeOPDResponse)
+async def create_home_opd(item: HomeOPDCreate, current_user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    source = "hospital" if current_user.role in ['hospital', 'admin'] else "hc"
+
+    if not item.cid and not item.patient_id:
+        raise HTTPException(status_code=400, detail="CID or Patient ID required")
+
+    new_item = models.HomeOPD(
+        patient_id=item.patient_id,
+        cid=item.cid,
+        name=item.name,
+        type=item.type,
+        note=item.note,
+        source=source,
+        location=current_user.location_name,
+        created_at=date.today()
+    )
+    db.add(new_item)
+    patient_zone = None
+    if item.patient_id:
+        patient_zone = (await db.execute(select(models.Patient.hc_zone).where(models.Patient.id == item.patient_id))).scalar()
+    await db.run_sync(lambda session: http_cache.touch(session, "home_opd", [current_user.location_name, patient_zone]))
+    await db.commit()
+    return new_item
+
+
+@router.get("/home-opd", response_model=List[HomeOPDResponse])
+async def get_home_opd(request: Request, response: Response, current_user=Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    cache = await http_cache.check_async(request, db, "home_opd", current_user)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    stmt = queries.filter_home_opd(select(models.HomeOPD), current_user)
+    return (await db.execute(stmt)).scalars().all()
+
+
+@router.get("/home-opd/page", response_model=HomeOPDPage)
+async def get_home_opd_page(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    type: Optional[str] = None,
+    source: Optional[str] = None,
+    hc_zone: Optional[str] = None,
+    include_total: bool = True,
+    current_user=Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if limit is None:
+        limit = queries.HOME_OPD_PAGE_SIZE
+    if limit < 1 or limit > queries.HOME_OPD_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {queries.HOME_OPD_PAGE_SIZE_MAX}")
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format YYYY-MM-DD")
+
+    cache = await http_cache.check_async(request, db, "home_opd", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    stmt = queries.filter_home_opd(
+        select(*queries.HOME_OPD_COLUMNS), current_user,
+        start_date=start, end_date=end, type=type, source=source, hc_zone=hc_zone
+    )
+
+    total = None
+    if include_total:
+        total = (await db.execute(select(func.count()).select_from(stmt.subquery()))).scalar_one()
+
+    if cursor is not None:
+        stmt = stmt.filter(models.HomeOPD.id < cursor)
+    rows = (await db.execute(stmt.order_by(models.HomeOPD.id.desc()).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor, "total": total}
+
+
+def install(app):
+    # Each async route takes the place of the sync route with the same path and method, so
+    # the route order (the SPA catch-all last) stays as it was
+    replacements = {(route.path, method): route for route in router.routes for method in route.methods}
+    routes = []
+    for r in app.router.routes:
+        if isinstance(r, APIRoute) and any((r.path, m) in replacements for m in r.methods):
+            r = replacements[(r.path, next(m for m in r.methods if (r.path, m) in replacements))]
+            if r in routes:
+                continue
+        routes.append(r)
+    routes += [r for r in router.routes if r not in routes]
+    app.router.routes = routes
+    app.on_event("shutdown")(dispose)
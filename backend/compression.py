@@ -0,0 +1,188 @@
+import gzip
+import logging
+import mimetypes
+import os
+import sys
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip only without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Compression for slow links (HC sites on mobile data).
+#
+# CompressionMiddleware compresses API responses on the fly: gzip, or brotli when the client
+# accepts it and the brotli package is installed. Only whole responses sent in one piece are
+# compressed (JSON, HTML); streams (SSE, large files) go out as they are.
+#
+# The built frontend is compressed ahead of time instead: precompress() writes a .gz / .br
+# next to every text asset in frontend/dist (at startup, or as a build step with
+# `python -m backend.compression frontend/dist`), and static_files.py sends the variant that
+# matches Accept-Encoding.
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))  # Bytes; smaller bodies aren't worth it
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))  # gzip 1-9
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))  # 0-11, on the fly; precompress() uses 11
+THREAD_MIN_SIZE = 256 * 1024  # Compress bigger bodies off the event loop
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+EXCLUDED_TYPES = ("text/event-stream",)
+PRECOMPRESS_EXTENSIONS = (".js", ".mjs", ".css", ".html", ".json", ".svg", ".txt", ".map", ".xml", ".webmanifest")
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """Best of `encodings` (in server preference order) the client accepts, or None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in encodings or available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding, precompress=False):
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if precompress else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if precompress else COMPRESS_LEVEL, mtime=0)
+
+
+def _compressible(content_type):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if not content_type or content_type in EXCLUDED_TYPES:
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+# --- On the fly ---
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Hold the headers back until we know whether the body gets compressed
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not _compressible(headers.get("content-type"))
+            ):
+                # Streamed, small, already encoded (precompressed files) or binary
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) >= THREAD_MIN_SIZE:
+                body = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                # Same entity, different bytes
+                headers["ETag"] = "W/" + headers["etag"]
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+# --- Precompressed static files ---
+def media_type(path):
+    return mimetypes.guess_type(path)[0] or "text/plain"
+
+
+def precompress(directory, minimum_size=COMPRESS_MIN_SIZE):
+    """Write .gz (and .br with the brotli package) next to each text asset under `directory`.
+
+    Skips files whose variants are already newer than the source, and variants that don't
+    come out smaller. Returns the number of files written.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < minimum_size:
+                continue
+            body = None
+            for encoding in available_encodings():
+                target = path + ENCODINGS[encoding]
+                if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                if body is None:
+                    with open(path, "rb") as f:
+                        body = f.read()
+                data = compress(body, encoding, precompress=True)
+                if len(data) >= len(body):
+                    continue
+                with open(target, "wb") as f:
+                    f.write(data)
+                written += 1
+    return written
+
+
+def precompress_safely(directory):
+    # Startup hook: a read-only install just serves the uncompressed files
+    try:
+        written = precompress(directory)
+        if written:
+            logger.info("Precompressed %s static files in %s", written, directory)
+    except OSError:
+        logger.warning("Could not precompress %s", directory, exc_info=True)
+
+
+if __name__ == "__main__":
+    # Build step: python -m backend.compression frontend/dist
+    for directory in sys.argv[1:] or [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "dist")]:
+        print(f"{directory}: {precompress(directory)} files written")
@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import threading
+import json
+import logging
 import os
 import sys
 from dotenv import load_dotenv
@@ -8,61 +11,152 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Get absolute path of this file's directory
+if getattr(sys, 'frozen', False):
+    # If the application is run as a bundle, the PyInstaller bootloader
+    # extends the sys module by a flag frozen=True and sets the app
+    # path into variable _MEIPASS'.
+    # However, we want the DB to be external (next to the EXE), not internal temp.
+    # So we use sys.executable to find the folder where .exe lives.
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Check for external config
+CONFIG_PATH = os.path.join(BASE_DIR, "server_config.json")
+
+def load_server_config():
+    if not os.path.exists(CONFIG_PATH):
+        return {}
+    try:
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error("Failed to load server_config.json: %s", e)
+        return {}
+
+server_config = load_server_config()
+
+def get_setting(env_name, default, cast=str):
+    # Environment variable wins, then the lower-case key in server_config.json, then the default
+    value = os.getenv(env_name)
+    if value is None:
+        value = server_config.get(env_name.lower())
+    if value is None or value == "":
+        return default
+    if cast is bool:
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+    return cast(value)
+
+# --- Engine tuning ---
+# PostgreSQL (Supabase/Railway)
+DB_POOL_SIZE = get_setting("DB_POOL_SIZE", 5, int)
+DB_MAX_OVERFLOW = get_setting("DB_MAX_OVERFLOW", 10, int)
+DB_POOL_TIMEOUT = get_setting("DB_POOL_TIMEOUT", 30, int) # seconds to wait for a free connection
+DB_POOL_RECYCLE = get_setting("DB_POOL_RECYCLE", 1800, int) # seconds, below the server/pooler idle timeout
+DB_POOL_PRE_PING = get_setting("DB_POOL_PRE_PING", True, bool)
+DB_STATEMENT_TIMEOUT_MS = get_setting("DB_STATEMENT_TIMEOUT_MS", 30000, int) # 0 = no limit
+# SQLite (local / single-machine installs)
+SQLITE_JOURNAL_MODE = get_setting("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = get_setting("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = get_setting("SQLITE_BUSY_TIMEOUT_MS", 5000, int)
+SQLITE_MMAP_SIZE = get_setting("SQLITE_MMAP_SIZE", 256 * 1024 * 1024, int)
+# Serve the hot endpoints from an asyncio engine (async_database.py / async_routes.py)
+ASYNC_DB = get_setting("ASYNC_DB", False, bool)
+
 # Get database URL from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if DATABASE_URL:
     # Production mode: Use PostgreSQL from environment variable (Supabase/Railway)
-    print(f"DEBUG: Using PostgreSQL from DATABASE_URL")
+    logger.debug("Using database from DATABASE_URL")
     SQLALCHEMY_DATABASE_URL = DATABASE_URL
-
-    # Create engine for PostgreSQL
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
+        # Heroku/Railway style scheme, SQLAlchemy only accepts postgresql://
+        SQLALCHEMY_DATABASE_URL = "postgresql://" + SQLALCHEMY_DATABASE_URL[len("postgres://"):]
 
 else:
     # Development mode: Use SQLite (local development)
-    print(f"DEBUG: DATABASE_URL not found, using SQLite for local development")
-
-    # Get absolute path of this file's directory
-    if getattr(sys, 'frozen', False):
-        # If the application is run as a bundle, the PyInstaller bootloader
-        # extends the sys module by a flag frozen=True and sets the app
-        # path into variable _MEIPASS'.
-        # However, we want the DB to be external (next to the EXE), not internal temp.
-        # So we use sys.executable to find the folder where .exe lives.
-        BASE_DIR = os.path.dirname(sys.executable)
-    else:
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-
-    print(f"DEBUG: Database Base Directory: {BASE_DIR}")
-
-    # Check for external config
-    CONFIG_PATH = os.path.join(BASE_DIR, "server_config.json")
+    logger.debug("DATABASE_URL not found, using SQLite for local development")
+    logger.debug("Database base directory: %s", BASE_DIR)
+
     DB_PATH = os.path.join(BASE_DIR, "ncd_app.db") # Default
+    if server_config.get("db_path"):
+        DB_PATH = server_config["db_path"]
+        logger.debug("Loaded DB path from config: %s", DB_PATH)
 
-    if os.path.exists(CONFIG_PATH):
-        import json
-        try:
-            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                if "db_path" in config and config["db_path"]:
-                    DB_PATH = config["db_path"]
-                    print(f"DEBUG: Loaded DB Path from config: {DB_PATH}")
-        except Exception as e:
-            print(f"ERROR: Failed to load server_config.json: {e}")
-
-    print(f"DEBUG: Final Database Path: {DB_PATH}")
-    if os.path.exists(DB_PATH):
-        print("DEBUG: Database file FOUND.")
-    else:
-        print("DEBUG: Database file NOT FOUND.")
+    logger.debug("Database path: %s (%s)", DB_PATH, "found" if os.path.exists(DB_PATH) else "not found, will be created")
 
     SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-    # Create engine for SQLite
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-    )
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+def engine_options(url):
+    if url.startswith("sqlite"):
+        # Pragmas are applied per connection in _set_sqlite_pragmas
+        return {"connect_args": {"check_same_thread": False}}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS and url.startswith("postgresql") and "+" not in url.split("://")[0]:
+        # libpq startup option; psycopg2 is the default driver
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run while one writer commits, busy_timeout waits for the lock
+    # instead of failing with "database is locked"
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+# --- Pool statistics ---
+_pool_counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+_pool_counters_lock = threading.Lock()
+
+def _count(name):
+    def listener(*args):
+        with _pool_counters_lock:
+            _pool_counters[name] += 1
+    return listener
+
+def configure_engine(engine):
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(engine, "connect", _count("connects"))
+    event.listen(engine, "checkout", _count("checkouts"))
+    event.listen(engine, "checkin", _count("checkins"))
+    event.listen(engine, "invalidate", _count("invalidations"))
+    return engine
+
+engine = configure_engine(create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL)))
+
+def get_pool_status():
+    pool = engine.pool
+    status = {"dialect": engine.dialect.name, "pool_class": type(pool).__name__}
+    # Not every pool class has all of these (e.g. SQLite memory DBs use SingletonThreadPool)
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            try:
+                status[name] = fn()
+            except Exception:
+                pass
+    with _pool_counters_lock:
+        status.update(_pool_counters)
+    return status
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
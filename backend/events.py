@@ -0,0 +1,203 @@
+from collections import deque
+from datetime import datetime
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+
+# In-process event bus for appointment changes, streamed to browsers over SSE
+# (GET /events, see main.py) so the hospital side doesn't have to poll /appointments.
+#
+# Endpoints call publish() after their commit. With several uvicorn workers each process
+# only sees its own publishes, so set EVENT_BROKER_URL=redis://host:6379/0 to relay every
+# event through Redis pub/sub (needs the redis package); without it the bus stays local.
+# Event ids (the SSE id a reconnecting browser sends back as Last-Event-ID) then come from
+# a Redis counter, so they mean the same on every worker.
+
+logger = logging.getLogger(__name__)
+
+EVENT_BROKER_URL = os.getenv("EVENT_BROKER_URL", "")
+EVENT_CHANNEL = os.getenv("EVENT_CHANNEL", "ncd4you:events")
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", 500)) # Kept for Last-Event-ID replay
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 200)) # Per connected client
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", 15))
+
+
+class Subscriber:
+    def __init__(self, loop, zone=None):
+        self.loop = loop
+        self.zone = zone # None = every zone (hospital/admin)
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event):
+        return self.zone is None or event.get("hc_zone") == self.zone
+
+    def offer(self, event):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client is too slow; it gets a "resync" and should reload through /sync
+            self.overflowed = True
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=EVENT_HISTORY)
+
+    def dispatch(self, event, event_id=None):
+        # Fan an event out to the subscribers of this process. Safe to call from any thread.
+        # event_id comes from the broker when events are shared between workers.
+        with self._lock:
+            event = dict(event, id=event_id if event_id is not None else next(self._ids))
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.wants(event):
+                try:
+                    sub.loop.call_soon_threadsafe(sub.offer, event)
+                except RuntimeError:
+                    # Loop already closed
+                    self.unsubscribe(sub)
+
+    def subscribe(self, zone=None, last_event_id=None):
+        sub = Subscriber(asyncio.get_running_loop(), zone)
+        with self._lock:
+            self._subscribers.add(sub)
+            backlog = [e for e in self._history if last_event_id is not None and e["id"] > last_event_id and sub.wants(e)]
+        for event in backlog:
+            sub.offer(event)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+class LocalBroker:
+    # Single process: publish straight to the bus
+    def __init__(self, bus):
+        self.bus = bus
+
+    def start(self):
+        pass
+
+    def publish(self, event):
+        self.bus.dispatch(event)
+
+    def stop(self):
+        pass
+
+
+class RedisBroker:
+    # Several workers: publish to a Redis channel, every worker's listener thread
+    # (including the publisher's) dispatches what it receives to its local bus.
+    # The script numbers and publishes in one step, so ids arrive in increasing order.
+    PUBLISH_SCRIPT = """
+    local id = redis.call('INCR', KEYS[1])
+    redis.call('PUBLISH', ARGV[1], id .. ' ' .. ARGV[2])
+    return id
+    """
+
+    def __init__(self, bus, url, channel):
+        try:
+            import redis  # Optional dependency, only needed when EVENT_BROKER_URL is set
+        except ImportError:
+            raise RuntimeError("EVENT_BROKER_URL is set but the redis package is not installed (pip install redis)") from None
+
+        self.bus = bus
+        self.channel = channel
+        self.client = redis.Redis.from_url(url)
+        self._publish = self.client.register_script(self.PUBLISH_SCRIPT)
+        self._pubsub = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+        self._thread = threading.Thread(target=self._listen, name="event-broker", daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        for message in self._pubsub.listen():
+            try:
+                event_id, _, data = message["data"].partition(b" ")
+                self.bus.dispatch(json.loads(data), int(event_id))
+            except Exception:
+                logger.exception("Could not dispatch event from %s", self.channel)
+
+    def publish(self, event):
+        self._publish(keys=[f"{self.channel}:last_id"], args=[self.channel, json.dumps(event, default=str)])
+
+    def stop(self):
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+bus = EventBus()
+broker = RedisBroker(bus, EVENT_BROKER_URL, EVENT_CHANNEL) if EVENT_BROKER_URL else LocalBroker(bus)
+
+
+def publish(event_type, hc_zone=None, **data):
+    # Never let a broker hiccup fail the request that already committed
+    event = {"type": event_type, "hc_zone": hc_zone, "at": datetime.utcnow().isoformat(), **data}
+    try:
+        broker.publish(event)
+    except Exception:
+        logger.exception("Could not publish %s", event_type)
+
+
+def publish_appointment(event_type, appt, hc_zone=None):
+    # Small payload: clients refetch the row (or GET /sync) if they need more
+    publish(
+        event_type,
+        hc_zone=hc_zone if hc_zone is not None else (appt.patient.hc_zone if appt.patient else None),
+        appointment_id=appt.id,
+        patient_id=appt.patient_id,
+        status=appt.status,
+        appointment_date=str(appt.appointment_date) if appt.appointment_date else None,
+        row_version=appt.row_version,
+    )
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str, ensure_ascii=False)}\n\n"
+
+
+async def stream(request, zone=None, last_event_id=None):
+    # Async generator for StreamingResponse: events as they come, a comment line as
+    # heartbeat so proxies keep the connection open, stop when the client goes away
+    sub = bus.subscribe(zone=zone, last_event_id=last_event_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                if sub.overflowed:
+                    yield "event: resync\ndata: {}\n\n"
+                    break
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event)
+            if sub.overflowed and sub.queue.empty():
+                yield "event: resync\ndata: {}\n\n"
+                break
+    finally:
+        bus.unsubscribe(sub)
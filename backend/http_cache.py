@@ -0,0 +1,160 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime
+import hashlib
+import os
+
+from fastapi import Request, Response
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Conditional GET for the list endpoints and cache headers for the built frontend.
+#
+# Every write to patients / appointments / home_opd calls touch() before its commit, which
+# bumps a per-zone version row in data_versions ("etag:<collection>:<zone>"). A zone's list
+# request reads just that one row; the all-zones views (hospital/admin) read the sum of the
+# collection's rows, which grows with every bump, so writers only ever lock the rows of the
+# zones they changed. If the client's If-None-Match still matches, it gets a 304 before any
+# list query runs. If-Modified-Since is not honoured here: Last-Modified has one-second
+# resolution, so a write in the same second as the previous response would still get a 304.
+
+COLLECTIONS = ("patients", "appointments", "home_opd")
+ALL_ZONES = "*"
+NO_ZONE = "-"  # Version row for changes to rows without a zone
+# Change to invalidate every client copy at once, e.g. after a response format change
+ETAG_SALT = os.getenv("ETAG_SALT", "1")
+
+# Vite writes its build output with a content hash in the name (assets/index-3f2a9c1b.js);
+# a file under that name never changes
+ASSETS_DIR = "assets/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def _key(collection, zone):
+    return f"etag:{collection}:{zone or NO_ZONE}"
+
+
+def _prefix(collection):
+    return f"etag:{collection}:"
+
+
+# --- Versions ---
+def _bump(db: Session, key, now):
+    table = models.DataVersion.__table__
+    updated = db.execute(
+        update(table).where(table.c.key == key).values(version=table.c.version + 1, updated_at=now)
+    ).rowcount
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.execute(table.insert().values(key=key, version=1, updated_at=now))
+        except IntegrityError:
+            # Another request created it first
+            db.execute(update(table).where(table.c.key == key).values(version=table.c.version + 1, updated_at=now))
+
+
+def touch(db: Session, collection, zones=()):
+    """Bump the versions of `collection` for each zone in `zones` (None: rows without a zone).
+
+    Runs in the caller's transaction, so the bump commits (or rolls back) with the change.
+    """
+    now = datetime.utcnow()
+    keys = {_key(collection, z) for z in zones} or {_key(collection, None)}
+    for key in sorted(keys):  # Fixed order, so concurrent writers lock the rows the same way
+        _bump(db, key, now)
+
+
+def touch_all(db: Session, collection):
+    # Every zone's version, for changes that aren't tied to a zone (KPI rebuild). The NO_ZONE
+    # row is upserted too, so the all-zones views change even before any zone has a row.
+    table = models.DataVersion.__table__
+    now = datetime.utcnow()
+    db.execute(update(table).where(table.c.key.startswith(_prefix(collection), autoescape=True))
+               .values(version=table.c.version + 1, updated_at=now))
+    _bump(db, _key(collection, None), now)
+
+
+def touch_patient_zones(db: Session, *zones):
+    # A patient change shows up in all three lists (appointments and home OPD embed/filter by patient zone)
+    for collection in COLLECTIONS:
+        touch(db, collection, zones)
+
+
+def _version_stmt(collection, zone):
+    table = models.DataVersion.__table__
+    if zone:
+        return select(table.c.version, table.c.updated_at).where(table.c.key == _key(collection, zone))
+    return select(func.coalesce(func.sum(table.c.version), 0), func.max(table.c.updated_at)) \
+        .where(table.c.key.startswith(_prefix(collection), autoescape=True))
+
+
+def collection_version(db: Session, collection, zone=None):
+    """Current version of `collection` for one zone, or of all zones; changes on every write."""
+    row = db.execute(_version_stmt(collection, zone)).first()
+    return row[0] if row else 0
+
+
+class Validator:
+    """ETag (and informational Last-Modified) for one list request, built from the collection version."""
+
+    def __init__(self, request: Request, collection, zone, row, scope=""):
+        version, updated_at = row if row else (0, None)
+        # Same data for the same filters, caller scope (role/zone) and version
+        query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items() if k != "access_token"))
+        raw = f"{ETAG_SALT}|{request.url.path}?{query}|{scope}|{collection}|{zone or ALL_ZONES}|{version}"
+        self.etag = '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24] + '"'
+        self.last_modified = updated_at.replace(tzinfo=timezone.utc, microsecond=0) if updated_at else None
+        self.not_modified = self._matches(request)
+
+    def _matches(self, request):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+        # No If-Modified-Since, see the comment at the top
+        return False
+
+    def headers(self):
+        headers = {"ETag": self.etag, "Cache-Control": "private, " + REVALIDATE, "Vary": "Authorization"}
+        if self.last_modified:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def apply(self, response: Response):
+        response.headers.update(self.headers())
+        return response
+
+    def not_modified_response(self):
+        return Response(status_code=304, headers=self.headers())
+
+
+def _scope(current_user):
+    return f"{current_user.role}:{current_user.location_name or ''}"
+
+
+def _zone(current_user, hc_zone=None):
+    return current_user.location_name if current_user.role == 'hc' else hc_zone
+
+
+def check(request: Request, db: Session, collection, current_user, hc_zone=None):
+    zone = _zone(current_user, hc_zone)
+    row = db.execute(_version_stmt(collection, zone)).first()
+    return Validator(request, collection, zone, row, _scope(current_user))
+
+
+async def check_async(request: Request, db, collection, current_user, hc_zone=None):
+    zone = _zone(current_user, hc_zone)
+    row = (await db.execute(_version_stmt(collection, zone))).first()
+    return Validator(request, collection, zone, row, _scope(current_user))
+
+
+# --- Static files ---
+def static_cache_control(url_path, hashed_files=None):
+    # hashed_files: the files Vite's build manifest lists. Without a manifest, everything Vite
+    # wrote to assets/ (files from public/ are copied to the root under their own names)
+    if hashed_files is not None:
+        return IMMUTABLE if url_path in hashed_files else REVALIDATE
+    return IMMUTABLE if url_path.startswith(ASSETS_DIR) else REVALIDATE
@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+import os
+import socket
+import tempfile
+import uuid
+
+from . import models, database, patient_import
+
+logger = logging.getLogger(__name__)
+
+# Local background job runner for long imports.
+# The job row is the source of truth: progress is written in the same transaction as
+# each imported batch, so a job interrupted by a restart is picked up where it stopped.
+
+IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", 2))
+IMPORT_JOB_DIR = os.getenv("IMPORT_JOB_DIR") or os.path.join(tempfile.gettempdir(), "ncd_import_jobs")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+
+
+def job_dir():
+    os.makedirs(IMPORT_JOB_DIR, exist_ok=True)
+    return IMPORT_JOB_DIR
+
+
+def submit_import(path, filename, username):
+    db = database.SessionLocal()
+    try:
+        job = models.ImportJob(
+            id=uuid.uuid4().hex,
+            status="queued",
+            filename=filename,
+            file_path=path,
+            created_by=username,
+            rows_total=patient_import.count_rows(path),
+            created_at=datetime.utcnow()
+        )
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+
+    _executor.submit(run_import_job, job_id)
+    return job_id
+
+
+def _claim(db, job_id):
+    # Conditional UPDATE so two workers can never run the same job
+    claimed = db.query(models.ImportJob).filter(
+        models.ImportJob.id == job_id,
+        models.ImportJob.status == "queued"
+    ).update({
+        models.ImportJob.status: "running",
+        models.ImportJob.worker: WORKER_ID,
+        models.ImportJob.started_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def run_import_job(job_id):
+    db = database.SessionLocal()
+    try:
+        if not _claim(db, job_id):
+            return
+        job = db.query(models.ImportJob).filter(models.ImportJob.id == job_id).first()
+
+        # Resume from the last committed batch (all zeros for a fresh job)
+        result = {
+            "inserted": job.inserted or 0,
+            "skipped": job.skipped or 0,
+            "rejected": job.rejected or 0,
+            "rows": job.rows_done or 0,
+            "report": json.loads(job.report) if job.report else [],
+            "report_truncated": False
+        }
+
+        def on_batch(res):
+            job.rows_done = res["rows"]
+            job.inserted = res["inserted"]
+            job.skipped = res["skipped"]
+            job.rejected = res["rejected"]
+            job.report = json.dumps(res["report"], ensure_ascii=False)
+
+        try:
+            patient_import.import_file(db, job.file_path, on_batch=on_batch, result=result, skip_rows=job.rows_done or 0)
+        except Exception as e:
+            db.rollback()
+            logger.exception("Import job %s failed", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "completed"
+            if job.rows_total is None or job.rows_total < job.rows_done:
+                job.rows_total = job.rows_done
+        job.finished_at = datetime.utcnow()
+        db.commit()
+
+        try:
+            os.remove(job.file_path)
+        except OSError:
+            pass
+    finally:
+        db.close()
+
+
+def _is_orphaned(job):
+    # A running job belongs to a dead process if it was started by this host and that pid is gone
+    if not job.worker:
+        return True
+    host, _, pid = job.worker.rpartition(":")
+    if host != socket.gethostname():
+        return False
+    if job.worker == WORKER_ID:
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (ValueError, PermissionError):
+        return False
+    return False
+
+
+def resume_pending_jobs():
+    """Re-queue jobs left queued or orphaned by a restart. Called at startup."""
+    db = database.SessionLocal()
+    try:
+        pending = db.query(models.ImportJob).filter(models.ImportJob.status.in_(["queued", "running"])).all()
+        to_run = []
+        for job in pending:
+            if job.status == "running" and not _is_orphaned(job):
+                continue
+            if not job.file_path or not os.path.exists(job.file_path):
+                job.status = "failed"
+                job.error = "Upload file missing after restart"
+                job.finished_at = datetime.utcnow()
+                continue
+            job.status = "queued"
+            to_run.append(job.id)
+        db.commit()
+    finally:
+        db.close()
+
+    for job_id in to_run:
+        _executor.submit(run_import_job, job_id)
+    return to_run
+
+
+def job_to_dict(job, with_report=False):
+    end = job.finished_at or datetime.utcnow()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else None
+    data = {
+        "id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "created_by": job.created_by,
+        "rows_total": job.rows_total,
+        "rows_done": job.rows_done or 0,
+        "progress": round(100.0 * (job.rows_done or 0) / job.rows_total, 1) if job.rows_total else None,
+        "rows_per_sec": round((job.rows_done or 0) / elapsed, 1) if elapsed else None,
+        "inserted": job.inserted or 0,
+        "skipped": job.skipped or 0,
+        "rejected": job.rejected or 0,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+    if with_report:
+        data["report"] = json.loads(job.report) if job.report else []
+    return data
@@ -0,0 +1,168 @@
+from datetime import date, datetime
+import logging
+import os
+
+from sqlalchemy import select, update, insert, delete, func, case, and_, extract
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, http_cache
+
+logger = logging.getLogger(__name__)
+
+# BP / blood sugar control rates for the dashboard, per hc_zone, clinic and month.
+#
+# kpi_summary holds counters per (zone, clinic, month of appointment_date). Every write that
+# changes a completed appointment (visit results, refer back) or moves a patient to another
+# zone/clinic adds the difference to the affected rows in the same transaction, so
+# GET /dashboard/kpi reads zones x clinics x months rows instead of every appointment.
+# rebuild() recomputes the table from scratch (first start, or after changing the targets
+# below): POST /admin/kpi/rebuild or `python -m backend.kpi`.
+
+# BP is controlled below both limits; the second reading counts when it was taken
+BP_SYS_MAX = int(os.getenv("KPI_BP_SYS_MAX", 140))
+BP_DIA_MAX = int(os.getenv("KPI_BP_DIA_MAX", 90))
+# Blood sugar (mg/dL) is controlled within SUGAR_MIN..SUGAR_MAX
+SUGAR_MIN = int(os.getenv("KPI_SUGAR_MIN", 70))
+SUGAR_MAX = int(os.getenv("KPI_SUGAR_MAX", 130))
+
+COUNTERS = ("completed", "bp_measured", "bp_controlled", "bs_measured", "bs_controlled")
+FIELDS = ("status", "bp_sys", "bp_dia", "bp_sys_2", "bp_dia_2", "blood_sugar")
+BUILT_KEY = "kpi_summary"
+
+
+def snapshot(appt):
+    # The values counts() needs, from an Appointment or a row with the same attributes
+    return {f: getattr(appt, f) for f in FIELDS}
+
+
+def bp_reading(values):
+    # (sys, dia) that counts for a visit: the second reading when it was taken
+    if values.get("bp_sys_2") is not None and values.get("bp_dia_2") is not None:
+        return values["bp_sys_2"], values["bp_dia_2"]
+    return values.get("bp_sys"), values.get("bp_dia")
+
+
+def counts(values):
+    """Counters one appointment adds to its bucket; nothing unless it is completed."""
+    out = dict.fromkeys(COUNTERS, 0)
+    if not values or values.get("status") != "completed":
+        return out
+    out["completed"] = 1
+    bp_sys, bp_dia = bp_reading(values)
+    if bp_sys is not None and bp_dia is not None:
+        out["bp_measured"] = 1
+        out["bp_controlled"] = int(bp_sys < BP_SYS_MAX and bp_dia < BP_DIA_MAX)
+    sugar = values.get("blood_sugar")
+    if sugar is not None:
+        out["bs_measured"] = 1
+        out["bs_controlled"] = int(SUGAR_MIN <= sugar <= SUGAR_MAX)
+    return out
+
+
+def _sql_counters():
+    # Same rules as counts(), as aggregates over completed appointments
+    a = models.Appointment
+    second = and_(a.bp_sys_2.isnot(None), a.bp_dia_2.isnot(None))
+    bp_sys = case((second, a.bp_sys_2), else_=a.bp_sys)
+    bp_dia = case((second, a.bp_dia_2), else_=a.bp_dia)
+    bp_measured = and_(bp_sys.isnot(None), bp_dia.isnot(None))
+    return [
+        func.count(a.id),
+        func.sum(case((bp_measured, 1), else_=0)),
+        func.sum(case((and_(bp_measured, bp_sys < BP_SYS_MAX, bp_dia < BP_DIA_MAX), 1), else_=0)),
+        func.sum(case((a.blood_sugar.isnot(None), 1), else_=0)),
+        func.sum(case((a.blood_sugar.between(SUGAR_MIN, SUGAR_MAX), 1), else_=0)),
+    ]
+
+
+def _monthly(db: Session, *criteria, by=()):
+    # (year, month, *by, *counters) for the completed appointments matching criteria
+    a = models.Appointment
+    period = [extract("year", a.appointment_date), extract("month", a.appointment_date)]
+    stmt = select(*period, *by, *_sql_counters()).where(
+        a.status == "completed", a.appointment_date.isnot(None), *criteria
+    )
+    if by:
+        stmt = stmt.outerjoin(models.Patient, models.Patient.id == a.patient_id)
+    return db.execute(stmt.group_by(*period, *by)).all()
+
+
+def _add(db: Session, hc_zone, clinic, month, delta):
+    delta = {k: v for k, v in delta.items() if v}
+    if not delta:
+        return
+    table = models.KPISummary.__table__
+    now = datetime.utcnow()
+    key = and_(table.c.hc_zone == (hc_zone or ""), table.c.clinic == (clinic or ""), table.c.month == month)
+    values = {k: table.c[k] + v for k, v in delta.items()}
+    if db.execute(update(table).where(key).values(**values, updated_at=now)).rowcount:
+        if delta.get("completed", 0) < 0:
+            # Every counter counts completed appointments, so the bucket may be empty now
+            db.execute(delete(table).where(key, table.c.completed <= 0))
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(table).values(
+                hc_zone=hc_zone or "", clinic=clinic or "", month=month, updated_at=now,
+                **{c: delta.get(c, 0) for c in COUNTERS}
+            ))
+    except IntegrityError:
+        # Another request created the row first
+        db.execute(update(table).where(key).values(**values, updated_at=now))
+
+
+# --- Incremental updates (call before the commit of the change) ---
+def record_visit(db: Session, hc_zone, clinic, appointment_date, before, after):
+    """Account for one appointment going from `before` to `after` (dicts of FIELDS)."""
+    if appointment_date is None:
+        return
+    old, new = counts(before), counts(after)
+    _add(db, hc_zone, clinic, appointment_date.replace(day=1), {c: new[c] - old[c] for c in COUNTERS})
+
+
+def move_patient(db: Session, patient_id, old_zone, old_clinic, new_zone, new_clinic):
+    """Move a patient's completed appointments to their new zone/clinic bucket (None, None on delete)."""
+    if (old_zone or "", old_clinic or "") == (new_zone or "", new_clinic or ""):
+        return
+    for year, month, *values in _monthly(db, models.Appointment.patient_id == patient_id):
+        month = date(int(year), int(month), 1)
+        delta = {c: int(v or 0) for c, v in zip(COUNTERS, values)}
+        _add(db, old_zone, old_clinic, month, {c: -v for c, v in delta.items()})
+        _add(db, new_zone, new_clinic, month, delta)
+
+
+# --- Full rebuild ---
+def rebuild(db: Session):
+    """Recompute kpi_summary from appointments, in one transaction. Returns the number of rows."""
+    by = [func.coalesce(models.Patient.hc_zone, ""), func.coalesce(models.Patient.clinic, "")]
+    rows = _monthly(db, by=by)
+    now = datetime.utcnow()
+    table = models.KPISummary.__table__
+    db.execute(delete(table))
+    if rows:
+        db.execute(insert(table), [
+            {"hc_zone": zone, "clinic": clinic, "month": date(int(year), int(month), 1), "updated_at": now,
+             **dict(zip(COUNTERS, (int(v or 0) for v in values)))}
+            for year, month, zone, clinic, *values in rows
+        ])
+    versions = models.DataVersion.__table__
+    if not db.execute(update(versions).where(versions.c.key == BUILT_KEY).values(version=versions.c.version + 1, updated_at=now)).rowcount:
+        db.execute(insert(versions).values(key=BUILT_KEY, version=1, updated_at=now))
+    # /dashboard/kpi validates against the appointments versions; new figures need new ETags
+    http_cache.touch_all(db, "appointments")
+    db.commit()
+    return len(rows)
+
+
+def ensure_built(db: Session):
+    # First start with this table: fill it from the existing appointments
+    if db.query(models.DataVersion.key).filter(models.DataVersion.key == BUILT_KEY).first() is None:
+        logger.info("Built %s: %s rows", models.KPISummary.__tablename__, rebuild(db))
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    with SessionLocal() as _db:
+        print(f"{models.KPISummary.__tablename__}: {rebuild(_db)} rows")
@@ -0,0 +1,196 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Logging for the backend: modules log through logging.getLogger(__name__) instead of print().
+#
+# setup() (called by main.py before anything else is imported) puts a QueueHandler on the
+# root logger: the request thread only resolves the message and drops the record on a queue,
+# a QueueListener thread formats it and writes it to stdout (or LOG_FILE). A full queue drops
+# records instead of blocking the request. Each line is one JSON object, so lines from
+# several workers don't interleave and can be filtered by field; LOG_FORMAT=text for reading
+# in a console.
+#
+# RequestLogMiddleware gives every request an id (X-Request-ID, taken from the client or
+# generated) and writes one access line with route, status and duration. Records logged
+# while a request is handled carry its request_id, user and zone.
+#
+# Levels: LOG_LEVEL for everything, LOG_LEVELS to override single loggers, e.g.
+# "backend.main=DEBUG,backend.access=WARNING". Debug calls use %-style arguments, so below
+# the level they cost a level check and nothing else.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json or text
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+ACCESS_LOG = os.getenv("ACCESS_LOG", "1").lower() in ("1", "true", "yes")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+access_logger = logging.getLogger("backend.access")
+
+# Fields of the request being handled (request_id, user, zone); a dict shared with the
+# threadpool copies of the context, so bind() from a sync dependency shows up in the
+# access line too
+_context = ContextVar("log_context", default=None)
+
+# LogRecord attributes that aren't extra= fields
+_RECORD_FIELDS = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+
+
+def bind(**fields):
+    """Add fields to the current request's log context (no-op outside a request)."""
+    context = _context.get()
+    if context is not None:
+        context.update({k: v for k, v in fields.items() if v is not None})
+
+
+def _extra_fields(record):
+    return {k: v for k, v in record.__dict__.items() if k not in _RECORD_FIELDS and not k.startswith("_")}
+
+
+# --- Formatting (listener thread) ---
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+# --- Queue (request thread) ---
+class QueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def prepare(self, record):
+        # Resolve what can't be done later on another thread: the message arguments (may be
+        # ORM objects), the traceback and the request context
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        context = _context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            QueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def setup():
+    """Route all logging through the queue; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    if LOG_FILE:
+        output = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    elif sys.stdout is not None:
+        output = logging.StreamHandler(sys.stdout)
+    else:
+        # Windowed exe without a console
+        output = logging.NullHandler()
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JSONFormatter())
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    for item in LOG_LEVELS.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    # Write out what is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# --- Requests ---
+def _request_id(scope):
+    # Keep a proxy's id so lines can be matched across services, within reason
+    value = Headers(scope=scope).get(REQUEST_ID_HEADER, "")
+    if value and len(value) <= 64 and value.isprintable():
+        return value
+    return uuid.uuid4().hex[:16]
+
+
+class RequestLogMiddleware:
+    def __init__(self, app, access_log=ACCESS_LOG):
+        self.app = app
+        self.access_log = access_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        token = _context.set({"request_id": request_id})
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if self.access_log and access_logger.isEnabledFor(logging.INFO):
+                route = getattr(scope.get("route"), "path", None)
+                access_logger.info("%s %s %s", scope["method"], scope.get("path", ""), status_code, extra={
+                    "method": scope["method"], "route": route, "status": status_code,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                })
+            _context.reset(token)
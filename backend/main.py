@@ -1,13 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session, joinedload
 from datetime import timedelta, datetime, date
 from typing import List, Optional
-from pydantic import BaseModel, ConfigDict
-import pandas as pd
-import io
+import logging
 import os
 import sys
 from dotenv import load_dotenv
@@ -15,10 +14,32 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-from . import models, database
-from .user_auth import create_access_token, get_current_user, authenticate_user, get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES, Token
+# Before the other modules, so what they log at import time goes through the queue too
+from . import logs
+logs.setup()
+logger = logging.getLogger(__name__)
+
+from . import models, database, patient_import, jobs, zones, migrations, queries, sync, events, user_auth, serializers, http_cache, compression, static_files, kpi, search, metrics
+from .schemas import (
+    UserCreateData, UserUpdateData, UserResponse,
+    PatientCreate, PatientResponse, PatientPage, PatientSearch,
+    AppointmentCreate, AppointmentBatchCreate, AppointmentBatchResult, AppointmentResponse, AppointmentUpdate, AppointmentCalendar, KPIReport, VitalsTimeline, VisitUpdate, VisitBatch, VisitBatchResult, ReferBack,
+    HomeOPDCreate, HomeOPDResponse, HomeOPDPage, LoginRequest,
+    SyncResponse, SyncPush, SyncPushResult,
+    ZoneMappingData, ZoneMappingResponse,
+)
+from .user_auth import create_access_token, get_current_user, authenticate_user, get_password_hash, invalidate_user, ACCESS_TOKEN_EXPIRE_MINUTES, Token
 
 models.Base.metadata.create_all(bind=database.engine)
+migrations.upgrade_schema(database.engine, models.Base.metadata)
+# FTS5 / pg_trgm index for /patients/search
+search.ensure_index(database.engine)
+
+# Seed the tumbol/moo -> zone table from the bundled CSV on first run
+with database.SessionLocal() as _db:
+    zones.ensure_seeded(_db)
+    sync.ensure_counter(_db)
+    kpi.ensure_built(_db)
 
 app = FastAPI()
 
@@ -33,106 +54,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[queries.NEXT_CURSOR_HEADER],
 )
 
-# --- Pydantic Schemas ---
-class UserBase(BaseModel):
-    username: str
-    role: str
-    location_name: Optional[str] = None
-
-class UserCreateData(BaseModel):
-    username: str
-    password: str
-    name: str 
-    position: str
-    role: str
-    location_name: Optional[str] = None
-
-class UserUpdateData(BaseModel):
-    password: Optional[str] = None
-    name: Optional[str] = None
-    position: Optional[str] = None
-    role: Optional[str] = None
-    location_name: Optional[str] = None
-
-class UserResponse(UserBase):
-    id: int
-    name: Optional[str] = None
-    position: Optional[str] = None
-    plain_password: Optional[str] = None
-    model_config = ConfigDict(from_attributes=True)
-
-class PatientCreate(BaseModel):
-    hn: str
-    name: str
-    cid: str
-    phone: Optional[str] = None
-    medical_rights: Optional[str] = None
-    clinic: Optional[str] = None
-    house_no: Optional[str] = None
-    moo: Optional[str] = None
-    tumbol: Optional[str] = None
-    amphoe: Optional[str] = None
-    province: Optional[str] = None
-    hc_zone: Optional[str] = None
-
-class PatientResponse(PatientCreate):
-    id: int
-    model_config = ConfigDict(from_attributes=True)
-
-class AppointmentCreate(BaseModel):
-    patient_id: int
-    appointment_date: str # YYYY-MM-DD
-    note: Optional[str] = None
-    req_bp: bool = False
-    req_bs: bool = False
-
-class AppointmentResponse(BaseModel):
-    id: int
-    patient_id: int
-    appointment_date: date
-    note: Optional[str]
-    status: str
-    bp_sys: Optional[int]
-    bp_dia: Optional[int]
-    bp_sys_2: Optional[int]
-    bp_dia_2: Optional[int]
-    blood_sugar: Optional[int]
-    refer_back_note: Optional[str]
-    patient: PatientResponse
-    req_bp: bool = False
-    req_bs: bool = False
-
-    model_config = ConfigDict(from_attributes=True)
-
-class VisitUpdate(BaseModel):
-    bp_sys: Optional[int] = None
-    bp_dia: Optional[int] = None
-    bp_sys_2: Optional[int] = None
-    bp_dia_2: Optional[int] = None
-    blood_sugar: Optional[int] = None
-
-class ReferBack(BaseModel):
-    note: str
-
-class HomeOPDCreate(BaseModel):
-    patient_id: Optional[int] = None
-    cid: Optional[str] = None
-    name: Optional[str] = None
-    type: str # patient, osm
-    note: Optional[str] = None
-    source: Optional[str] = None # Optional from frontend, can be inferred
-
-class HomeOPDResponse(HomeOPDCreate):
-    id: int
-    created_at: Optional[str]
-    source: str
-    model_config = ConfigDict(from_attributes=True)
-
-class LoginRequest(BaseModel):
-    username: str
-    password: str
+# gzip/brotli for API responses above COMPRESS_MIN_SIZE (static files are precompressed, see below)
+app.add_middleware(compression.CompressionMiddleware)
+
+# Latency / status / SQL query counts per route for GET /metrics
+if metrics.METRICS_ENABLED:
+    metrics.install_sql_hooks()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Request id + access log; outermost, so everything logged while handling a request carries its id
+app.add_middleware(logs.RequestLogMiddleware)
 
 # --- Dependency ---
 def get_db():
@@ -155,7 +89,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username, "role": user.role, "loc": user.location_name or ""},
+        data={"sub": user.username, "role": user.role, "loc": user.location_name or "", "ver": user.token_version or 0},
         expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer", "user": {"username": user.username, "role": user.role, "location": user.location_name}}
@@ -203,6 +137,11 @@ def update_user_endpoint(id: int, user: UserUpdateData, current_user: models.Use
     if not db_user:
          raise HTTPException(status_code=404, detail="User not found")
 
+    # Role, zone or password changes revoke the tokens already issued to this user
+    revoke = (user.role is not None and user.role != db_user.role) or \
+             (user.location_name is not None and user.location_name != db_user.location_name) or \
+             bool(user.password)
+
     if user.name is not None: db_user.name = user.name
     if user.position is not None: db_user.position = user.position
     if user.role is not None: db_user.role = user.role
@@ -210,9 +149,12 @@ def update_user_endpoint(id: int, user: UserUpdateData, current_user: models.Use
     if user.password:
         db_user.password_hash = get_password_hash(user.password)
         db_user.plain_password = user.password
+    if revoke:
+        db_user.token_version = (db_user.token_version or 0) + 1
 
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.username)
     return db_user
 
 @app.delete("/users/{id}")
@@ -229,16 +171,129 @@ def delete_user_endpoint(id: int, current_user: models.User = Depends(get_curren
          
     db.delete(db_user)
     db.commit()
+    invalidate_user(db_user.username)
     return {"message": "User deleted"}
 
+@app.get("/admin/db-pool")
+def get_db_pool_status(current_user: models.User = Depends(get_current_user)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return database.get_pool_status()
+
+@app.get("/metrics")
+def get_metrics(request: Request):
+    # Scraped by Prometheus, so no user login: a bearer METRICS_TOKEN, or loopback only without one
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics.authorized(request):
+        if not metrics.METRICS_TOKEN:
+            raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to read /metrics from another host")
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(database.get_pool_status()), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # --- Patient Endpoints ---
 @app.get("/patients", response_model=List[PatientResponse])
-def get_patients(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if current_user.role in ['hospital', 'admin']:
-        return db.query(models.Patient).all()
+def get_patients(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    hn: Optional[str] = None,
+    cid: Optional[str] = None,
+    name: Optional[str] = None,
+    clinic: Optional[str] = None,
+    hc_zone: Optional[str] = None,
+    exact: bool = False,
+    compact: bool = False,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # One page of the register (PATIENT_PAGE_SIZE by default); when there is more, the
+    # X-Next-Cursor header has the ?cursor= for the next one. /patients/page returns the
+    # same page wrapped with next_cursor and total.
+    if limit is None:
+        limit = queries.PATIENT_PAGE_SIZE
+    if limit < 1 or limit > queries.PATIENT_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {queries.PATIENT_PAGE_SIZE_MAX}")
+
+    cache = http_cache.check(request, db, "patients", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+
+    if compact:
+        # Same JSON, built from column tuples (see serializers.py)
+        query = queries.filter_patients(db.query(*serializers.PATIENT_COLUMNS), current_user, hn=hn, cid=cid, name=name, clinic=clinic, hc_zone=hc_zone, exact=exact)
+        rows, next_cursor = queries.split_page(queries.patients_after(query, cursor, limit).all(), limit)
+        response = serializers.FastJSONResponse(serializers.patient_rows(rows))
     else:
-        # HC can only see their zone
-        return db.query(models.Patient).filter(models.Patient.hc_zone == current_user.location_name).all()
+        query = queries.filter_patients(db.query(models.Patient), current_user, hn=hn, cid=cid, name=name, clinic=clinic, hc_zone=hc_zone, exact=exact)
+        rows, next_cursor = queries.split_page(queries.patients_after(query, cursor, limit).all(), limit)
+
+    cache.apply(response)
+    if next_cursor is not None:
+        response.headers[queries.NEXT_CURSOR_HEADER] = str(next_cursor)
+    return response if compact else rows
+
+@app.get("/patients/page", response_model=PatientPage)
+def get_patients_page(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    hn: Optional[str] = None,
+    cid: Optional[str] = None,
+    name: Optional[str] = None,
+    clinic: Optional[str] = None,
+    hc_zone: Optional[str] = None,
+    exact: bool = False,
+    include_total: bool = True,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if limit is None:
+        limit = queries.PATIENT_PAGE_SIZE
+    if limit < 1 or limit > queries.PATIENT_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {queries.PATIENT_PAGE_SIZE_MAX}")
+
+    cache = http_cache.check(request, db, "patients", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    query = queries.filter_patients(db.query(models.Patient), current_user, hn=hn, cid=cid, name=name, clinic=clinic, hc_zone=hc_zone, exact=exact)
+
+    total = None
+    if include_total:
+        # Count without the ORDER BY / LIMIT; clients can turn this off after the first page
+        total = query.order_by(None).count()
+
+    rows, next_cursor = queries.split_page(queries.patients_after(query, cursor, limit).all(), limit)
+    return {"items": rows, "next_cursor": next_cursor, "total": total}
+
+@app.get("/patients/search", response_model=PatientSearch)
+def search_patients(
+    request: Request,
+    response: Response,
+    q: str,
+    limit: Optional[int] = None,
+    hc_zone: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Typeahead: part of a name / HN / CID / phone, typos allowed (see search.py)
+    if limit is None:
+        limit = search.SEARCH_LIMIT
+    if limit < 1 or limit > search.SEARCH_LIMIT_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {search.SEARCH_LIMIT_MAX}")
+    if not q.strip():
+        return {"query": q, "results": []}
+
+    cache = http_cache.check(request, db, "patients", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    return {"query": q, "results": search.search_patients(db, current_user, q, limit, hc_zone=hc_zone)}
 
 @app.post("/patients", response_model=PatientResponse)
 def create_patient(patient: PatientCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -252,6 +307,10 @@ def create_patient(patient: PatientCreate, current_user: models.User = Depends(g
             # raise HTTPException(status_code=400, detail="Cannot create patient outside your zone")
             # Option B: Force overwrite
             patient.hc_zone = current_user.location_name
+
+    # No zone given: route by address
+    if not patient.hc_zone and patient.tumbol:
+        patient.hc_zone = zones.resolve_zone(db, patient.tumbol, patient.moo)
     
     # Check existing HN
     existing = db.query(models.Patient).filter(models.Patient.hn == patient.hn).first()
@@ -278,6 +337,7 @@ def create_patient(patient: PatientCreate, current_user: models.User = Depends(g
         hc_zone=patient.hc_zone
     )
     db.add(new_patient)
+    http_cache.touch(db, "patients", [new_patient.hc_zone])
     db.commit()
     db.refresh(new_patient)
     return new_patient
@@ -291,10 +351,48 @@ def delete_patient(id: int, current_user: models.User = Depends(get_current_user
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
         
+    http_cache.touch_patient_zones(db, patient.hc_zone)
+    # Its appointments stay, without a patient
+    kpi.move_patient(db, patient.id, patient.hc_zone, patient.clinic, None, None)
     db.delete(patient)
     db.commit()
     return {"message": "Deleted successfully"}
 
+@app.get("/patients/{id}/vitals", response_model=VitalsTimeline)
+def get_patient_vitals(
+    id: int,
+    request: Request,
+    response: Response,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    max_points: Optional[int] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # BP / blood sugar trend of one patient as parallel arrays, straight from the
+    # (patient_id, appointment_date) index instead of whole appointments with nested patients
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format YYYY-MM-DD")
+    if max_points is not None and (max_points < 1 or max_points > queries.VITALS_MAX_POINTS_MAX):
+        raise HTTPException(status_code=400, detail=f"max_points must be between 1 and {queries.VITALS_MAX_POINTS_MAX}")
+
+    hc_zone = db.query(models.Patient.hc_zone).filter(models.Patient.id == id).first()
+    if hc_zone is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    if current_user.role == 'hc' and hc_zone[0] != current_user.location_name:
+        raise HTTPException(status_code=403, detail="Not in your zone")
+
+    cache = http_cache.check(request, db, "appointments", current_user, hc_zone[0])
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    rows = db.execute(queries.patient_vitals(id, start, end)).all()
+    return {"patient_id": id, "start_date": start, "end_date": end, **serializers.vitals_series(rows, max_points)}
+
 @app.put("/patients/{id}")
 def update_patient(id: int, patient: PatientCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user.role not in ['hospital', 'admin']:
@@ -309,6 +407,8 @@ def update_patient(id: int, patient: PatientCreate, current_user: models.User =
         exists = db.query(models.Patient).filter(models.Patient.hn == patient.hn).first()
         if exists:
             raise HTTPException(status_code=400, detail="HN already exists")
+
+    kpi.move_patient(db, db_patient.id, db_patient.hc_zone, db_patient.clinic, patient.hc_zone, patient.clinic)
             
     # Update fields
     db_patient.hn = patient.hn
@@ -322,6 +422,7 @@ def update_patient(id: int, patient: PatientCreate, current_user: models.User =
     db_patient.tumbol = patient.tumbol
     db_patient.amphoe = patient.amphoe
     db_patient.province = patient.province
+    http_cache.touch_patient_zones(db, db_patient.hc_zone, patient.hc_zone)
     db_patient.hc_zone = patient.hc_zone
     
     db.commit()
@@ -329,103 +430,109 @@ def update_patient(id: int, patient: PatientCreate, current_user: models.User =
     return db_patient
 
 
-def get_hc_zone(tumbol, moo):
-    t = str(tumbol).strip()
-    m = str(moo).strip().split('.')[0] # Handle float strings like "1.0"
-    
-    if t == 'ปวนพุ':
-        if m in ['6', '7', '9', '12', '15']:
-            return 'รพ.สต.บ้านหนองหมากแก้ว'
-        else:
-             return 'รพ.สต.บ้านปวนพุ'
-    
-    elif t == 'หนองหิน':
-        if m == '2':
-            return 'รพ.หนองหิน'
-        elif m in ['8', '9', '10', '11', '12', '14']:
-             return 'รพ.สต.หลักร้อยหกสิบ'
-        else:
-             return 'สถานีอนามัยเฉลิมพระเกียรติ'
-             
-    elif t == 'ตาดข่า':
-        return 'รพ.สต.บ้านน้อยสามัคคี'
-        
-    else:
-        return 'รพ.หนองหิน'
-
 @app.post("/patients/upload")
-async def upload_patients(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def upload_patients(stream: bool = False, background: bool = False, file: UploadFile = File(...), current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user.role not in ['hospital', 'admin']:
         raise HTTPException(status_code=403, detail="Only hospital/admin can upload")
-    
-    contents = await file.read()
-    try:
-        df = pd.read_excel(io.BytesIO(contents))
-    except:
-        raise HTTPException(status_code=400, detail="Invalid Excel file")
 
-    count = 0
+    if background:
+        # Return straight away, a job worker does the streaming import; poll /jobs/{job_id}
+        path = await patient_import.spool_upload(file, directory=jobs.job_dir())
+        job_id = await run_in_threadpool(jobs.submit_import, path, file.filename, current_user.username)
+        return JSONResponse(status_code=202, content={"message": "Upload queued", "job_id": job_id, "status": "queued"})
+
+    if stream:
+        # Bounded-memory mode: spool to disk, read and commit in fixed-size batches
+        path = await patient_import.spool_upload(file)
+        try:
+            result = await run_in_threadpool(patient_import.import_file, db, path)
+        except ValueError as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            db.rollback()
+            logger.exception("Patient upload failed: %s", file.filename)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            os.remove(path)
+        return {"message": f"Uploaded {result['inserted']} patients", **result}
+
+    contents = await file.read()
     try:
-        # Helper to find value from multiple possible column names
-        def get_val(row, keys):
-            for k in keys:
-                if k in row and not pd.isna(row[k]):
-                    return str(row[k]).strip()
-            return ""
-
-        processed_hns = set()
-        processed_cids = set()
-
-        for _, row in df.iterrows():
-            # HN
-            hn = get_val(row, ['HN', 'hn', 'Hn'])
-            if not hn:
-                continue
-            if hn in processed_hns or db.query(models.Patient).filter(models.Patient.hn == hn).first():
-                continue
-            
-            # CID
-            cid = get_val(row, ['CID', 'cid', 'เลขบัตรประชาชน', 'เลขบัตร'])
-            if not cid:
-                continue
-            if cid in processed_cids or db.query(models.Patient).filter(models.Patient.cid == cid).first():
-                continue
-            
-            # Mark as processed to handle duplicates within the same file
-            processed_hns.add(hn)
-            processed_cids.add(cid)
-            
-            # Determine Zone
-            zone = get_val(row, ['Zone', 'zone', 'เขตพื้นที่', 'รพ.สต.'])
-            if not zone or zone.lower() == 'nan':
-                 tumbol = get_val(row, ['Tumbol', 'tumbol', 'ตำบล'])
-                 moo = get_val(row, ['Moo', 'moo', 'หมู่'])
-                 zone = get_hc_zone(tumbol, moo)
-
-            p = models.Patient(
-                hn=hn,
-                name=get_val(row, ['Name', 'name', 'ชื่อ', 'ชื่อ-นามสกุล', 'ชื่อ - นามสกุล', 'ชื่อสกุล']),
-                cid=cid,
-                phone=get_val(row, ['Phone', 'phone', 'เบอร์โทร', 'เบอร์โทรศัพท์']),
-                medical_rights=get_val(row, ['Rights', 'rights', 'สิทธิ', 'สิทธิการรักษา']),
-                clinic=get_val(row, ['Clinic', 'clinic', 'คลินิก', 'รหัสคลินิก']),
-                house_no=get_val(row, ['HouseNo', 'house_no', 'บ้านเลขที่']),
-                moo=get_val(row, ['Moo', 'moo', 'หมู่']),
-                tumbol=get_val(row, ['Tumbol', 'tumbol', 'ตำบล']),
-                amphoe=get_val(row, ['Amphoe', 'amphoe', 'อำเภอ']),
-                province=get_val(row, ['Province', 'province', 'จังหวัด']),
-                hc_zone=zone
-            )
-            db.add(p)
-            count += 1
-        
-        db.commit()
-        return {"message": f"Uploaded {count} patients"}
+        # pandas + ORM work is blocking, run it in the threadpool instead of on the event loop
+        result = await run_in_threadpool(patient_import.import_upload, db, contents, file.filename)
+        # Same shape as ?stream=true: exact counts, report capped at IMPORT_REPORT_LIMIT rows
+        return {"message": f"Uploaded {result['inserted']} patients", **result}
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        db.rollback()
+        logger.exception("Patient upload failed: %s", file.filename)
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Zone Mapping Endpoints ---
+@app.get("/zones/mappings", response_model=List[ZoneMappingResponse])
+def get_zone_mappings(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.role not in ['hospital', 'admin']:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return db.query(models.ZoneMapping).order_by(models.ZoneMapping.tumbol, models.ZoneMapping.moo).all()
+
+@app.get("/zones/resolve")
+def resolve_zone_endpoint(tumbol: str, moo: Optional[str] = None, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return {"tumbol": tumbol, "moo": moo, "hc_zone": zones.resolve_zone(db, tumbol, moo)}
+
+@app.put("/zones/mappings", response_model=ZoneMappingResponse)
+def upsert_zone_mapping(item: ZoneMappingData, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    if not zones.normalize_tumbol(item.tumbol) or not item.hc_zone.strip():
+        raise HTTPException(status_code=400, detail="tumbol and hc_zone are required")
+    return zones.upsert_mapping(db, item.tumbol, item.moo, item.hc_zone.strip())
+
+@app.delete("/zones/mappings/{id}")
+def delete_zone_mapping(id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    row = db.query(models.ZoneMapping).filter(models.ZoneMapping.id == id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Mapping not found")
+    zones.delete_mapping(db, row)
+    return {"message": "Deleted successfully"}
+
+@app.post("/zones/mappings/reload-csv")
+def reload_zone_mappings(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Replace the table with the contents of the ฐานข้อมูลตำบล CSV
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    try:
+        count = zones.load_mappings(db, zones.read_csv_mappings())
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read zone CSV: {e}")
+    return {"message": f"Loaded {count} mappings"}
+
+# --- Import Job Endpoints ---
+@app.on_event("startup")
+def resume_import_jobs():
+    jobs.resume_pending_jobs()
+
+@app.get("/jobs")
+def get_jobs(limit: int = 20, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.role not in ['hospital', 'admin']:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    items = db.query(models.ImportJob).order_by(models.ImportJob.created_at.desc()).limit(min(limit, 100)).all()
+    return [jobs.job_to_dict(j) for j in items]
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.role not in ['hospital', 'admin']:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    job = db.query(models.ImportJob).filter(models.ImportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # The row report is only sent once the job is done
+    return jobs.job_to_dict(job, with_report=job.status in ['completed', 'failed'])
+
 # --- Appointment Endpoints ---
 @app.post("/appointments", response_model=AppointmentResponse)
 def create_appointment(appt: AppointmentCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -447,33 +554,259 @@ def create_appointment(appt: AppointmentCreate, current_user: models.User = Depe
         req_bs=appt.req_bs
     )
     db.add(new_appt)
+    http_cache.touch(db, "appointments", [db.query(models.Patient.hc_zone).filter(models.Patient.id == appt.patient_id).scalar()])
     db.commit()
     db.refresh(new_appt)
 
     # Re-query with joinedload to get patient data
     result = db.query(models.Appointment).options(joinedload(models.Appointment.patient)).filter(models.Appointment.id == new_appt.id).first()
+    events.publish_appointment("appointment.created", result)
     return result
 
+@app.post("/appointments/batch", response_model=AppointmentBatchResult)
+def create_appointments_batch(batch: AppointmentBatchCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Book the same date for a whole cohort in one transaction: one query to resolve the
+    # patients, one for existing bookings, one bulk INSERT
+    if current_user.role not in ['hospital', 'admin']:
+        raise HTTPException(status_code=403, detail="Only hospital/admin can create appointments")
+
+    try:
+        date_obj = datetime.strptime(batch.appointment_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format YYYY-MM-DD")
+
+    not_found = []
+    if batch.patient_ids is not None:
+        requested = list(dict.fromkeys(batch.patient_ids))
+        if len(requested) > queries.APPOINTMENT_BATCH_MAX:
+            raise HTTPException(status_code=400, detail=f"At most {queries.APPOINTMENT_BATCH_MAX} patients per batch")
+        zone_of = dict(db.query(models.Patient.id, models.Patient.hc_zone).filter(models.Patient.id.in_(requested)))
+        not_found = [pid for pid in requested if pid not in zone_of]
+        patient_ids = [pid for pid in requested if pid in zone_of]
+    elif batch.clinic or batch.hc_zone:
+        query = queries.filter_patients(db.query(models.Patient.id, models.Patient.hc_zone), current_user, clinic=batch.clinic, hc_zone=batch.hc_zone)
+        zone_of = dict(query.order_by(models.Patient.id).limit(queries.APPOINTMENT_BATCH_MAX + 1))
+        patient_ids = list(zone_of)
+        if len(patient_ids) > queries.APPOINTMENT_BATCH_MAX:
+            raise HTTPException(status_code=400, detail=f"Filter matches more than {queries.APPOINTMENT_BATCH_MAX} patients, narrow it down")
+    else:
+        raise HTTPException(status_code=400, detail="patient_ids or a clinic/hc_zone filter required")
+
+    already_scheduled = []
+    if batch.skip_existing and patient_ids:
+        booked = {pid for (pid,) in db.query(models.Appointment.patient_id).filter(
+            models.Appointment.appointment_date == date_obj,
+            models.Appointment.patient_id.in_(patient_ids)
+        )}
+        already_scheduled = [pid for pid in patient_ids if pid in booked]
+        patient_ids = [pid for pid in patient_ids if pid not in booked]
+
+    items = []
+    if patient_ids:
+        rows = [
+            {"patient_id": pid, "appointment_date": date_obj, "note": batch.note,
+             "status": "pending", "req_bp": batch.req_bp, "req_bs": batch.req_bs}
+            for pid in patient_ids
+        ]
+        stmt = insert(models.Appointment).returning(models.Appointment.id, models.Appointment.patient_id, sort_by_parameter_order=True)
+        items = [{"id": appt_id, "patient_id": pid} for appt_id, pid in db.execute(stmt, rows)]
+        http_cache.touch(db, "appointments", {zone_of[pid] for pid in patient_ids})
+        db.commit()
+
+        # One event per zone rather than one per appointment
+        by_zone = {}
+        for item in items:
+            by_zone.setdefault(zone_of[item["patient_id"]], []).append(item["id"])
+        for zone, appt_ids in by_zone.items():
+            events.publish("appointment.batch_created", hc_zone=zone, appointment_ids=appt_ids, appointment_date=str(date_obj), status="pending")
+
+    return {
+        "appointment_date": date_obj,
+        "created": len(items),
+        "items": items,
+        "already_scheduled": already_scheduled,
+        "not_found": not_found,
+    }
+
 @app.get("/appointments", response_model=List[AppointmentResponse])
 def get_appointments(
+    request: Request,
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    compact: bool = False,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Use joinedload to eager load the patient relationship
-    query = db.query(models.Appointment).options(joinedload(models.Appointment.patient)).join(models.Patient)
+    cache = http_cache.check(request, db, "appointments", current_user)
+    if cache.not_modified:
+        return cache.not_modified_response()
+
+    if compact:
+        # {"appointments": [... patient_id ...], "patients": [...]}, each patient once
+        query = queries.filter_appointments(
+            db.query(*serializers.APPOINTMENT_COLUMNS, *serializers.PATIENT_COLUMNS), current_user,
+            start_date=start_date, end_date=end_date, load_patient=False
+        )
+        return cache.apply(serializers.FastJSONResponse(serializers.appointment_rows(query.all())))
 
-    if start_date:
-        query = query.filter(models.Appointment.appointment_date >= start_date)
-    if end_date:
-        query = query.filter(models.Appointment.appointment_date <= end_date)
+    cache.apply(response)
+    query = queries.filter_appointments(db.query(models.Appointment), current_user, start_date=start_date, end_date=end_date)
+    return query.all()
 
-    if current_user.role == 'hc':
-        # Filter patients in HC zone
-        query = query.filter(models.Patient.hc_zone == current_user.location_name)
+@app.get("/appointments/calendar", response_model=AppointmentCalendar, response_model_exclude_none=True)
+def get_appointment_calendar(
+    request: Request,
+    response: Response,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    group_by: str = "status,hc_zone,req_bp,req_bs",
+    hc_zone: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Per-day counts for the dashboard month view, computed with GROUP BY instead of
+    # shipping every appointment. Defaults to the current month.
+    try:
+        today = date.today()
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else today.replace(day=1)
+        if end_date:
+            end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        else:
+            next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            end = next_month - timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format YYYY-MM-DD")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
+
+    dimensions = [d.strip() for d in group_by.split(",") if d.strip()]
+    unknown = [d for d in dimensions if d not in queries.CALENDAR_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {', '.join(unknown)}")
+
+    cache = http_cache.check(request, db, "appointments", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    rows = db.execute(queries.appointment_calendar(current_user, start, end, dimensions, hc_zone=hc_zone)).all()
+    buckets = []
+    for row in rows:
+        bucket = {"date": row[0], "count": row[-1]}
+        bucket.update(zip(dimensions, row[1:-1]))
+        buckets.append(bucket)
+    return {"start_date": start, "end_date": end, "group_by": dimensions, "total": sum(b["count"] for b in buckets), "buckets": buckets}
+
+def _kpi_bucket(values):
+    bucket = dict(values)
+    for counter in queries.KPI_COUNTERS:
+        bucket[counter] = int(bucket.get(counter) or 0)
+    bucket["bp_control_rate"] = round(bucket["bp_controlled"] / bucket["bp_measured"], 4) if bucket["bp_measured"] else None
+    bucket["bs_control_rate"] = round(bucket["bs_controlled"] / bucket["bs_measured"], 4) if bucket["bs_measured"] else None
+    return bucket
+
+@app.get("/dashboard/kpi", response_model=KPIReport, response_model_exclude_none=True)
+def get_kpi_summary(
+    request: Request,
+    response: Response,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    group_by: str = "hc_zone,clinic,month",
+    hc_zone: Optional[str] = None,
+    clinic: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # BP / blood sugar control rates from the kpi_summary counters (see kpi.py).
+    # Months are YYYY-MM; defaults to the last 12 months.
+    try:
+        today = date.today()
+        end = datetime.strptime(end_month, "%Y-%m").date() if end_month else today.replace(day=1)
+        if start_month:
+            start = datetime.strptime(start_month, "%Y-%m").date()
+        else:
+            start = end.replace(year=end.year - 1, month=end.month + 1) if end.month < 12 else end.replace(month=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format YYYY-MM")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_month is before start_month")
+
+    dimensions = [d.strip() for d in group_by.split(",") if d.strip()]
+    unknown = [d for d in dimensions if d not in queries.KPI_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by: {', '.join(unknown)}")
+
+    # The counters only change along with appointments (or patients, which bump appointments too)
+    cache = http_cache.check(request, db, "appointments", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    rows = db.execute(queries.kpi_summary(current_user, start, end, dimensions, hc_zone=hc_zone, clinic=clinic)).all()
+    buckets = [_kpi_bucket(zip(dimensions + list(queries.KPI_COUNTERS), row)) for row in rows]
+    total = _kpi_bucket({c: sum(b[c] for b in buckets) for c in queries.KPI_COUNTERS})
+    return {"start_month": start, "end_month": end, "group_by": dimensions, "total": total, "buckets": buckets}
+
+@app.post("/admin/kpi/rebuild")
+def rebuild_kpi(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Recompute kpi_summary from all appointments, e.g. after changing the KPI_* targets
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    return {"rows": kpi.rebuild(db)}
+
+@app.put("/appointments/visits", response_model=VisitBatchResult)
+def update_visits_batch(batch: VisitBatch, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Same effect as PUT /appointments/{id}/visit for many appointments: one query to load
+    # and zone-check them all, one bulk UPDATE. Setting values that are already saved is
+    # reported as "unchanged", so a client can resend the whole batch after a failure.
+    if len(batch.items) > queries.VISIT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {queries.VISIT_BATCH_MAX} results per batch")
+
+    ids = [item.id for item in batch.items]
+    rows = db.query(
+        models.Appointment.id, models.Appointment.patient_id, models.Appointment.status, models.Appointment.appointment_date,
+        models.Patient.hc_zone, models.Patient.clinic,
+        *[getattr(models.Appointment, f) for f in sync.VISIT_FIELDS]
+    ).join(models.Patient).filter(models.Appointment.id.in_(ids)).all()
+    current = {row.id: row for row in rows}
+
+    results = []
+    changes = []
+    seen = set()
+    for item in batch.items:
+        row = current.get(item.id)
+        if item.id in seen:
+            visit_status = "duplicate"
+        elif row is None:
+            visit_status = "not_found"
+        elif current_user.role == 'hc' and row.hc_zone != current_user.location_name:
+            visit_status = "forbidden"
+        else:
+            values = {f: getattr(item, f) for f in sync.VISIT_FIELDS}
+            if row.status == "completed" and all(getattr(row, f) == v for f, v in values.items()):
+                visit_status = "unchanged"
+            else:
+                visit_status = "updated"
+                changes.append({"id": item.id, "status": "completed", **values})
+        seen.add(item.id)
+        results.append({"id": item.id, "status": visit_status})
+
+    if changes:
+        # ORM bulk UPDATE by primary key (executemany)
+        db.execute(update(models.Appointment), changes)
+        for change in changes:
+            row = current[change["id"]]
+            kpi.record_visit(db, row.hc_zone, row.clinic, row.appointment_date, kpi.snapshot(row), change)
+        http_cache.touch(db, "appointments", {current[c["id"]].hc_zone for c in changes})
+        db.commit()
+        for change in changes:
+            row = current[change["id"]]
+            events.publish("appointment.completed", hc_zone=row.hc_zone, appointment_id=row.id, patient_id=row.patient_id, status="completed")
 
-    return query.all()
+    updated = sum(1 for r in results if r["status"] == "updated")
+    unchanged = sum(1 for r in results if r["status"] == "unchanged")
+    return {"updated": updated, "unchanged": unchanged, "failed": len(results) - updated - unchanged, "items": results}
 
 @app.delete("/appointments/{id}")
 def delete_appointment(id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -493,14 +826,14 @@ def delete_appointment(id: int, current_user: models.User = Depends(get_current_
     if appt.status == 'completed':
         raise HTTPException(status_code=400, detail="Cannot delete completed appointment")
 
+    hc_zone = appt.patient.hc_zone if appt.patient else None
+    patient_id = appt.patient_id
+    http_cache.touch(db, "appointments", [hc_zone])
     db.delete(appt)
     db.commit()
+    events.publish("appointment.deleted", hc_zone=hc_zone, appointment_id=id, patient_id=patient_id)
     return {"message": "Deleted successfully"}
 
-class AppointmentUpdate(BaseModel):
-    appointment_date: Optional[str] = None
-    note: Optional[str] = None
-
 @app.put("/appointments/{id}")
 def update_appointment(id: int, item: AppointmentUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if current_user.role not in ['hospital', 'admin']:
@@ -524,26 +857,28 @@ def update_appointment(id: int, item: AppointmentUpdate, current_user: models.Us
     if item.note is not None:
         appt.note = item.note
 
+    http_cache.touch(db, "appointments", [appt.patient.hc_zone if appt.patient else None])
     db.commit()
     db.refresh(appt)
+    events.publish_appointment("appointment.updated", appt)
     return appt
 
 @app.put("/appointments/{id}/visit")
 def update_visit(id: int, visit: VisitUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    print(f"DEBUG: update_visit called for id {id} with data {visit}")
+    logger.debug("update_visit %s: %s", id, visit)
     try:
         # Use joinedload to eager load the patient relationship
         appt = db.query(models.Appointment).options(joinedload(models.Appointment.patient)).filter(models.Appointment.id == id).first()
         if not appt:
-            print("DEBUG: Appointment not found")
             raise HTTPException(status_code=404, detail="Appointment not found")
 
         # Check permissions (HC own zone)
         if current_user.role == 'hc':
             if appt.patient.hc_zone != current_user.location_name:
-                 print(f"DEBUG: Zone mismatch. Appt zone: {appt.patient.hc_zone}, User loc: {current_user.location_name}")
+                 logger.debug("update_visit %s: appointment zone %s is not %s", id, appt.patient.hc_zone, current_user.location_name)
                  raise HTTPException(status_code=403, detail="Not in your zone")
 
+        before = kpi.snapshot(appt)
         appt.bp_sys = visit.bp_sys
         appt.bp_dia = visit.bp_dia
         appt.bp_sys_2 = visit.bp_sys_2
@@ -551,17 +886,22 @@ def update_visit(id: int, visit: VisitUpdate, current_user: models.User = Depend
         appt.blood_sugar = visit.blood_sugar
         appt.status = "completed"
 
+        patient = appt.patient
+        kpi.record_visit(db, patient.hc_zone if patient else None, patient.clinic if patient else None, appt.appointment_date, before, kpi.snapshot(appt))
+        http_cache.touch(db, "appointments", [appt.patient.hc_zone if appt.patient else None])
         db.commit()
         db.refresh(appt)
-        print("DEBUG: update_visit success")
+        events.publish_appointment("appointment.completed", appt)
         return appt
-    except Exception as e:
-        print(f"DEBUG: update_visit ERROR: {e}")
-        raise e
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("update_visit %s failed", id)
+        raise
 
 @app.put("/appointments/{id}/refer-back")
 def refer_back(id: int, ref: ReferBack, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    print(f"DEBUG: refer_back called for id {id} with data {ref}")
+    logger.debug("refer_back %s: %s", id, ref)
     try:
         # Use joinedload to eager load the patient relationship
         appt = db.query(models.Appointment).options(joinedload(models.Appointment.patient)).filter(models.Appointment.id == id).first()
@@ -572,15 +912,21 @@ def refer_back(id: int, ref: ReferBack, current_user: models.User = Depends(get_
             if appt.patient.hc_zone != current_user.location_name:
                  raise HTTPException(status_code=403, detail="Not in your zone")
 
+        before = kpi.snapshot(appt)
         appt.refer_back_note = ref.note
         appt.status = "referred_back"
+        patient = appt.patient
+        kpi.record_visit(db, patient.hc_zone if patient else None, patient.clinic if patient else None, appt.appointment_date, before, kpi.snapshot(appt))
+        http_cache.touch(db, "appointments", [appt.patient.hc_zone if appt.patient else None])
         db.commit()
         db.refresh(appt)
-        print("DEBUG: refer_back success")
+        events.publish_appointment("appointment.referred_back", appt)
         return appt
-    except Exception as e:
-        print(f"DEBUG: refer_back ERROR: {e}")
-        raise e
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("refer_back %s failed", id)
+        raise
 
 # --- Home OPD Endpoints ---
 @app.post("/home-opd", response_model=HomeOPDResponse)
@@ -599,41 +945,125 @@ def create_home_opd(item: HomeOPDCreate, current_user: models.User = Depends(get
         note=item.note,
         source=source,
         location=current_user.location_name, # Save creator's location
-        created_at=str(date.today())
+        created_at=date.today()
     )
     db.add(new_item)
+    patient_zone = db.query(models.Patient.hc_zone).filter(models.Patient.id == item.patient_id).scalar() if item.patient_id else None
+    http_cache.touch(db, "home_opd", [current_user.location_name, patient_zone])
     db.commit()
     db.refresh(new_item)
     return new_item
 
 @app.get("/home-opd", response_model=List[HomeOPDResponse])
-def get_home_opd(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    query = db.query(models.HomeOPD)
-    
-    if current_user.role == 'hc':
-        # Filter by zone (location) OR joined patient zone
-        # Since we save location now, we can trust it for manual entries too if created by HC.
-        # But for entries created by Hospital FOR this HC? Hospital might not set location?
-        # Let's rely on Patient zone if linked, otherwise location column.
-        
-        # Simple Logic: filtered by location match or patient.hc_zone match
-        # SQLAlchemy OR:
-        # filter(or_(models.HomeOPD.location == current_user.location_name, models.HomeOPD.patient.has(hc_zone=current_user.location_name)))
-        
-        # For simplicity, if we ensure Hospital sets location if known, or we just rely on what we have.
-        # If Hospital creates it, they might leave location null? 
-        # Requirement: "ค้นหาคนไข้จาก HN แล้วแสดงข้อมูลคนไข้ในเขตพื้นที่ตนเอง" -> This implies linking to patient.
-        # If manual CID, maybe Hospital intends it for specific zone? 
-        # Let's just filter by matching location if set, or patient zone.
-        
-        zones = [current_user.location_name]
-        query = query.join(models.Patient, isouter=True).filter(
-            (models.HomeOPD.location == current_user.location_name) | 
-            (models.Patient.hc_zone == current_user.location_name)
-        )
-        
+def get_home_opd(request: Request, response: Response, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    cache = http_cache.check(request, db, "home_opd", current_user)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    query = queries.filter_home_opd(db.query(models.HomeOPD), current_user)
     return query.all()
 
+@app.get("/home-opd/page", response_model=HomeOPDPage)
+def get_home_opd_page(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    type: Optional[str] = None,
+    source: Optional[str] = None,
+    hc_zone: Optional[str] = None,
+    include_total: bool = True,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if limit is None:
+        limit = queries.HOME_OPD_PAGE_SIZE
+    if limit < 1 or limit > queries.HOME_OPD_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {queries.HOME_OPD_PAGE_SIZE_MAX}")
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format YYYY-MM-DD")
+
+    cache = http_cache.check(request, db, "home_opd", current_user, hc_zone)
+    if cache.not_modified:
+        return cache.not_modified_response()
+    cache.apply(response)
+
+    query = queries.filter_home_opd(
+        db.query(*queries.HOME_OPD_COLUMNS), current_user,
+        start_date=start, end_date=end, type=type, source=source, hc_zone=hc_zone
+    )
+
+    total = query.order_by(None).count() if include_total else None
+
+    # Keyset pagination, newest entries first
+    if cursor is not None:
+        query = query.filter(models.HomeOPD.id < cursor)
+    rows = query.order_by(models.HomeOPD.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor, "total": total}
+
+# --- Live Events (SSE) ---
+@app.on_event("startup")
+def start_event_broker():
+    events.broker.start()
+
+@app.on_event("shutdown")
+def stop_event_broker():
+    events.broker.stop()
+
+@app.get("/events")
+async def stream_events(
+    request: Request,
+    hc_zone: Optional[str] = None,
+    access_token: Optional[str] = None,
+    token: Optional[str] = Depends(user_auth.oauth2_scheme_optional)
+):
+    # Server-sent events for appointment changes in the caller's zone (hospital/admin: all
+    # zones, or ?hc_zone=). Browsers: new EventSource("/events?access_token=...").
+    current_user = await run_in_threadpool(user_auth.get_user_for_token, token or access_token)
+    zone = current_user.location_name if current_user.role == 'hc' else hc_zone
+
+    last_event_id = request.headers.get("last-event-id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    return StreamingResponse(
+        events.stream(request, zone=zone, last_event_id=last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- Delta Sync (offline clients) ---
+@app.get("/sync", response_model=SyncResponse)
+def sync_pull(
+    since: Optional[int] = None,
+    hc_zone: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Rows changed in the caller's zone after the ?since= cursor; everything without it
+    return sync.changes_since(db, current_user, since=since, hc_zone=hc_zone)
+
+@app.post("/sync", response_model=SyncPushResult)
+def sync_push(push: SyncPush, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Writes queued while offline, applied in order with per-change status
+    results = sync.apply_changes(db, current_user, push.changes)
+    return {"cursor": sync.current_seq(db), "results": results}
+
+# --- Async Endpoints (ASYNC_DB=1) ---
+# Swaps in asyncio versions of /login, /patients (list, page, upload), /appointments and /home-opd
+if database.ASYNC_DB:
+    from . import async_routes
+    async_routes.install(app)
+
 # --- Static Files / SPA Serving ---
 # Serve specific static folders if they exist (e.g. assets)
 # We need to determine the path to frontend/dist. 
@@ -653,46 +1083,41 @@ else:
     base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     static_dir = os.path.join(base_path, "frontend", "dist")
 
-    static_dir = os.path.join(base_path, "frontend", "dist")
-
-# [NEW] prioritized config.js route
-@app.get("/config.js")
-async def serve_config():
-    # 1. Try external config (next to exe or in root)
-    if getattr(sys, 'frozen', False):
-        exe_dir = os.path.dirname(sys.executable)
-        external_config = os.path.join(exe_dir, "config.js")
-    else:
-        # Dev: project root (parent of backend)
-        root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        external_config = os.path.join(root_dir, "config.js")
-    
-    if os.path.exists(external_config):
-        print(f"Serving external config from: {external_config}")
-        return FileResponse(external_config)
-    
-    # 2. Fallback to bundled config
-    bundled = os.path.join(static_dir, "config.js")
-    if os.path.exists(bundled):
-        return FileResponse(bundled)
-    
-    return HTMLResponse("window.globalConfig = {};", status_code=200)
+# config.js next to the exe (or in the project root while developing) overrides the bundled one
+if getattr(sys, 'frozen', False):
+    external_config = os.path.join(os.path.dirname(sys.executable), "config.js")
+else:
+    external_config = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.js")
 
 if os.path.exists(static_dir):
-    print(f"Serving static files from: {static_dir}")
-    app.mount("/assets", StaticFiles(directory=os.path.join(static_dir, "assets")), name="assets")
-    
-    # Catch-all for SPA
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
-        # Check if file exists in root of dist (e.g. favicon.ico, logo.png)
-        file_path = os.path.join(static_dir, full_path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-             return FileResponse(file_path)
-             
-        # Otherwise return index.html for React Router
-        return FileResponse(os.path.join(static_dir, "index.html"))
+    logger.info("Serving static files from %s", static_dir)
+    # .gz/.br next to the text assets, served by Accept-Encoding (no-op if the build step already did it)
+    compression.precompress_safely(static_dir)
 else:
-    print(f"WARNING: Static directory not found at {static_dir}")
+    logger.warning("Static directory not found at %s", static_dir)
+if os.path.exists(external_config):
+    logger.info("Serving external config from %s", external_config)
 
+# Every file is looked up in memory, see static_files.py
+static_manifest = static_files.StaticManifest(static_dir, overrides={"config.js": external_config})
+static_manifest.build()
 
+@app.get("/config.js")
+async def serve_config(request: Request):
+    if static_manifest.get("config.js") is None:
+        return HTMLResponse("window.globalConfig = {};", status_code=200)
+    return static_manifest.response(request, "config.js")
+
+@app.post("/admin/static/reload")
+def reload_static(current_user: models.User = Depends(get_current_user)):
+    # After replacing frontend/dist (or config.js) without a restart
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    static_manifest.build()
+    return static_manifest.stats()
+
+# Catch-all for SPA: files from the manifest; page loads of any other path get index.html for
+# React Router, API clients a JSON 404
+@app.get("/{full_path:path}")
+async def serve_spa(full_path: str, request: Request):
+    return static_manifest.response(request, full_path)
@@ -0,0 +1,257 @@
+from contextvars import ContextVar
+import hmac
+import ipaddress
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Request and SQL metrics, exposed on GET /metrics in the Prometheus text format.
+#
+# MetricsMiddleware times every request and counts it per route template ("/patients/{id}",
+# not the actual path) and status; the SQLAlchemy hooks below count the queries each request
+# runs and the time spent in them. A request with many queries for a few rows is an N+1 loop
+# (per-row lookups): see http_request_db_queries, or the Server-Timing header in the browser's
+# network tab. Requests slower than SLOW_REQUEST_MS are logged with their query count.
+#
+# Everything is kept in memory per process: with several uvicorn workers each scrape sees
+# the worker that answered it.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+# If set, GET /metrics needs "Authorization: Bearer <METRICS_TOKEN>"; if not, only requests
+# from this machine (loopback) may read it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+UNMATCHED = "unmatched"  # Requests no route answered (404s before routing)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+
+
+class Registry:
+    """Counters, gauges and histograms keyed by (name, label values)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add(self, name, labels=(), value=1):
+        with self._lock:
+            key = (name, labels)
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        with self._lock:
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self, extra_gauges=()):
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {k: (list(h.counts), h.sum, h.buckets) for k, h in self.histograms.items()}
+        for key, value in extra_gauges:
+            gauges[key] = value
+
+        lines = []
+        for name, (kind, text) in sorted(self.help.items()):
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                lines += [f"{name}{_labels(labels)} {_number(v)}" for (n, labels), v in sorted(counters.items()) if n == name]
+            elif kind == "gauge":
+                lines += [f"{name}{_labels(labels)} {_number(v)}" for (n, labels), v in sorted(gauges.items()) if n == name]
+            else:
+                for (n, labels), (counts, total, buckets) in sorted(histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*buckets, "+Inf"), counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+registry = Registry()
+registry.describe("http_requests_total", "counter", "Requests answered, by route and status code.")
+registry.describe("http_request_duration_seconds", "histogram", "Request latency, by route.")
+registry.describe("http_requests_in_progress", "gauge", "Requests being handled right now.")
+registry.describe("http_request_db_queries", "histogram", "SQL statements per request, by route.")
+registry.describe("http_request_db_seconds", "histogram", "Time spent in SQL per request, by route.")
+registry.describe("http_slow_requests_total", "counter", "Requests slower than SLOW_REQUEST_MS, by route.")
+registry.describe("db_queries_total", "counter", "SQL statements run, including background jobs.")
+registry.describe("db_query_seconds_total", "counter", "Time spent in SQL, including background jobs.")
+registry.describe("db_pool_connections", "gauge", "Connection pool state (database.get_pool_status).")
+
+
+# --- SQL ---
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware; threadpool endpoints and run_sync() get a copy of the context, so
+# their queries land on the same RequestStats
+_current = ContextVar("request_stats", default=None)
+_START_KEY = "metrics_query_start"
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_START_KEY)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    registry.inc("db_queries_total")
+    registry.inc("db_query_seconds_total", value=elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _failed(exception_context):
+    # after_cursor_execute doesn't run for a failed statement
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(_START_KEY):
+        conn.info[_START_KEY].pop()
+
+
+def install_sql_hooks():
+    # On the Engine class, so the async engine (ASYNC_DB=1) and job workers are counted too
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+        event.listen(Engine, "handle_error", _failed)
+
+
+# --- Requests ---
+def route_template(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED
+
+
+class MetricsMiddleware:
+    def __init__(self, app, slow_request_ms=SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Time up to the first byte; shows next to the request in the browser dev tools
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", f'app;dur={(time.perf_counter() - start) * 1000:.1f}, '
+                                                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"')
+            await send(message)
+
+        registry.add("http_requests_in_progress", (("method", method),))
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            registry.add("http_requests_in_progress", (("method", method),), -1)
+            route = route_template(scope)
+            labels = (("method", method), ("route", route))
+            registry.inc("http_requests_total", labels + (("status", str(status_code)),))
+            registry.observe("http_request_duration_seconds", labels, elapsed, LATENCY_BUCKETS)
+            registry.observe("http_request_db_queries", labels, stats.queries, QUERY_BUCKETS)
+            registry.observe("http_request_db_seconds", labels, stats.db_seconds, LATENCY_BUCKETS)
+            if elapsed * 1000 >= self.slow_request_ms:
+                registry.inc("http_slow_requests_total", labels)
+                logger.warning("Slow request: %s %s %s %.0fms, %s queries in %.0fms", method, scope.get("path", ""),
+                               status_code, elapsed * 1000, stats.queries, stats.db_seconds * 1000, extra={
+                                   "route": route, "duration_ms": round(elapsed * 1000, 1),
+                                   "db_queries": stats.queries, "db_ms": round(stats.db_seconds * 1000, 1),
+                               })
+
+
+def render(pool_status=None):
+    extra = []
+    for name, value in (pool_status or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            extra.append((("db_pool_connections", (("state", name),)), value))
+    return registry.render(extra)
+
+
+def is_loopback(request):
+    try:
+        return request.client is not None and ipaddress.ip_address(request.client.host).is_loopback
+    except ValueError:
+        return False
+
+
+def authorized(request):
+    if not METRICS_TOKEN:
+        return is_loopback(request)
+    return hmac.compare_digest(request.headers.get("authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode())
@@ -0,0 +1,94 @@
+import logging
+
+from sqlalchemy import inspect, text, Date, DateTime, String
+
+logger = logging.getLogger(__name__)
+
+# Tiny forward-only schema upgrade for databases created by an older version.
+# create_all() only creates missing tables; this adds columns that were added to models
+# later, so existing ncd_app.db files / Supabase projects keep working without a rebuild.
+
+
+def _column_default_sql(column, dialect):
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ""
+    value = default.arg
+    if isinstance(value, bool):
+        return " DEFAULT " + ("TRUE" if value else "FALSE") if dialect.name == "postgresql" else f" DEFAULT {int(value)}"
+    if isinstance(value, (int, float)):
+        return f" DEFAULT {value}"
+    if isinstance(value, str):
+        return " DEFAULT '" + value.replace("'", "''") + "'"
+    return ""
+
+
+def add_missing_columns(engine, metadata):
+    added = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            have = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in have:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                sql = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}{_column_default_sql(column, engine.dialect)}'
+                conn.execute(text(sql))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes(engine, metadata):
+    # Indexes declared on tables that already existed are not created by create_all()
+    created = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        have = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in have:
+                index.create(bind=engine, checkfirst=True)
+                created.append(index.name)
+    return created
+
+
+def convert_date_columns(engine, metadata):
+    # Columns that used to be ISO date strings (home_opd.created_at) and are now Date/DateTime.
+    # SQLite stores dates as ISO text anyway, so only PostgreSQL needs the column retyped.
+    converted = []
+    if engine.dialect.name != "postgresql":
+        return converted
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            have = {c["name"]: c["type"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if not isinstance(column.type, (Date, DateTime)) or not isinstance(have.get(column.name), String):
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {col_type} "
+                    f"USING NULLIF(TRIM({column.name}), '')::{col_type}"
+                ))
+                converted.append(f"{table.name}.{column.name}")
+    return converted
+
+
+def upgrade_schema(engine, metadata):
+    added = add_missing_columns(engine, metadata)
+    for name in added:
+        logger.info("Schema upgrade: added column %s", name)
+    for name in convert_date_columns(engine, metadata):
+        logger.info("Schema upgrade: converted column %s to a date type", name)
+    for name in create_missing_indexes(engine, metadata):
+        logger.info("Schema upgrade: created index %s", name)
+    return added
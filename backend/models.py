@@ -1,7 +1,14 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, Float, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
+from datetime import datetime
 from .database import Base
 
+def _row_version(context):
+    # Sync change sequence (see sync.py): sync.PENDING until the transaction commits, then
+    # the same number for every row it wrote, also for bulk INSERT/UPDATE statements
+    from .sync import transaction_seq
+    return transaction_seq(context.connection)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -12,9 +19,14 @@ class User(Base):
     location_name = Column(String) # For HCs, this is their zone name
     name = Column(String) # Name-Surname
     position = Column(String) # Job Position
+    token_version = Column(Integer, default=0) # Bumped to revoke issued tokens (role/zone/password change)
 
 class Patient(Base):
     __tablename__ = "patients"
+    __table_args__ = (
+        # HC zone listing and keyset paging (WHERE hc_zone = ? AND id > ? ORDER BY id)
+        Index("ix_patients_hc_zone_id", "hc_zone", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     hn = Column(String, unique=True, index=True)
     name = Column(String)
@@ -34,11 +46,22 @@ class Patient(Base):
     created_at = Column(Date, nullable=True)
 
     hc_zone = Column(String) # Matches user.location_name
+
+    # Change tracking for /sync
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, default=_row_version, onupdate=_row_version, index=True)
     
     appointments = relationship("Appointment", back_populates="patient")
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Date range lookups; status and patient_id are in the index so the calendar
+        # counts and the join to patients don't need to touch the table rows
+        Index("ix_appointments_date_status_patient", "appointment_date", "status", "patient_id"),
+        # One patient's history in date order (GET /patients/{id}/vitals)
+        Index("ix_appointments_patient_date", "patient_id", "appointment_date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"))
     appointment_date = Column(Date)
@@ -59,12 +82,21 @@ class Appointment(Base):
     req_bp = Column(Boolean, default=False)
     req_bs = Column(Boolean, default=False)
 
+    # Change tracking for /sync
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, default=_row_version, onupdate=_row_version, index=True)
+
     patient = relationship("Patient", back_populates="appointments")
 
 class HomeOPD(Base):
     __tablename__ = "home_opd"
+    __table_args__ = (
+        Index("ix_home_opd_location_created_at", "location", "created_at"),
+        # Unique index instead of a column constraint so migrations can add it to existing tables
+        Index("ux_home_opd_client_id", "client_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=True) # Optional link
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=True, index=True) # Optional link
     
     cid = Column(String) # For non-linked or manual entry
     name = Column(String, nullable=True) # If not linked
@@ -74,4 +106,76 @@ class HomeOPD(Base):
     source = Column(String) # 'hospital', 'hc'
     location = Column(String, nullable=True) # Zone name for filtering
     
-    created_at = Column(String) # ISO date string
+    created_at = Column(Date) # Was an ISO date string, converted by migrations.convert_date_columns
+    client_id = Column(String, nullable=True) # Set by offline clients so a resent entry isn't saved twice
+
+    # Change tracking for /sync
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, default=_row_version, onupdate=_row_version, index=True)
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    id = Column(String, primary_key=True) # uuid hex, returned to the client
+    kind = Column(String, default="patient_upload")
+    status = Column(String, default="queued", index=True) # queued, running, completed, failed
+    filename = Column(String, nullable=True) # Original upload name
+    file_path = Column(String, nullable=True) # Spooled copy, removed when the job finishes
+    created_by = Column(String, nullable=True) # username
+    worker = Column(String, nullable=True) # host:pid running it, to spot jobs orphaned by a restart
+
+    rows_total = Column(Integer, nullable=True) # Estimate, may stay empty
+    rows_done = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    rejected = Column(Integer, default=0)
+
+    error = Column(Text, nullable=True)
+    report = Column(Text, nullable=True) # JSON list of skipped/rejected rows
+
+    created_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class ZoneMapping(Base):
+    __tablename__ = "zone_mappings"
+    __table_args__ = (UniqueConstraint("tumbol", "moo", name="uq_zone_mappings_tumbol_moo"),)
+    id = Column(Integer, primary_key=True, index=True)
+    tumbol = Column(String, nullable=False)
+    moo = Column(String, nullable=False, default="") # "" = any other moo in this tumbol
+    hc_zone = Column(String, nullable=False) # Matches user.location_name
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    key = Column(String, primary_key=True) # e.g. "zone_mappings"
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True) # Last bump, sent as Last-Modified
+
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+    # Deleted (or moved out of a zone) patients/appointments/home OPD entries, so /sync
+    # clients can drop their local copies
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String, nullable=False) # patients, appointments, home_opd
+    row_id = Column(Integer, nullable=False)
+    hc_zone = Column(String, nullable=True, index=True) # Zone that could see the row
+    location = Column(String, nullable=True) # home_opd.location, also visible there
+    row_version = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime, nullable=True)
+
+class KPISummary(Base):
+    __tablename__ = "kpi_summary"
+    # Dashboard control-rate counters per zone, clinic and month, kept up to date by
+    # kpi.record_visit() (see kpi.py) so the dashboard never scans appointments
+    __table_args__ = (UniqueConstraint("hc_zone", "clinic", "month", name="uq_kpi_summary_zone_clinic_month"),)
+    id = Column(Integer, primary_key=True, index=True)
+    hc_zone = Column(String, nullable=False, default="") # "" = patient without zone (or deleted)
+    clinic = Column(String, nullable=False, default="")
+    month = Column(Date, nullable=False, index=True) # First day of the appointment month
+
+    completed = Column(Integer, nullable=False, default=0) # Completed appointments
+    bp_measured = Column(Integer, nullable=False, default=0)
+    bp_controlled = Column(Integer, nullable=False, default=0)
+    bs_measured = Column(Integer, nullable=False, default=0)
+    bs_controlled = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime, nullable=True)
@@ -0,0 +1,285 @@
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import pandas as pd
+import tempfile
+import io
+import os
+
+from . import models, zones, http_cache
+
+# Number of rows sent per INSERT ... executemany and per IN (...) lookup
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+LOOKUP_CHUNK_SIZE = 500 # Keep IN lists under SQLite's bound-parameter limit
+# Streaming mode: rows read from the file per batch (each batch is committed on its own)
+STREAM_CHUNK_ROWS = int(os.getenv("IMPORT_STREAM_CHUNK_ROWS", 2000))
+# Upload reports only keep the first N skipped/rejected rows, the counts stay exact
+REPORT_LIMIT = int(os.getenv("IMPORT_REPORT_LIMIT", 1000))
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+# Patient field -> accepted column headers, in priority order (first non-empty wins)
+COLUMN_ALIASES = {
+    "hn": ['HN', 'hn', 'Hn'],
+    "cid": ['CID', 'cid', 'เลขบัตรประชาชน', 'เลขบัตร'],
+    "name": ['Name', 'name', 'ชื่อ', 'ชื่อ-นามสกุล', 'ชื่อ - นามสกุล', 'ชื่อสกุล'],
+    "phone": ['Phone', 'phone', 'เบอร์โทร', 'เบอร์โทรศัพท์'],
+    "medical_rights": ['Rights', 'rights', 'สิทธิ', 'สิทธิการรักษา'],
+    "clinic": ['Clinic', 'clinic', 'คลินิก', 'รหัสคลินิก'],
+    "house_no": ['HouseNo', 'house_no', 'บ้านเลขที่'],
+    "moo": ['Moo', 'moo', 'หมู่'],
+    "tumbol": ['Tumbol', 'tumbol', 'ตำบล'],
+    "amphoe": ['Amphoe', 'amphoe', 'อำเภอ'],
+    "province": ['Province', 'province', 'จังหวัด'],
+    "hc_zone": ['Zone', 'zone', 'เขตพื้นที่', 'รพ.สต.'],
+}
+
+
+def resolve_columns(columns):
+    # Done once per file: field -> the alias columns actually present, in priority order
+    present = set(columns)
+    return {field: [c for c in aliases if c in present] for field, aliases in COLUMN_ALIASES.items()}
+
+
+def _as_text(col):
+    # Excel gives whole numbers back as float when the column has blanks (1.0, 3.1e12),
+    # turn those into "1" / "3100000000000" before converting to text
+    if pd.api.types.is_float_dtype(col):
+        non_null = col.dropna()
+        if (non_null % 1 == 0).all():
+            col = col.astype("Int64")
+    elif col.dtype == object:
+        # Rows read straight from openpyxl keep the Python cell types
+        col = col.map(lambda v: int(v) if isinstance(v, float) and v.is_integer() else v)
+    return col.astype("string").str.strip()
+
+
+def normalize_frame(db: Session, df, column_map):
+    # Build one clean text column per Patient field, coalescing the aliases left to right
+    out = pd.DataFrame(index=df.index)
+    for field, cols in column_map.items():
+        value = pd.Series(pd.NA, index=df.index, dtype="string")
+        for c in cols:
+            value = value.fillna(_as_text(df[c]))
+        out[field] = value.fillna("")
+
+    # Zone given in the file wins, otherwise look it up from tumbol/moo in the zone table
+    missing_zone = (out["hc_zone"] == "") | (out["hc_zone"].str.lower() == "nan")
+    if missing_zone.any():
+        out.loc[missing_zone, "hc_zone"] = zones.map_zones(db, out.loc[missing_zone, "tumbol"], out.loc[missing_zone, "moo"])
+    return out
+
+
+def _existing_values(db: Session, column, values):
+    found = set()
+    values = list(values)
+    for i in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[i:i + LOOKUP_CHUNK_SIZE]
+        found.update(db.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def _report_rows(rows, status, reason, report):
+    for idx, hn in rows["hn"].items():
+        # +2: header row, and Excel rows are 1-based
+        report.append({"row": int(idx) + 2, "hn": hn or None, "status": status, "reason": reason})
+
+
+def _insert_rows(db: Session, records, report):
+    # Bulk insert inside a savepoint; if someone else inserted the same HN/CID meanwhile,
+    # retry that chunk row by row so one bad row does not sink the whole upload
+    inserted = 0
+    for i in range(0, len(records), IMPORT_BATCH_SIZE):
+        chunk = records[i:i + IMPORT_BATCH_SIZE]
+        try:
+            with db.begin_nested():
+                db.execute(insert(models.Patient), [r for _, r in chunk])
+            inserted += len(chunk)
+        except IntegrityError:
+            for row_no, r in chunk:
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(models.Patient), [r])
+                    inserted += 1
+                except IntegrityError:
+                    report.append({"row": row_no, "hn": r["hn"], "status": "rejected", "reason": "HN or CID already exists"})
+    return inserted
+
+
+def import_frame(db: Session, df, column_map=None, seen_hns=None, seen_cids=None):
+    """Insert the new patients of one DataFrame. Returns (inserted_count, report)."""
+    report = []
+    if column_map is None:
+        column_map = resolve_columns(df.columns)
+    seen_hns = set() if seen_hns is None else seen_hns
+    seen_cids = set() if seen_cids is None else seen_cids
+
+    rows = normalize_frame(db, df, column_map)
+
+    no_hn = rows["hn"] == ""
+    _report_rows(rows[no_hn], "rejected", "missing HN", report)
+    rows = rows[~no_hn]
+
+    no_cid = rows["cid"] == ""
+    _report_rows(rows[no_cid], "rejected", "missing CID", report)
+    rows = rows[~no_cid]
+
+    # Duplicates: already in the database, seen earlier in this upload, or repeated in this frame
+    db_hns = _existing_values(db, models.Patient.hn, rows["hn"].unique())
+    dup_hn = rows["hn"].isin(db_hns) | rows["hn"].isin(seen_hns) | rows["hn"].duplicated()
+    _report_rows(rows[dup_hn], "skipped", "HN already exists", report)
+    rows = rows[~dup_hn]
+
+    db_cids = _existing_values(db, models.Patient.cid, rows["cid"].unique())
+    dup_cid = rows["cid"].isin(db_cids) | rows["cid"].isin(seen_cids) | rows["cid"].duplicated()
+    _report_rows(rows[dup_cid], "skipped", "CID already exists", report)
+    rows = rows[~dup_cid]
+
+    seen_hns.update(rows["hn"])
+    seen_cids.update(rows["cid"])
+
+    records = [(int(idx) + 2, r) for idx, r in zip(rows.index, rows.to_dict("records"))]
+    inserted = _insert_rows(db, records, report)
+    if inserted:
+        http_cache.touch(db, "patients", rows["hc_zone"].unique())
+    report.sort(key=lambda r: r["row"])
+    return inserted, report
+
+
+# --- Streaming ingestion ---
+# The upload is spooled to a temp file and read back a chunk of rows at a time,
+# so memory use depends on STREAM_CHUNK_ROWS and not on the size of the file.
+
+async def spool_upload(upload, directory=None):
+    suffix = os.path.splitext(upload.filename or "")[1].lower() or ".xlsx"
+    fd, path = tempfile.mkstemp(prefix="ncd_upload_", suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def _iter_xlsx(path, chunk_rows):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h).strip() if h is not None else f"_col{i}" for i, h in enumerate(header)]
+        start, buf = 0, []
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= chunk_rows:
+                yield pd.DataFrame(buf, columns=header, index=range(start, start + len(buf)))
+                start, buf = start + len(buf), []
+        if buf:
+            yield pd.DataFrame(buf, columns=header, index=range(start, start + len(buf)))
+    finally:
+        wb.close()
+
+
+def iter_frames(path, chunk_rows=None):
+    # Yields DataFrames whose index is the 0-based data row number in the whole file
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        # utf-8-sig: the register exports from Google Sheets / Excel start with a BOM
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str, encoding="utf-8-sig", skipinitialspace=True)
+    elif ext in (".xlsx", ".xlsm"):
+        yield from _iter_xlsx(path, chunk_rows)
+    else:
+        # Old .xls has no row-streaming reader, load it in one go
+        yield pd.read_excel(path)
+
+
+def count_rows(path):
+    # Cheap estimate of the number of data rows, used for job progress
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == ".csv":
+            lines = 0
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(SPOOL_CHUNK_BYTES), b""):
+                    lines += block.count(b"\n")
+            return max(lines - 1, 0)
+        if ext in (".xlsx", ".xlsm"):
+            from openpyxl import load_workbook
+            wb = load_workbook(path, read_only=True)
+            try:
+                max_row = wb.active.max_row
+            finally:
+                wb.close()
+            return max(max_row - 1, 0) if max_row else None
+    except Exception:
+        pass
+    return None
+
+
+def new_result():
+    return {"inserted": 0, "skipped": 0, "rejected": 0, "rows": 0, "report": [], "report_truncated": False}
+
+
+def add_report(result, report):
+    """Count the rows of an import_frame() report into result, keeping the first REPORT_LIMIT."""
+    for r in report:
+        result[r["status"]] += 1
+        if len(result["report"]) < REPORT_LIMIT:
+            result["report"].append(r)
+        else:
+            result["report_truncated"] = True
+    return result
+
+
+def import_upload(db: Session, contents, filename):
+    """Import a whole uploaded file held in memory, in one transaction (the default upload mode)."""
+    try:
+        if (filename or "").lower().endswith(".csv"):
+            df = pd.read_csv(io.BytesIO(contents), dtype=str, encoding="utf-8-sig")
+        else:
+            df = pd.read_excel(io.BytesIO(contents))
+    except Exception:
+        raise ValueError("Could not read the file, upload an Excel (.xlsx/.xls) or CSV file")
+    count, report = import_frame(db, df)
+    db.commit()
+    result = new_result()
+    result.update(inserted=count, rows=len(df))
+    return add_report(result, report)
+
+
+def import_file(db: Session, path, chunk_rows=None, on_batch=None, result=None, skip_rows=0):
+    """Import a spooled file batch by batch, committing after each batch.
+
+    on_batch(result) runs before each commit, so anything it writes (job progress)
+    lands in the same transaction as the batch. skip_rows/result resume an import
+    that was interrupted after that many rows.
+    """
+    if result is None:
+        result = new_result()
+    column_map = None
+    for frame in iter_frames(path, chunk_rows):
+        if column_map is None:
+            column_map = resolve_columns(frame.columns)
+            if not column_map["hn"] or not column_map["cid"]:
+                raise ValueError("File has no HN / CID column")
+        if skip_rows:
+            frame = frame[frame.index >= skip_rows]
+            if frame.empty:
+                continue
+        # No seen-sets here: earlier batches are already committed, so the IN lookups catch repeats
+        inserted, report = import_frame(db, frame, column_map)
+
+        result["rows"] += len(frame)
+        result["inserted"] += inserted
+        add_report(result, report)
+        if on_batch:
+            on_batch(result)
+        db.commit()
+    return result
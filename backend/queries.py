@@ -0,0 +1,196 @@
+from sqlalchemy import select, func, union, or_
+from sqlalchemy.orm import joinedload
+import os
+
+from . import models
+
+# Filters shared by the sync endpoints in main.py and the async ones in async_routes.py.
+# They only call .filter/.join/.options, so they work on both a Session.query() and a select().
+
+# Page size for GET /patients and /patients/page, can be overridden per request with ?limit= up to the max
+PATIENT_PAGE_SIZE = int(os.getenv("PATIENT_PAGE_SIZE", 100))
+PATIENT_PAGE_SIZE_MAX = int(os.getenv("PATIENT_PAGE_SIZE_MAX", 1000))
+# Same for /home-opd/page
+HOME_OPD_PAGE_SIZE = int(os.getenv("HOME_OPD_PAGE_SIZE", 100))
+HOME_OPD_PAGE_SIZE_MAX = int(os.getenv("HOME_OPD_PAGE_SIZE_MAX", 1000))
+# Most appointments POST /appointments/batch creates in one call
+APPOINTMENT_BATCH_MAX = int(os.getenv("APPOINTMENT_BATCH_MAX", 5000))
+# Most results PUT /appointments/visits accepts in one call
+VISIT_BATCH_MAX = int(os.getenv("VISIT_BATCH_MAX", 1000))
+VITALS_MAX_POINTS_MAX = int(os.getenv("VITALS_MAX_POINTS_MAX", 1000))
+# GET /patients returns a plain list; the cursor for the next page goes in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def filter_patients(query, current_user, hn=None, cid=None, name=None, clinic=None, hc_zone=None, exact=False):
+    # HC can only see their zone
+    if current_user.role not in ['hospital', 'admin']:
+        query = query.filter(models.Patient.hc_zone == current_user.location_name)
+    elif hc_zone:
+        query = query.filter(models.Patient.hc_zone == hc_zone)
+
+    # HN / CID are prefix matches so the unique indexes can still be used; `exact` looks
+    # up one patient instead (a short HN can be the prefix of more than a page of others)
+    if hn:
+        field = models.Patient.hn
+        query = query.filter(field == hn.strip() if exact else field.startswith(hn.strip(), autoescape=True))
+    if cid:
+        field = models.Patient.cid
+        query = query.filter(field == cid.strip() if exact else field.startswith(cid.strip(), autoescape=True))
+    if name:
+        query = query.filter(models.Patient.name.contains(name.strip(), autoescape=True))
+    if clinic:
+        query = query.filter(models.Patient.clinic == clinic)
+    return query
+
+
+def patients_after(query, cursor, limit):
+    # Keyset page on Patient.id: "id > cursor ORDER BY id LIMIT n", so the cost of a page
+    # does not depend on how deep into the register it is. One extra row tells
+    # split_page() whether there is a next page.
+    if cursor is not None:
+        query = query.filter(models.Patient.id > cursor)
+    return query.order_by(models.Patient.id).limit(limit + 1)
+
+
+def split_page(rows, limit):
+    """(rows, next_cursor) from the limit + 1 rows of patients_after()."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def filter_appointments(query, current_user, start_date=None, end_date=None, load_patient=True):
+    # Use joinedload to eager load the patient relationship (not for column-only queries)
+    if load_patient:
+        query = query.options(joinedload(models.Appointment.patient))
+    query = query.join(models.Patient)
+
+    if start_date:
+        query = query.filter(models.Appointment.appointment_date >= start_date)
+    if end_date:
+        query = query.filter(models.Appointment.appointment_date <= end_date)
+
+    if current_user.role == 'hc':
+        # Filter patients in HC zone
+        query = query.filter(models.Patient.hc_zone == current_user.location_name)
+    return query
+
+
+# Columns /appointments/calendar can group by, on top of the appointment date
+CALENDAR_DIMENSIONS = {
+    "status": models.Appointment.status,
+    "hc_zone": models.Patient.hc_zone,
+    "req_bp": models.Appointment.req_bp,
+    "req_bs": models.Appointment.req_bs,
+}
+
+
+def appointment_calendar(current_user, start_date, end_date, dimensions, hc_zone=None):
+    # SELECT appointment_date, <dims>, count(*) ... GROUP BY appointment_date, <dims>
+    group_cols = [models.Appointment.appointment_date] + [CALENDAR_DIMENSIONS[d] for d in dimensions]
+    stmt = select(*group_cols, func.count(models.Appointment.id)).filter(
+        models.Appointment.appointment_date >= start_date,
+        models.Appointment.appointment_date <= end_date
+    )
+    zone = current_user.location_name if current_user.role == 'hc' else hc_zone
+    if zone or "hc_zone" in dimensions:
+        stmt = stmt.join(models.Patient, models.Patient.id == models.Appointment.patient_id)
+    if zone:
+        stmt = stmt.filter(models.Patient.hc_zone == zone)
+    return stmt.group_by(*group_cols).order_by(*group_cols)
+
+
+KPI_DIMENSIONS = {
+    "hc_zone": models.KPISummary.hc_zone,
+    "clinic": models.KPISummary.clinic,
+    "month": models.KPISummary.month,
+}
+KPI_COUNTERS = ("completed", "bp_measured", "bp_controlled", "bs_measured", "bs_controlled")
+
+
+def kpi_summary(current_user, start_month, end_month, dimensions, hc_zone=None, clinic=None):
+    # SELECT <dims>, sum(<counters>) FROM kpi_summary ... GROUP BY <dims>
+    group_cols = [KPI_DIMENSIONS[d] for d in dimensions]
+    sums = [func.sum(getattr(models.KPISummary, c)) for c in KPI_COUNTERS]
+    stmt = select(*group_cols, *sums).filter(
+        models.KPISummary.month >= start_month,
+        models.KPISummary.month <= end_month
+    )
+    zone = current_user.location_name if current_user.role == 'hc' else hc_zone
+    if zone:
+        stmt = stmt.filter(models.KPISummary.hc_zone == zone)
+    if clinic:
+        stmt = stmt.filter(models.KPISummary.clinic == clinic)
+    if group_cols:
+        stmt = stmt.group_by(*group_cols).order_by(*group_cols)
+    return stmt
+
+
+VITALS_COLUMNS = [
+    models.Appointment.appointment_date, models.Appointment.bp_sys, models.Appointment.bp_dia,
+    models.Appointment.bp_sys_2, models.Appointment.bp_dia_2, models.Appointment.blood_sugar,
+]
+
+
+def patient_vitals(patient_id, start_date=None, end_date=None):
+    # Appointments of one patient with any result, oldest first (ix_appointments_patient_date)
+    a = models.Appointment
+    stmt = select(*VITALS_COLUMNS).filter(
+        a.patient_id == patient_id,
+        a.appointment_date.isnot(None),
+        or_(a.bp_sys.isnot(None), a.bp_sys_2.isnot(None), a.blood_sugar.isnot(None))
+    )
+    if start_date:
+        stmt = stmt.filter(a.appointment_date >= start_date)
+    if end_date:
+        stmt = stmt.filter(a.appointment_date <= end_date)
+    return stmt.order_by(a.appointment_date, a.id)
+
+
+# Columns of HomeOPDResponse, so the page query doesn't load whole ORM objects
+HOME_OPD_COLUMNS = [
+    models.HomeOPD.id, models.HomeOPD.patient_id, models.HomeOPD.cid, models.HomeOPD.name,
+    models.HomeOPD.type, models.HomeOPD.note, models.HomeOPD.source, models.HomeOPD.location,
+    models.HomeOPD.created_at,
+]
+
+
+def home_opd_zone_ids(zone, start_date=None, end_date=None):
+    # A zone sees entries made at its location plus entries linked to one of its patients.
+    # As one OR across an outer join neither index can be used, so select the ids through
+    # each access path separately and UNION them:
+    #   location = zone            -> ix_home_opd_location_created_at
+    #   patients.hc_zone = zone    -> ix_patients_hc_zone_id, then ix_home_opd_patient_id
+    def in_range(stmt):
+        if start_date:
+            stmt = stmt.filter(models.HomeOPD.created_at >= start_date)
+        if end_date:
+            stmt = stmt.filter(models.HomeOPD.created_at <= end_date)
+        return stmt
+
+    at_location = in_range(select(models.HomeOPD.id).filter(models.HomeOPD.location == zone))
+    for_patients = in_range(
+        select(models.HomeOPD.id)
+        .join(models.Patient, models.Patient.id == models.HomeOPD.patient_id)
+        .filter(models.Patient.hc_zone == zone)
+    )
+    return union(at_location, for_patients)
+
+
+def filter_home_opd(query, current_user, start_date=None, end_date=None, type=None, source=None, hc_zone=None):
+    # HC is always limited to their own zone, hospital/admin can pick one
+    zone = current_user.location_name if current_user.role == 'hc' else hc_zone
+    if zone:
+        query = query.filter(models.HomeOPD.id.in_(home_opd_zone_ids(zone, start_date, end_date)))
+
+    if start_date:
+        query = query.filter(models.HomeOPD.created_at >= start_date)
+    if end_date:
+        query = query.filter(models.HomeOPD.created_at <= end_date)
+    if type:
+        query = query.filter(models.HomeOPD.type == type)
+    if source:
+        query = query.filter(models.HomeOPD.source == source)
+    return query
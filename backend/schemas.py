@@ -0,0 +1,291 @@
+from pydantic import BaseModel, ConfigDict
+from datetime import date, datetime
+from typing import List, Optional, Union
+
+class UserBase(BaseModel):
+    username: str
+    role: str
+    location_name: Optional[str] = None
+
+class UserCreateData(BaseModel):
+    username: str
+    password: str
+    name: str 
+    position: str
+    role: str
+    location_name: Optional[str] = None
+
+class UserUpdateData(BaseModel):
+    password: Optional[str] = None
+    name: Optional[str] = None
+    position: Optional[str] = None
+    role: Optional[str] = None
+    location_name: Optional[str] = None
+
+class UserResponse(UserBase):
+    id: int
+    name: Optional[str] = None
+    position: Optional[str] = None
+    plain_password: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class PatientCreate(BaseModel):
+    hn: str
+    name: str
+    cid: str
+    phone: Optional[str] = None
+    medical_rights: Optional[str] = None
+    clinic: Optional[str] = None
+    house_no: Optional[str] = None
+    moo: Optional[str] = None
+    tumbol: Optional[str] = None
+    amphoe: Optional[str] = None
+    province: Optional[str] = None
+    hc_zone: Optional[str] = None
+
+class PatientResponse(PatientCreate):
+    id: int
+    model_config = ConfigDict(from_attributes=True)
+
+class PatientPage(BaseModel):
+    items: List[PatientResponse]
+    next_cursor: Optional[int] = None # Pass back as ?cursor= to get the next page, None on the last page
+    total: Optional[int] = None # Only filled when include_total=true
+
+class PatientSearchHit(BaseModel):
+    id: int
+    hn: Optional[str] = None
+    name: Optional[str] = None
+    cid: Optional[str] = None
+    phone: Optional[str] = None
+    clinic: Optional[str] = None
+    hc_zone: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class PatientSearch(BaseModel):
+    query: str
+    results: List[PatientSearchHit] # Best match first
+
+class AppointmentCreate(BaseModel):
+    patient_id: int
+    appointment_date: str # YYYY-MM-DD
+    note: Optional[str] = None
+    req_bp: bool = False
+    req_bs: bool = False
+
+class AppointmentBatchCreate(BaseModel):
+    # Either an explicit list of patients, or a cohort filter (clinic and/or hc_zone)
+    patient_ids: Optional[List[int]] = None
+    clinic: Optional[str] = None
+    hc_zone: Optional[str] = None
+    appointment_date: str # YYYY-MM-DD
+    note: Optional[str] = None
+    req_bp: bool = False
+    req_bs: bool = False
+    skip_existing: bool = True # Don't book patients who already have an appointment that day
+
+class AppointmentBatchItem(BaseModel):
+    id: int
+    patient_id: int
+
+class AppointmentBatchResult(BaseModel):
+    appointment_date: date
+    created: int
+    items: List[AppointmentBatchItem]
+    already_scheduled: List[int] = [] # patient ids skipped because of skip_existing
+    not_found: List[int] = [] # patient ids that don't exist
+
+class AppointmentResponse(BaseModel):
+    id: int
+    patient_id: int
+    appointment_date: date
+    note: Optional[str]
+    status: str
+    bp_sys: Optional[int]
+    bp_dia: Optional[int]
+    bp_sys_2: Optional[int]
+    bp_dia_2: Optional[int]
+    blood_sugar: Optional[int]
+    refer_back_note: Optional[str]
+    patient: PatientResponse
+    req_bp: bool = False
+    req_bs: bool = False
+
+    model_config = ConfigDict(from_attributes=True)
+
+class CalendarBucket(BaseModel):
+    date: date
+    status: Optional[str] = None
+    hc_zone: Optional[str] = None
+    req_bp: Optional[bool] = None
+    req_bs: Optional[bool] = None
+    count: int
+
+class AppointmentCalendar(BaseModel):
+    start_date: date
+    end_date: date
+    group_by: List[str]
+    total: int
+    buckets: List[CalendarBucket]
+
+class VitalsTimeline(BaseModel):
+    patient_id: int
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    downsampled: bool = False # True when points were averaged down to max_points
+    # Parallel arrays, one entry per visit (or group of visits). Readings are whole numbers;
+    # only averaged groups have decimals
+    dates: List[date]
+    sys: List[Optional[Union[int, float]]]
+    dia: List[Optional[Union[int, float]]]
+    sugar: List[Optional[Union[int, float]]]
+
+class KPIBucket(BaseModel):
+    hc_zone: Optional[str] = None
+    clinic: Optional[str] = None
+    month: Optional[date] = None
+    completed: int
+    bp_measured: int
+    bp_controlled: int
+    bp_control_rate: Optional[float] = None # bp_controlled / bp_measured
+    bs_measured: int
+    bs_controlled: int
+    bs_control_rate: Optional[float] = None # bs_controlled / bs_measured
+
+class KPIReport(BaseModel):
+    start_month: date
+    end_month: date
+    group_by: List[str]
+    total: KPIBucket
+    buckets: List[KPIBucket]
+
+class AppointmentUpdate(BaseModel):
+    appointment_date: Optional[str] = None
+    note: Optional[str] = None
+
+class VisitUpdate(BaseModel):
+    bp_sys: Optional[int] = None
+    bp_dia: Optional[int] = None
+    bp_sys_2: Optional[int] = None
+    bp_dia_2: Optional[int] = None
+    blood_sugar: Optional[int] = None
+
+class VisitBatchItem(VisitUpdate):
+    id: int # appointment id
+
+class VisitBatch(BaseModel):
+    items: List[VisitBatchItem]
+
+class VisitBatchItemResult(BaseModel):
+    id: int
+    status: str # updated, unchanged (already saved, e.g. a retry), not_found, forbidden, duplicate
+
+class VisitBatchResult(BaseModel):
+    updated: int
+    unchanged: int
+    failed: int
+    items: List[VisitBatchItemResult]
+
+class ReferBack(BaseModel):
+    note: str
+
+class HomeOPDCreate(BaseModel):
+    patient_id: Optional[int] = None
+    cid: Optional[str] = None
+    name: Optional[str] = None
+    type: str # patient, osm
+    note: Optional[str] = None
+    source: Optional[str] = None # Optional from frontend, can be inferred
+
+class HomeOPDResponse(HomeOPDCreate):
+    id: int
+    created_at: Optional[date]
+    source: str
+    location: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class HomeOPDPage(BaseModel):
+    items: List[HomeOPDResponse]
+    next_cursor: Optional[int] = None # Newest first; pass back as ?cursor= for the next (older) page
+    total: Optional[int] = None
+
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
+class ZoneMappingData(BaseModel):
+    tumbol: str
+    moo: Optional[str] = None # Empty = every other moo in the tumbol
+    hc_zone: str
+
+class ZoneMappingResponse(BaseModel):
+    id: int
+    tumbol: str
+    moo: str
+    hc_zone: str
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Delta sync (/sync) ---
+class SyncPatient(PatientResponse):
+    row_version: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+class SyncAppointment(BaseModel):
+    # Flat, without the nested patient; patients come in their own list
+    id: int
+    patient_id: Optional[int]
+    appointment_date: date
+    note: Optional[str]
+    status: str
+    bp_sys: Optional[int]
+    bp_dia: Optional[int]
+    bp_sys_2: Optional[int]
+    bp_dia_2: Optional[int]
+    blood_sugar: Optional[int]
+    refer_back_note: Optional[str]
+    req_bp: bool = False
+    req_bs: bool = False
+    row_version: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class SyncHomeOPD(HomeOPDResponse):
+    client_id: Optional[str] = None
+    row_version: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+class SyncDeleted(BaseModel):
+    table: str # patients, appointments, home_opd
+    id: int
+
+class SyncResponse(BaseModel):
+    cursor: int # Send back as ?since= next time
+    full: bool # True when this is the complete set (no since), replace local data
+    patients: List[SyncPatient]
+    appointments: List[SyncAppointment]
+    home_opd: List[SyncHomeOPD]
+    deleted: List[SyncDeleted]
+
+class SyncChange(BaseModel):
+    op: str # visit, refer_back, home_opd
+    id: Optional[int] = None # Appointment id for visit / refer_back
+    client_id: Optional[str] = None # Client generated id for new home_opd entries
+    base_version: Optional[int] = None # row_version the client last saw
+    data: dict = {}
+
+class SyncPush(BaseModel):
+    changes: List[SyncChange]
+
+class SyncChangeResult(BaseModel):
+    op: str
+    id: Optional[int] = None
+    client_id: Optional[str] = None
+    status: str # applied, conflict, not_found, forbidden, invalid
+    row_version: Optional[int] = None
+    detail: Optional[str] = None
+    current: Optional[dict] = None # Server values on conflict
+
+class SyncPushResult(BaseModel):
+    cursor: int
+    results: List[SyncChangeResult]
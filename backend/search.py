@@ -0,0 +1,336 @@
+from collections import Counter
+import heapq
+import logging
+import os
+import re
+import threading
+
+from sqlalchemy import select, text, and_, or_, func, table, column, literal_column
+from sqlalchemy.orm import Session
+
+from . import models, http_cache, sync
+
+logger = logging.getLogger(__name__)
+
+# Patient search for typeahead (GET /patients/search): substring and typo-tolerant matching on
+# name, hn, cid and phone, ranked, limited and limited to the caller's zone.
+#
+# Thai names have no word boundaries to tokenize on, so every backend matches character
+# trigrams:
+#   sqlite      FTS5 table patients_fts (tokenize='trigram'), kept in sync by triggers
+#   postgresql  pg_trgm GIN index on the concatenated fields
+#   otherwise   NgramIndex, an in-memory trigram index updated from the changed patients
+# A query is first matched as a substring; when that finds fewer than `limit` patients the
+# rest is filled with fuzzy matches (most query trigrams in common) for misspelled names.
+# Queries shorter than a trigram use a prefix match on hn/cid/phone/name instead.
+
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 20))
+SEARCH_LIMIT_MAX = int(os.getenv("SEARCH_LIMIT_MAX", 100))
+# Share of the query's trigrams a fuzzy match must contain
+SEARCH_MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", 0.3))
+CANDIDATES = 10  # x limit rows per FTS5 lookup, re-ranked in Python
+
+FIELDS = ("name", "hn", "cid", "phone")
+RESULT_COLUMNS = [
+    models.Patient.id, models.Patient.hn, models.Patient.name, models.Patient.cid,
+    models.Patient.phone, models.Patient.clinic, models.Patient.hc_zone,
+]
+
+backend = "ngram"  # Set by ensure_index()
+
+
+def normalize(value):
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def trigrams(value):
+    value = normalize(value)
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def fuzzy_terms(query):
+    # Pieces of the query of which at least one survives a single typo: the two halves of a
+    # longer query, the trigrams of a short one
+    query = normalize(query)
+    if len(query) >= 6:
+        half = len(query) // 2
+        return [query[:half], query[half:]]
+    return sorted(trigrams(query))
+
+
+def _document(row):
+    return " ".join(normalize(getattr(row, f)) for f in FIELDS)
+
+
+def similarity(query, document, query_grams=None):
+    # 1.0 for a substring match, else the share of query trigrams found in the document
+    query = normalize(query)
+    if query and query in document:
+        return 1.0
+    query_grams = query_grams if query_grams is not None else trigrams(query)
+    if not query_grams:
+        return 0.0
+    return len(query_grams & trigrams(document)) / len(query_grams)
+
+
+def rank_key(query, document, query_grams=None):
+    # Best first: most similar, then matching at the start of a word (typing an HN, a first
+    # name), then the shortest document
+    query = normalize(query)
+    at_word_start = document.startswith(query) or (" " + query) in document
+    return (similarity(query, document, query_grams), at_word_start, -len(document))
+
+
+def _rank(query, rows, limit, exclude=()):
+    # rows: (id, document) pairs
+    query_grams = trigrams(query)
+    scored = []
+    for pid, document in rows:
+        if pid in exclude:
+            continue
+        key = rank_key(query, document, query_grams)
+        if key[0] >= SEARCH_MIN_SIMILARITY:
+            scored.append((key, -pid, pid))
+    return [pid for _, _, pid in heapq.nlargest(limit, scored)]
+
+
+# --- Setup ---
+SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5("
+    "name, hn, cid, phone, content='patients', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN "
+    "INSERT INTO patients_fts(rowid, name, hn, cid, phone) VALUES (new.id, new.name, new.hn, new.cid, new.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN "
+    "INSERT INTO patients_fts(patients_fts, rowid, name, hn, cid, phone) VALUES ('delete', old.id, old.name, old.hn, old.cid, old.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF name, hn, cid, phone ON patients BEGIN "
+    "INSERT INTO patients_fts(patients_fts, rowid, name, hn, cid, phone) VALUES ('delete', old.id, old.name, old.hn, old.cid, old.phone); "
+    "INSERT INTO patients_fts(rowid, name, hn, cid, phone) VALUES (new.id, new.name, new.hn, new.cid, new.phone); END",
+]
+
+PG_DOCUMENT = "lower(coalesce(name, '') || ' ' || coalesce(hn, '') || ' ' || coalesce(cid, '') || ' ' || coalesce(phone, ''))"
+PG_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_patients_search_trgm ON patients USING gin (({PG_DOCUMENT}) gin_trgm_ops)",
+]
+
+
+def ensure_index(engine):
+    """Create the search index for this database (once) and pick the search backend."""
+    global backend
+    try:
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                exists = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+                ).first()
+                for statement in SQLITE_SETUP:
+                    conn.exec_driver_sql(statement)
+                if not exists:
+                    # Index the patients that are already there
+                    conn.exec_driver_sql("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+                    logger.info("Search: built patients_fts")
+            backend = "fts5"
+        elif engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                for statement in PG_SETUP:
+                    conn.exec_driver_sql(statement)
+            backend = "pg_trgm"
+    except Exception:
+        # No FTS5 in this SQLite build, or no permission to create the extension
+        logger.warning("Search index not available, using the in-memory n-gram index", exc_info=True)
+        backend = "ngram"
+    return backend
+
+
+# --- In-memory fallback ---
+class NgramIndex:
+    """Trigram -> patient ids over all patients, kept up to date from the changed rows.
+
+    The first search builds it from every patient. After that, a change in the patients
+    version applies just the patients stamped with a newer row_version (sync.py) and the
+    patients tombstoned since, so one write doesn't cost a scan of the register. If the
+    indexed count no longer matches the table (rows deleted without a tombstone, e.g. by
+    hand) it is rebuilt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built = False
+        self.version = None
+        self.seq = 0  # Changes up to this sync sequence number are in the index
+        self.grams = {}
+        self.documents = {}
+        self.zones = {}
+
+    def _add(self, row):
+        document = _document(row)
+        self.documents[row.id] = document
+        self.zones[row.id] = row.hc_zone
+        for gram in trigrams(document):
+            self.grams.setdefault(gram, set()).add(row.id)
+
+    def _remove(self, pid):
+        document = self.documents.pop(pid, None)
+        self.zones.pop(pid, None)
+        if document is not None:
+            for gram in trigrams(document):
+                self.grams[gram].discard(pid)
+
+    def _rebuild(self, db: Session, seq):
+        self.grams, self.documents, self.zones = {}, {}, {}
+        for row in db.execute(select(models.Patient.id, models.Patient.hc_zone, *[getattr(models.Patient, f) for f in FIELDS])):
+            self._add(row)
+        self.seq = seq
+
+    def _apply_changes(self, db: Session, seq):
+        # Returns False when the index has drifted from the table and needs a rebuild
+        changed = db.execute(
+            select(models.Patient.id, models.Patient.hc_zone, *[getattr(models.Patient, f) for f in FIELDS])
+            .where(models.Patient.row_version > self.seq)
+        ).all()
+        tombstone = models.SyncTombstone
+        deleted = db.execute(
+            select(tombstone.row_id).where(tombstone.table_name == "patients", tombstone.row_version > self.seq)
+        ).scalars().all()
+        for pid in deleted:
+            self._remove(pid)
+        for row in changed:
+            self._remove(row.id)
+            self._add(row)
+        self.seq = seq
+        return len(self.documents) == db.execute(select(func.count()).select_from(models.Patient)).scalar()
+
+    def refresh(self, db: Session):
+        # Bumped by every patient write (http_cache.touch); call with self._lock held
+        version = http_cache.collection_version(db, "patients")
+        if self.built and version == self.version:
+            return
+        # Read before the rows, so a change committed meanwhile is applied (again) next time
+        seq = sync.current_seq(db)
+        if not (self.built and self._apply_changes(db, seq)):
+            self._rebuild(db, seq)
+            self.built = True
+        self.version = version
+
+    def search(self, db: Session, query, zone, limit):
+        query_grams = trigrams(query)
+        hits = Counter()
+        with self._lock:
+            self.refresh(db)
+            for gram in query_grams:
+                hits.update(self.grams.get(gram, ()))
+            minimum = max(1, int(len(query_grams) * SEARCH_MIN_SIMILARITY + 0.999))
+            # Only the patients sharing the most trigrams get the full ranking
+            candidates = heapq.nlargest(limit * CANDIDATES, (
+                (count, pid) for pid, count in hits.items()
+                if count >= minimum and (zone is None or self.zones.get(pid) == zone)
+            ))
+            documents = [(pid, self.documents[pid]) for _, pid in candidates]
+        return _rank(query, documents, limit)
+
+
+ngram_index = NgramIndex()
+
+
+# --- Search ---
+def _zone_filter(stmt, zone):
+    return stmt.filter(models.Patient.hc_zone == zone) if zone else stmt
+
+
+def _fts_phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+PATIENTS_FTS = table("patients_fts", column("rowid"))
+
+
+def _fts_candidates(db: Session, term, zone, limit):
+    # Best bm25 rank first, so a common substring still brings back its closest matches
+    fts = PATIENTS_FTS
+    stmt = (
+        select(models.Patient.id, *[getattr(models.Patient, f) for f in FIELDS])
+        .join(fts, fts.c.rowid == models.Patient.id)
+        .where(text("patients_fts MATCH :q"))
+        .order_by(literal_column("patients_fts.rank"))
+    )
+    if zone:
+        # Unary + keeps SQLite off ix_patients_hc_zone_id, so the MATCH drives the join
+        # instead of being evaluated once per patient of the zone
+        stmt = stmt.where(literal_column("+patients.hc_zone") == zone)
+    return [(row.id, _document(row)) for row in db.execute(stmt.limit(limit), {"q": _fts_phrase(term)})]
+
+
+def _id_candidates(db: Session, query, zone, limit):
+    # HN / CID starting with the query, through their unique indexes: whoever types an
+    # identifier gets that patient even when the FTS5 lookup has more matches than it returns
+    prefixes = {query.strip(), query.strip().upper()}
+    stmt = _zone_filter(
+        select(models.Patient.id, *[getattr(models.Patient, f) for f in FIELDS]).where(or_(*[
+            and_(field >= prefix, field < prefix + "\uffff")
+            for field in (models.Patient.hn, models.Patient.cid) for prefix in prefixes
+        ])), zone
+    ).limit(limit)
+    return [(row.id, _document(row)) for row in db.execute(stmt)]
+
+
+def _search_fts5(db: Session, query, zone, limit):
+    # Substring: all of the query's trigrams, in order
+    candidates = dict(_id_candidates(db, query, zone, limit))
+    candidates.update(_fts_candidates(db, normalize(query), zone, limit * CANDIDATES))
+    ids = _rank(query, candidates.items(), limit)
+    if len(ids) >= limit:
+        return ids
+
+    # Fuzzy: candidates containing one of the pieces, re-ranked by trigram similarity
+    candidates = {}
+    for term in fuzzy_terms(query):
+        candidates.update(_fts_candidates(db, term, zone, limit * CANDIDATES))
+    return ids + _rank(query, candidates.items(), limit - len(ids), exclude=set(ids))
+
+
+def _pg_trgm_stmt(query, zone, limit):
+    document = literal_column(PG_DOCUMENT)
+    q = normalize(query)
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    # word_similarity: best match of the query against any part of the document;
+    # both operators use ix_patients_search_trgm
+    score = func.word_similarity(q, document)
+    return _zone_filter(
+        select(models.Patient.id)
+        .where(or_(document.like(pattern), text(":q <% " + PG_DOCUMENT).bindparams(q=q)))
+        .order_by(score.desc(), models.Patient.id), zone
+    ).limit(limit)
+
+
+def _search_pg_trgm(db: Session, query, zone, limit):
+    return [pid for (pid,) in db.execute(_pg_trgm_stmt(query, zone, limit))]
+
+
+def _search_prefix(db: Session, query, zone, limit):
+    # One or two characters: too short for trigrams, match the start of the fields instead
+    q = normalize(query)
+    pattern = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    stmt = _zone_filter(
+        select(models.Patient.id).where(or_(*[
+            func.lower(getattr(models.Patient, f)).like(pattern, escape="\\") for f in ("hn", "cid", "phone", "name")
+        ])).order_by(models.Patient.hn), zone
+    ).limit(limit)
+    return [pid for (pid,) in db.execute(stmt)]
+
+
+def search_patients(db: Session, current_user, query, limit=SEARCH_LIMIT, hc_zone=None):
+    """Patients matching `query`, best first, as rows of RESULT_COLUMNS."""
+    # HC is always limited to their own zone, hospital/admin can pick one
+    zone = current_user.location_name if current_user.role == 'hc' else hc_zone
+    if len(normalize(query)) < 3:
+        ids = _search_prefix(db, query, zone, limit)
+    elif backend == "fts5":
+        ids = _search_fts5(db, query, zone, limit)
+    elif backend == "pg_trgm":
+        ids = _search_pg_trgm(db, query, zone, limit)
+    else:
+        ids = ngram_index.search(db, query, zone, limit)
+    if not ids:
+        return []
+    rows = {row.id: row for row in db.execute(select(*RESULT_COLUMNS).where(models.Patient.id.in_(ids)))}
+    return [rows[pid] for pid in ids if pid in rows]
@@ -0,0 +1,94 @@
+from fastapi.responses import Response
+
+from . import models, kpi
+from .schemas import PatientResponse, AppointmentResponse
+
+try:
+    import orjson
+except ImportError:  # Optional, falls back to the stdlib encoder
+    orjson = None
+    import json
+
+# Fast path for the big list endpoints (?compact=true on /patients and /appointments):
+# select only the response columns as plain rows and encode them straight to JSON bytes,
+# skipping ORM object construction and per-row Pydantic validation. Field lists come from
+# the response schemas so both paths return the same keys.
+
+PATIENT_FIELDS = [f for f in PatientResponse.model_fields]
+APPOINTMENT_FIELDS = [f for f in AppointmentResponse.model_fields if f != "patient"]
+
+PATIENT_COLUMNS = [getattr(models.Patient, f) for f in PATIENT_FIELDS]
+APPOINTMENT_COLUMNS = [getattr(models.Appointment, f) for f in APPOINTMENT_FIELDS]
+
+
+def _default(value):
+    # ISO 8601 like orjson and Pydantic ("T" between date and time, not str()'s space)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(content):
+    if orjson is not None:
+        # Handles date/datetime natively
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def patient_rows(rows):
+    return [dict(zip(PATIENT_FIELDS, row)) for row in rows]
+
+
+def appointment_rows(rows):
+    """Rows of APPOINTMENT_COLUMNS + PATIENT_COLUMNS -> appointments plus a patients side table.
+
+    Each patient is sent once however many appointments they have; clients look them up by
+    appointment.patient_id instead of reading a nested copy.
+    """
+    n = len(APPOINTMENT_FIELDS)
+    appointments = []
+    patients = {}
+    for row in rows:
+        appt = dict(zip(APPOINTMENT_FIELDS, row[:n]))
+        appointments.append(appt)
+        if appt["patient_id"] not in patients:
+            patients[appt["patient_id"]] = dict(zip(PATIENT_FIELDS, row[n:]))
+    return {"appointments": appointments, "patients": list(patients.values())}
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def vitals_series(rows, max_points=None):
+    """Rows of queries.VITALS_COLUMNS -> parallel arrays dates / sys / dia / sugar.
+
+    sys/dia is the reading that counts for the visit (kpi.bp_reading). With more rows than
+    `max_points`, consecutive visits are averaged in max_points equal-sized groups, each
+    dated by its first visit.
+    """
+    points = []
+    for appointment_date, bp_sys, bp_dia, bp_sys_2, bp_dia_2, sugar in rows:
+        sys_, dia = kpi.bp_reading({"bp_sys": bp_sys, "bp_dia": bp_dia, "bp_sys_2": bp_sys_2, "bp_dia_2": bp_dia_2})
+        points.append((appointment_date, sys_, dia, sugar))
+
+    downsampled = bool(max_points) and len(points) > max_points
+    if downsampled:
+        groups = [points[i * len(points) // max_points:(i + 1) * len(points) // max_points] for i in range(max_points)]
+        points = [(g[0][0], _mean(p[1] for p in g), _mean(p[2] for p in g), _mean(p[3] for p in g)) for g in groups]
+
+    return {
+        "downsampled": downsampled,
+        "dates": [p[0] for p in points],
+        "sys": [p[1] for p in points],
+        "dia": [p[2] for p in points],
+        "sugar": [p[3] for p in points],
+    }
@@ -0,0 +1,198 @@
+from email.utils import formatdate
+import hashlib
+import json
+import logging
+import os
+import time
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+
+from . import compression, http_cache
+
+logger = logging.getLogger(__name__)
+
+# Serves the built frontend (frontend/dist, or static_ui when frozen) from a manifest built
+# once at startup instead of probing the filesystem on every request.
+#
+# The manifest maps each URL path to its file, size, mtime, content hash (the ETag), content
+# type and precompressed .gz/.br variants; files up to STATIC_MEMORY_MAX bytes are kept in
+# memory. Unknown paths fall back to index.html (React Router) without touching the disk,
+# for browser navigations (Accept: text/html); API clients get FastAPI's JSON 404 instead.
+# Files listed in Vite's build manifest (.vite/manifest.json, build.manifest in
+# vite.config.js) are cached as immutable; without a manifest, the files under assets/.
+#
+# The manifest doesn't notice a rebuilt frontend by itself: restart, call
+# POST /admin/static/reload, or set STATIC_RELOAD=1 while developing to have it re-checked
+# (two directory stats) at most every STATIC_RELOAD_INTERVAL seconds.
+
+STATIC_MEMORY_MAX = int(os.getenv("STATIC_MEMORY_MAX", 256 * 1024))
+STATIC_RELOAD = os.getenv("STATIC_RELOAD", "").lower() in ("1", "true", "yes")
+STATIC_RELOAD_INTERVAL = float(os.getenv("STATIC_RELOAD_INTERVAL", 1))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+INDEX = "index.html"
+VITE_MANIFEST = os.path.join(".vite", "manifest.json")
+VARIANT_SUFFIXES = tuple(compression.ENCODINGS.values())
+
+
+class StaticFile:
+    def __init__(self, path, url_path, hashed_files=None):
+        stat = os.stat(path)
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            if stat.st_size <= STATIC_MEMORY_MAX:
+                body = f.read()
+                digest.update(body)
+            else:
+                # Served from disk: hash it in chunks instead of holding the whole file
+                body = None
+                while chunk := f.read(HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+        self.path = path
+        self.stat_result = stat
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = '"' + digest.hexdigest()[:24] + '"'
+        self.content_type = compression.media_type(path)
+        self.body = body
+        self.headers = {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.mtime, usegmt=True),
+            "Cache-Control": http_cache.static_cache_control(url_path, hashed_files),
+        }
+        # encoding -> StaticVariant for the .gz/.br next to it, if it's up to date
+        self.variants = {}
+        if path.endswith(compression.PRECOMPRESS_EXTENSIONS):
+            self.headers["Vary"] = "Accept-Encoding"
+            for encoding, suffix in compression.ENCODINGS.items():
+                if os.path.isfile(path + suffix) and os.stat(path + suffix).st_mtime >= self.mtime:
+                    self.variants[encoding] = StaticVariant(path + suffix)
+
+    def not_modified(self, request: Request):
+        if_none_match = request.headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+    def response(self, request: Request):
+        if self.not_modified(request):
+            return Response(status_code=304, headers=self.headers)
+        encoding = None
+        if self.variants:
+            encoding = compression.choose_encoding(request.headers.get("accept-encoding"), list(self.variants))
+        source = self.variants[encoding] if encoding else self
+        headers = dict(self.headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        if source.body is not None:
+            return Response(source.body, media_type=self.content_type, headers=headers)
+        return FileResponse(source.path, stat_result=source.stat_result, media_type=self.content_type, headers=headers)
+
+
+class StaticVariant:
+    def __init__(self, path):
+        self.path = path
+        self.stat_result = os.stat(path)
+        if self.stat_result.st_size <= STATIC_MEMORY_MAX:
+            with open(path, "rb") as f:
+                self.body = f.read()
+        else:
+            self.body = None
+
+
+class StaticManifest:
+    """URL path -> StaticFile for one directory, plus individual override files (config.js)."""
+
+    def __init__(self, directory, overrides=None):
+        self.directory = directory
+        self.overrides = overrides or {}  # url path -> file outside the directory, wins if it exists
+        self.files = {}
+        self._signature = None
+        self._checked_at = 0.0
+
+    def _current_signature(self):
+        # Vite empties and rewrites dist (and dist/assets) on every build
+        signature = []
+        for path in (self.directory, os.path.join(self.directory, "assets"), *self.overrides.values()):
+            try:
+                signature.append(os.stat(path).st_mtime)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _hashed_files(self):
+        # Output files of the Vite build manifest, or None when the build has no manifest
+        try:
+            with open(os.path.join(self.directory, VITE_MANIFEST), encoding="utf-8") as f:
+                chunks = json.load(f).values()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, AttributeError):
+            logger.warning("Unreadable Vite manifest in %s, caching assets/ as immutable", self.directory, exc_info=True)
+            return None
+        hashed = set()
+        for chunk in chunks:
+            hashed.add(chunk.get("file"))
+            hashed.update(chunk.get("css", ()))
+            hashed.update(chunk.get("assets", ()))
+        return hashed
+
+    def build(self):
+        files = {}
+        signature = self._current_signature()
+        hashed_files = self._hashed_files()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(VARIANT_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                url_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                files[url_path] = StaticFile(path, url_path, hashed_files)
+        for url_path, path in self.overrides.items():
+            if os.path.isfile(path):
+                files[url_path] = StaticFile(path, url_path)
+        self.files = files
+        self._signature = signature
+        self._checked_at = time.monotonic()
+        return len(files)
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < STATIC_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        if self._current_signature() != self._signature:
+            logger.info("Static files changed, reloading manifest for %s", self.directory)
+            self.build()
+
+    def get(self, url_path):
+        if STATIC_RELOAD:
+            self._reload_if_changed()
+        return self.files.get(url_path)
+
+    def response(self, request: Request, url_path):
+        entry = self.get(url_path)
+        if entry is None:
+            if url_path.startswith(http_cache.ASSETS_DIR):
+                # A missing bundle file is a real 404, not a client-side route
+                return Response(status_code=404)
+            if "text/html" not in request.headers.get("accept", ""):
+                # Not a page load: an API client asking for a path no route has
+                return JSONResponse({"detail": "Not Found"}, status_code=404)
+            entry = self.files.get(INDEX)
+            if entry is None:
+                return Response(status_code=404)
+        return entry.response(request)
+
+    def stats(self):
+        files = self.files
+        return {
+            "directory": self.directory,
+            "files": len(files),
+            "bytes": sum(f.size for f in files.values()),
+            "in_memory": sum(1 for f in files.values() if f.body is not None),
+            "precompressed": sum(1 for f in files.values() if f.variants),
+        }
@@ -0,0 +1,313 @@
+from sqlalchemy import event, select, insert, update, or_, inspect as orm_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, joinedload
+from datetime import datetime, date
+from pydantic import ValidationError
+
+from . import models, queries, events, http_cache, kpi
+from .schemas import VisitUpdate, ReferBack, HomeOPDCreate
+
+# Delta sync for clients that work offline (HC sites with unreliable connections).
+#
+# Every write to patients / appointments / home_opd stamps the row with row_version, a
+# change sequence taken from the data_versions "sync" counter. While a transaction runs its
+# rows carry PENDING; as it commits, _assign_seq bumps the counter and swaps in the new
+# number. The counter row is only locked from that moment to the commit, so writers in
+# different zones don't queue behind each other for their whole transaction (a long
+# import batch, say), yet transactions still get their numbers in commit order and
+# "row_version > cursor" never skips a row committed later. Rows of transactions that
+# haven't committed are invisible to other connections, so the PENDING marker never leaks.
+# Deletes (and patients moving to another zone) leave a row in sync_tombstones; a client
+# drops a tombstoned patient's appointments along with it.
+#
+# A client keeps the cursor from its last GET /sync and asks for ?since=<cursor>. Without
+# since (first run, or after losing its data) it gets the full set for its zone.
+# Writes made offline are queued and sent to POST /sync; each carries the row_version the
+# client based it on, so edits that crossed with someone else's are reported as conflicts.
+
+SEQ_KEY = "sync"
+PENDING = -1  # row_version of rows whose transaction hasn't committed yet
+_INFO_KEY = "sync_pending"
+_RESULT_KEY = "sync_commit_result"
+
+VISIT_FIELDS = ("bp_sys", "bp_dia", "bp_sys_2", "bp_dia_2", "blood_sugar")
+# Tables stamped with row_version
+SYNC_TABLES = (models.Patient.__table__, models.Appointment.__table__, models.HomeOPD.__table__, models.SyncTombstone.__table__)
+
+
+def transaction_seq(connection):
+    # The real number is only known at commit; note that this transaction needs one
+    connection.info[_INFO_KEY] = True
+    return PENDING
+
+
+def _next_seq(connection):
+    table = models.DataVersion.__table__
+    updated = connection.execute(
+        update(table).where(table.c.key == SEQ_KEY).values(version=table.c.version + 1)
+    ).rowcount
+    if not updated:
+        connection.execute(insert(table).values(key=SEQ_KEY, version=1))
+    return connection.execute(select(table.c.version).where(table.c.key == SEQ_KEY)).scalar_one()
+
+
+def _assign_seq(connection):
+    # Runs as the connection commits: after the session's final flush, never for a savepoint,
+    # and for Core-only transactions as well
+    result = connection.info.pop(_RESULT_KEY, None)
+    if not connection.info.pop(_INFO_KEY, False):
+        return
+    seq = _next_seq(connection)
+    for table in SYNC_TABLES:
+        connection.execute(update(table).where(table.c.row_version == PENDING).values(row_version=seq))
+    if result is not None:
+        result["seq"] = seq
+
+
+def _forget_seq(conn, *args):
+    # A rolled back transaction leaves nothing to renumber (a rolled back savepoint may, from
+    # before the savepoint, so that one keeps the mark)
+    conn.info.pop(_INFO_KEY, None)
+    conn.info.pop(_RESULT_KEY, None)
+
+
+event.listen(Engine, "commit", _assign_seq)
+event.listen(Engine, "rollback", _forget_seq)
+
+
+def commit(db: Session):
+    """db.commit(), returning the row_version the committed rows got (None if there were none)."""
+    result = db.connection().info[_RESULT_KEY] = {}
+    db.commit()
+    return result.get("seq")
+
+
+def current_seq(db: Session):
+    # Last committed change number, returned to the client as its next cursor
+    row = db.query(models.DataVersion).filter(models.DataVersion.key == SEQ_KEY).first()
+    return row.version if row else 0
+
+
+def ensure_counter(db: Session):
+    # Create the counter row up front so concurrent first writers don't race to insert it
+    if not db.query(models.DataVersion).filter(models.DataVersion.key == SEQ_KEY).first():
+        db.add(models.DataVersion(key=SEQ_KEY, version=0))
+        db.commit()
+
+
+# --- Tombstones ---
+def _patient_zone(connection, patient_id):
+    if patient_id is None:
+        return None
+    return connection.execute(select(models.Patient.hc_zone).where(models.Patient.id == patient_id)).scalar()
+
+
+def _add_tombstone(connection, table_name, row_id, hc_zone, location=None):
+    _add_tombstones(connection, table_name, [row_id], hc_zone, location)
+
+
+def _add_tombstones(connection, table_name, row_ids, hc_zone, location=None):
+    if not row_ids:
+        return
+    seq, now = transaction_seq(connection), datetime.utcnow()
+    connection.execute(insert(models.SyncTombstone.__table__), [
+        {"table_name": table_name, "row_id": row_id, "hc_zone": hc_zone, "location": location, "row_version": seq, "deleted_at": now}
+        for row_id in row_ids
+    ])
+
+
+@event.listens_for(models.Patient, "after_delete")
+def _patient_deleted(mapper, connection, target):
+    _add_tombstone(connection, "patients", target.id, target.hc_zone)
+
+
+@event.listens_for(models.Patient, "after_update")
+def _patient_moved(mapper, connection, target):
+    # The old zone no longer sees this patient or their appointments; the new zone has to
+    # get them in its next delta, so the appointments and home OPD rows get a new row_version
+    history = orm_inspect(target).attrs.hc_zone.history
+    if all(z == target.hc_zone for z in history.deleted or ()):
+        return
+    old_zones = [z for z in history.deleted if z]
+
+    appointments = models.Appointment.__table__
+    home_opd = models.HomeOPD.__table__
+    appointment_ids = connection.execute(select(appointments.c.id).where(appointments.c.patient_id == target.id)).scalars().all()
+    home_opd_rows = connection.execute(select(home_opd.c.id, home_opd.c.location).where(home_opd.c.patient_id == target.id)).all()
+    for old_zone in old_zones:
+        _add_tombstones(connection, "patients", [target.id], old_zone)
+        _add_tombstones(connection, "appointments", appointment_ids, old_zone)
+        # Entries made at the old zone's own location stay visible there
+        _add_tombstones(connection, "home_opd", [h.id for h in home_opd_rows if h.location != old_zone], old_zone)
+
+    seq = transaction_seq(connection)
+    if appointment_ids:
+        connection.execute(update(appointments).where(appointments.c.patient_id == target.id).values(row_version=seq))
+    if home_opd_rows:
+        connection.execute(update(home_opd).where(home_opd.c.patient_id == target.id).values(row_version=seq))
+
+
+@event.listens_for(models.Appointment, "after_delete")
+def _appointment_deleted(mapper, connection, target):
+    _add_tombstone(connection, "appointments", target.id, _patient_zone(connection, target.patient_id))
+
+
+@event.listens_for(models.HomeOPD, "after_delete")
+def _home_opd_deleted(mapper, connection, target):
+    _add_tombstone(connection, "home_opd", target.id, _patient_zone(connection, target.patient_id), target.location)
+
+
+# --- Pull ---
+def changes_since(db: Session, current_user, since=None, hc_zone=None):
+    # Read the cursor first: anything committed after this point is sent again next time,
+    # which is harmless since clients upsert by id
+    cursor = current_seq(db)
+    zone = current_user.location_name if current_user.role == 'hc' else hc_zone
+
+    patients = queries.filter_patients(db.query(models.Patient), current_user, hc_zone=hc_zone)
+    appointments = db.query(models.Appointment)
+    if zone:
+        appointments = appointments.join(models.Patient).filter(models.Patient.hc_zone == zone)
+    home_opd = queries.filter_home_opd(db.query(models.HomeOPD), current_user, hc_zone=hc_zone)
+
+    deleted = []
+    if since:
+        patients = patients.filter(models.Patient.row_version > since)
+        appointments = appointments.filter(models.Appointment.row_version > since)
+        home_opd = home_opd.filter(models.HomeOPD.row_version > since)
+
+        tombstones = db.query(models.SyncTombstone).filter(models.SyncTombstone.row_version > since)
+        if zone:
+            tombstones = tombstones.filter(or_(models.SyncTombstone.hc_zone == zone, models.SyncTombstone.location == zone))
+        deleted = [{"table": t.table_name, "id": t.row_id} for t in tombstones.order_by(models.SyncTombstone.row_version)]
+
+    return {
+        "cursor": cursor,
+        "full": not since,
+        "patients": patients.order_by(models.Patient.id).all(),
+        "appointments": appointments.order_by(models.Appointment.id).all(),
+        "home_opd": home_opd.order_by(models.HomeOPD.id).all(),
+        "deleted": deleted,
+    }
+
+
+# --- Push ---
+def _patient_zones(db: Session, patient_ids):
+    if not patient_ids:
+        return set()
+    return {z for (z,) in db.query(models.Patient.hc_zone).filter(models.Patient.id.in_(patient_ids))}
+
+
+def _appointment_fields(appt):
+    fields = {f: getattr(appt, f) for f in VISIT_FIELDS}
+    fields.update(status=appt.status, refer_back_note=appt.refer_back_note, row_version=appt.row_version)
+    return fields
+
+
+def apply_changes(db: Session, current_user, changes):
+    """Apply queued offline writes in one transaction, returning one result per change.
+
+    Supported ops: "visit" (VisitUpdate data), "refer_back" (ReferBack data) on appointment
+    `id`, and "home_opd" (HomeOPDCreate data, deduplicated by `client_id`).
+    If `base_version` is given and the row changed since, the change is not applied and the
+    result is "conflict" with the server's current values, unless the row already holds
+    exactly what was sent (a retry of a write that did go through).
+    """
+    appt_ids = [c.id for c in changes if c.op in ("visit", "refer_back") and c.id is not None]
+    appointments = {}
+    if appt_ids:
+        rows = db.query(models.Appointment).options(joinedload(models.Appointment.patient)) \
+            .filter(models.Appointment.id.in_(appt_ids)).all()
+        appointments = {a.id: a for a in rows}
+
+    client_ids = [c.client_id for c in changes if c.op == "home_opd" and c.client_id]
+    existing_home_opd = {}
+    if client_ids:
+        existing_home_opd = {h.client_id: h for h in db.query(models.HomeOPD).filter(models.HomeOPD.client_id.in_(client_ids))}
+
+    results = []
+    touched = []
+    changed_appointments = []
+    new_home_opd_patients = set()
+    for change in changes:
+        result = {"op": change.op, "id": change.id, "client_id": change.client_id}
+        results.append(result)
+        try:
+            if change.op in ("visit", "refer_back"):
+                appt = appointments.get(change.id)
+                if appt is None:
+                    result["status"] = "not_found"
+                    continue
+                if current_user.role == 'hc' and (appt.patient is None or appt.patient.hc_zone != current_user.location_name):
+                    result["status"] = "forbidden"
+                    continue
+
+                if change.op == "visit":
+                    data = VisitUpdate(**change.data)
+                    wanted = {f: getattr(data, f) for f in VISIT_FIELDS}
+                    wanted["status"] = "completed"
+                else:
+                    data = ReferBack(**change.data)
+                    wanted = {"refer_back_note": data.note, "status": "referred_back"}
+
+                if all(getattr(appt, k) == v for k, v in wanted.items()):
+                    result.update(status="applied", id=appt.id, row_version=appt.row_version)
+                    continue
+                if change.base_version is not None and appt.row_version != change.base_version:
+                    result.update(status="conflict", current=_appointment_fields(appt))
+                    continue
+                before = kpi.snapshot(appt)
+                for k, v in wanted.items():
+                    setattr(appt, k, v)
+                patient = appt.patient
+                kpi.record_visit(db, patient.hc_zone if patient else None, patient.clinic if patient else None, appt.appointment_date, before, kpi.snapshot(appt))
+                result.update(status="applied", id=appt.id)
+                touched.append(result)
+                changed_appointments.append(appt)
+
+            elif change.op == "home_opd":
+                if change.client_id and change.client_id in existing_home_opd:
+                    existing = existing_home_opd[change.client_id]
+                    result.update(status="applied", id=existing.id, row_version=existing.row_version)
+                    continue
+                data = HomeOPDCreate(**change.data)
+                if not data.cid and not data.patient_id:
+                    result.update(status="invalid", detail="CID or Patient ID required")
+                    continue
+                item = models.HomeOPD(
+                    patient_id=data.patient_id,
+                    cid=data.cid,
+                    name=data.name,
+                    type=data.type,
+                    note=data.note,
+                    source="hospital" if current_user.role in ['hospital', 'admin'] else "hc",
+                    location=current_user.location_name,
+                    created_at=date.today(),
+                    client_id=change.client_id
+                )
+                db.add(item)
+                db.flush()
+                if data.patient_id:
+                    new_home_opd_patients.add(data.patient_id)
+                if change.client_id:
+                    existing_home_opd[change.client_id] = item
+                result.update(status="applied", id=item.id)
+                touched.append(result)
+
+            else:
+                result.update(status="invalid", detail=f"Unknown op {change.op}")
+        except ValidationError as e:
+            result.update(status="invalid", detail=str(e.errors()[0].get("msg")))
+
+    if touched:
+        http_cache.touch(db, "appointments", {a.patient.hc_zone for a in changed_appointments if a.patient})
+        if len(changed_appointments) < len(touched):
+            http_cache.touch(db, "home_opd", {current_user.location_name} | _patient_zones(db, new_home_opd_patients))
+    seq = commit(db)
+    # Every change of this call went out in that commit
+    for result in touched:
+        result["row_version"] = seq
+
+    for appt in changed_appointments:
+        events.publish_appointment("appointment.completed" if appt.status == "completed" else "appointment.referred_back", appt)
+    return results
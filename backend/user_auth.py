@@ -5,9 +5,13 @@ from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from . import models, database
+from . import models, database, logs
 from pydantic import BaseModel
+from collections import OrderedDict
+import threading
 import hashlib
+import logging
+import time
 
 import os
 from dotenv import load_dotenv
@@ -15,15 +19,26 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = os.getenv("SECRET_KEY", "SECRET_KEY_NCD_APP") # Get from env or use default
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24)) # 1 day default
 
+# "db": load the user row on every request (default)
+# "claims": take role/loc from the verified token; id/name/position and the token_version
+# revocation check come from an in-process cache of the users row
+AUTH_MODE = os.getenv("AUTH_MODE", "db").lower()
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60)) # seconds
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+
 # Use hashlib for Python 3.14 compatibility (temporary fix)
 USE_SIMPLE_HASH = True
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# For endpoints that also take the token as a query parameter (EventSource can't send headers)
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 class Token(BaseModel):
     access_token: str
@@ -33,6 +48,16 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[str] = None
 
+class Principal(BaseModel):
+    # Stand-in for models.User on the request path, carries only what endpoints read
+    id: int
+    username: str
+    role: str
+    location_name: Optional[str] = None
+    name: Optional[str] = None
+    position: Optional[str] = None
+    token_version: int = 0
+
 def verify_password(plain_password, hashed_password):
     # Check for simple hash first if enabled
     if USE_SIMPLE_HASH:
@@ -50,7 +75,7 @@ def verify_password(plain_password, hashed_password):
         return pwd_context.verify(plain_password_truncated, hashed_password)
     except Exception as e:
         # Fallback: just compare plain password (TEMPORARY FIX for Python 3.14)
-        print(f"Bcrypt verification failed: {e}, trying plain comparison")
+        logger.warning("Bcrypt verification failed: %s, trying plain comparison", e)
         # For testing: allow plain password "1234" for all users
         return plain_password == "1234"
 
@@ -81,7 +106,47 @@ def get_db():
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# --- User cache (AUTH_MODE=claims) ---
+# username -> (Principal, expires_at). LRU ordered, entries also expire after USER_CACHE_TTL so
+# edits made by another worker process are picked up within that time.
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def _cache_get(username):
+    with _user_cache_lock:
+        entry = _user_cache.get(username)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at < time.monotonic():
+            del _user_cache[username]
+            return None
+        _user_cache.move_to_end(username)
+        return principal
+
+def _cache_put(principal):
+    with _user_cache_lock:
+        _user_cache[principal.username] = (principal, time.monotonic() + USER_CACHE_TTL)
+        _user_cache.move_to_end(principal.username)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def invalidate_user(username):
+    with _user_cache_lock:
+        _user_cache.pop(username, None)
+
+def principal_from_user(user):
+    return Principal(
+        id=user.id,
+        username=user.username,
+        role=user.role,
+        location_name=user.location_name,
+        name=user.name,
+        position=user.position,
+        token_version=user.token_version or 0
+    )
+
+def decode_token(token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -89,17 +154,63 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
         raise credentials_exception
-        
+    if payload.get("sub") is None:
+        raise credentials_exception
+    # For the access line and anything logged later in this request
+    logs.bind(user=payload["sub"], zone=payload.get("loc") or None)
+    return payload, credentials_exception
+
+def user_for_token(token: str, db: Session):
+    """The caller of a request: a Principal in claims mode, the users row in db mode.
+
+    Shared by get_current_user, get_user_for_token and the async routes (through
+    AsyncSession.run_sync), so every entry point checks tokens the same way.
+    """
+    payload, credentials_exception = decode_token(token)
+    username: str = payload.get("sub")
+    token_version = payload.get("ver", 0) # Tokens issued before versioning count as 0
+
+    if AUTH_MODE == "claims":
+        account = _cache_get(username)
+        if account is None:
+            # Cache miss: one lookup, then served from memory until TTL / invalidation
+            user = db.query(models.User).filter(models.User.username == username).first()
+            if user is None:
+                raise credentials_exception
+            account = principal_from_user(user)
+            _cache_put(account)
+        # Revocation check: role/zone changes and logouts bump token_version
+        if account.token_version != token_version:
+            raise credentials_exception
+        # Role and zone come from the verified token; the cached row only adds id/name/position
+        claims = {}
+        if "role" in payload:
+            claims["role"] = payload["role"]
+        if "loc" in payload:
+            claims["location_name"] = payload["loc"] or None
+        return account.model_copy(update=claims)
+
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
+    if (user.token_version or 0) != token_version:
+        raise credentials_exception
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return user_for_token(token, db)
+
+def get_user_for_token(token: Optional[str]):
+    # get_current_user with its own short session, for long-lived responses that
+    # shouldn't hold a pooled connection open (SSE)
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    with database.SessionLocal() as db:
+        user = user_for_token(token, db)
+        return user if isinstance(user, Principal) else principal_from_user(user)
+
 async def authenticate_user(token: str = Depends(oauth2_scheme)):
     # Helper for routes
     return token
@@ -0,0 +1,197 @@
+from sqlalchemy.orm import Session
+import threading
+import time
+import csv
+import logging
+import os
+import re
+import sys
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Tumbol/moo -> รพ.สต. routing.
+# The mapping lives in the zone_mappings table (seeded from the ฐานข้อมูลตำบล CSV) and is
+# held in memory as a dict keyed by (tumbol, moo). Edits bump the "zone_mappings" row in
+# data_versions; other workers notice the new version within ZONE_CACHE_TTL seconds.
+
+ZONE_CACHE_TTL = float(os.getenv("ZONE_CACHE_TTL", 30))
+VERSION_KEY = "zone_mappings"
+
+# Zone used when neither (tumbol, moo) nor (tumbol, any moo) is mapped
+DEFAULT_ZONE = 'รพ.หนองหิน'
+
+# The CSV uses short names; users' location_name (and so patients.hc_zone) uses these
+ZONE_NAME_ALIASES = {
+    'สอน.เฉลิมฯ': 'สถานีอนามัยเฉลิมพระเกียรติ',
+    'PCU': 'รพ.หนองหิน',
+    'รพ.สต.บ้านหลักร้อยหกสิบ': 'รพ.สต.หลักร้อยหกสิบ',
+}
+
+# Whole-tumbol fallbacks (moo ""), same as the old get_hc_zone else-branches
+TUMBOL_DEFAULTS = {
+    'ปวนพุ': 'รพ.สต.บ้านปวนพุ',
+    'หนองหิน': 'สถานีอนามัยเฉลิมพระเกียรติ',
+    'ตาดข่า': 'รพ.สต.บ้านน้อยสามัคคี',
+}
+
+CSV_NAME = "ทะเบียนผู้ป่วย รพ.หนองหิน - ฐานข้อมูลตำบล.csv"
+
+
+def default_csv_path():
+    if os.getenv("ZONE_CSV_PATH"):
+        return os.getenv("ZONE_CSV_PATH")
+    if getattr(sys, 'frozen', False):
+        return os.path.join(os.path.dirname(sys.executable), CSV_NAME)
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), CSV_NAME)
+
+
+_TUMBOL_PREFIX = re.compile(r'^(ตำบล|ต\.)\s*')
+_DIGITS = re.compile(r'\d+')
+
+
+def normalize_tumbol(tumbol):
+    if tumbol is None:
+        return ""
+    return _TUMBOL_PREFIX.sub("", str(tumbol).strip())
+
+
+def normalize_moo(moo):
+    # "1", "1.0", "01", "ม.1", "หมู่ 1" -> "1"
+    if moo is None:
+        return ""
+    m = _DIGITS.search(str(moo))
+    return str(int(m.group())) if m else ""
+
+
+def normalize_zone_name(zone):
+    zone = str(zone).strip()
+    return ZONE_NAME_ALIASES.get(zone, zone)
+
+
+def _key(tumbol, moo):
+    # Flat string key so whole columns can be looked up with Series.map
+    return f"{tumbol}|{moo}"
+
+
+# --- Versioned in-memory cache ---
+_lock = threading.Lock()
+_cache = {"version": None, "checked_at": 0.0, "exact": {}, "tumbol": {}}
+
+
+def get_data_version(db: Session, key):
+    row = db.query(models.DataVersion).filter(models.DataVersion.key == key).first()
+    return row.version if row else 0
+
+
+def bump_data_version(db: Session, key):
+    updated = db.query(models.DataVersion).filter(models.DataVersion.key == key).update(
+        {models.DataVersion.version: models.DataVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.add(models.DataVersion(key=key, version=1))
+    db.flush()
+
+
+def invalidate_cache():
+    with _lock:
+        _cache["version"] = None
+
+
+def get_zone_map(db: Session):
+    """Return ({"tumbol|moo": zone}, {tumbol: zone}), reloading only when the version changed."""
+    now = time.monotonic()
+    if _cache["version"] is not None and now - _cache["checked_at"] < ZONE_CACHE_TTL:
+        return _cache["exact"], _cache["tumbol"]
+
+    version = get_data_version(db, VERSION_KEY)
+    with _lock:
+        if _cache["version"] != version:
+            exact, tumbol = {}, {}
+            for t, m, zone in db.query(models.ZoneMapping.tumbol, models.ZoneMapping.moo, models.ZoneMapping.hc_zone):
+                if m:
+                    exact[_key(t, m)] = zone
+                else:
+                    tumbol[t] = zone
+            _cache["exact"], _cache["tumbol"] = exact, tumbol
+            _cache["version"] = version
+        _cache["checked_at"] = now
+        return _cache["exact"], _cache["tumbol"]
+
+
+def resolve_zone(db: Session, tumbol, moo):
+    exact, by_tumbol = get_zone_map(db)
+    t, m = normalize_tumbol(tumbol), normalize_moo(moo)
+    return exact.get(_key(t, m)) or by_tumbol.get(t) or DEFAULT_ZONE
+
+
+def map_zones(db: Session, tumbol, moo):
+    """Vectorized resolve_zone over two aligned Series, returns a Series of zone names."""
+    exact, by_tumbol = get_zone_map(db)
+    t = tumbol.fillna("").astype(str).str.strip().str.replace(_TUMBOL_PREFIX, "", regex=True)
+    m = moo.fillna("").astype(str).str.extract(r'(\d+)', expand=False)
+    m = m.dropna().astype(int).astype(str).reindex(m.index).fillna("")
+    zones = (t + "|" + m).map(exact)
+    zones = zones.fillna(t.map(by_tumbol))
+    return zones.fillna(DEFAULT_ZONE)
+
+
+# --- Loading / editing ---
+def read_csv_mappings(path=None):
+    rows = {}
+    with open(path or default_csv_path(), "r", encoding="utf-8-sig", newline="") as f:
+        for rec in csv.DictReader(f):
+            t = normalize_tumbol(rec.get("ตำบล"))
+            zone = rec.get("รพ.สต.")
+            if not t or not zone:
+                continue
+            rows[(t, normalize_moo(rec.get("หมู่")))] = normalize_zone_name(zone)
+    for t, zone in TUMBOL_DEFAULTS.items():
+        rows.setdefault((t, ""), zone)
+    return rows
+
+
+def load_mappings(db: Session, mappings):
+    # Replace the whole table, used for the first seed and the admin "reload CSV" action
+    db.query(models.ZoneMapping).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.ZoneMapping, [
+        {"tumbol": t, "moo": m, "hc_zone": zone} for (t, m), zone in mappings.items()
+    ])
+    bump_data_version(db, VERSION_KEY)
+    db.commit()
+    invalidate_cache()
+    return len(mappings)
+
+
+def ensure_seeded(db: Session):
+    if db.query(models.ZoneMapping.id).first() is not None:
+        return 0
+    try:
+        mappings = read_csv_mappings()
+    except OSError as e:
+        logger.warning("Zone CSV not loaded (%s), using tumbol defaults only", e)
+        mappings = {(t, ""): zone for t, zone in TUMBOL_DEFAULTS.items()}
+    return load_mappings(db, mappings)
+
+
+def upsert_mapping(db: Session, tumbol, moo, hc_zone):
+    t, m = normalize_tumbol(tumbol), normalize_moo(moo)
+    row = db.query(models.ZoneMapping).filter(models.ZoneMapping.tumbol == t, models.ZoneMapping.moo == m).first()
+    if row:
+        row.hc_zone = hc_zone
+    else:
+        row = models.ZoneMapping(tumbol=t, moo=m, hc_zone=hc_zone)
+        db.add(row)
+    bump_data_version(db, VERSION_KEY)
+    db.commit()
+    invalidate_cache()
+    db.refresh(row)
+    return row
+
+
+def delete_mapping(db: Session, row):
+    db.delete(row)
+    bump_data_version(db, VERSION_KEY)
+    db.commit()
+    invalidate_cache()
@@ -0,0 +1,202 @@
+"""Query-plan and timing benchmark for the list endpoints.
+
+Seeds a throwaway SQLite database (100k patients / 1M appointments by default),
+then runs the same queries the endpoints build (backend/queries.py) and prints
+EXPLAIN QUERY PLAN plus timings. Exits with status 1 if a query stops using the
+index it is expected to use, so index regressions show up.
+
+    python benchmarks/bench_queries.py
+    python benchmarks/bench_queries.py --patients 10000 --appointments 100000
+    python benchmarks/bench_queries.py --keep      # reuse the seeded DB on the next run
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(ROOT, "benchmarks", "bench.db")
+
+ZONES = [
+    "สถานีอนามัยเฉลิมพระเกียรติ",
+    "รพ.สต.หลักร้อยหกสิบ",
+    "รพ.สต.บ้านน้อยสามัคคี",
+    "รพ.สต.บ้านปวนพุ",
+    "รพ.สต.บ้านหนองหมากแก้ว",
+    "รพ.หนองหิน",
+]
+STATUSES = ["pending", "pending", "pending", "completed", "referred_back"]
+START = date(2025, 1, 1)
+DAYS = 365
+BATCH = 20000
+
+
+class Principal:
+    # Stand-in for the authenticated user; the query helpers only read these two fields
+    def __init__(self, role, location_name=None):
+        self.role = role
+        self.location_name = location_name
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite file to seed (default: benchmarks/bench.db)")
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--home-opd", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query")
+    parser.add_argument("--keep", action="store_true", help="Reuse an already seeded DB and keep it afterwards")
+    return parser.parse_args()
+
+
+def seed(db, models, args):
+    from sqlalchemy import insert, text
+
+    rng = random.Random(42)
+    t0 = time.perf_counter()
+
+    rows = []
+    for i in range(1, args.patients + 1):
+        rows.append({
+            "id": i, "hn": f"HN{i:08d}", "cid": f"{i:013d}", "name": f"Patient {i}",
+            "clinic": rng.choice(["DM", "HT", "DM+HT"]), "hc_zone": rng.choice(ZONES),
+            "tumbol": "หนองหิน", "moo": str(rng.randint(1, 20)),
+        })
+        if len(rows) >= BATCH:
+            db.execute(insert(models.Patient), rows)
+            rows = []
+    if rows:
+        db.execute(insert(models.Patient), rows)
+
+    rows = []
+    for i in range(1, args.appointments + 1):
+        rows.append({
+            "id": i, "patient_id": rng.randint(1, args.patients),
+            "appointment_date": START + timedelta(days=rng.randrange(DAYS)),
+            "status": rng.choice(STATUSES), "req_bp": rng.random() < 0.7, "req_bs": rng.random() < 0.4,
+        })
+        if len(rows) >= BATCH:
+            db.execute(insert(models.Appointment), rows)
+            rows = []
+    if rows:
+        db.execute(insert(models.Appointment), rows)
+
+    rows = []
+    for i in range(1, args.home_opd + 1):
+        linked = rng.random() < 0.5
+        rows.append({
+            "id": i, "patient_id": rng.randint(1, args.patients) if linked else None,
+            "cid": f"{rng.randint(1, 10**13):013d}", "type": "patient" if linked else "osm",
+            "source": "hc", "location": rng.choice(ZONES),
+            "created_at": START + timedelta(days=rng.randrange(DAYS)),
+        })
+        if len(rows) >= BATCH:
+            db.execute(insert(models.HomeOPD), rows)
+            rows = []
+    if rows:
+        db.execute(insert(models.HomeOPD), rows)
+
+    db.commit()
+    db.execute(text("ANALYZE"))
+    db.commit()
+    print(f"Seeded {args.patients} patients, {args.appointments} appointments, "
+          f"{args.home_opd} home OPD rows in {time.perf_counter() - t0:.1f}s")
+
+
+def build_cases(models, queries):
+    from sqlalchemy import select, func
+
+    hc = Principal("hc", ZONES[1])
+    hospital = Principal("hospital")
+    month_start, month_end = date(2025, 6, 1), date(2025, 6, 30)
+    week_start, week_end = date(2025, 6, 2), date(2025, 6, 8)
+
+    # (name, statement, indexes of which at least one must show up in the plan)
+    return [
+        ("GET /appointments (hospital, one week)",
+         queries.filter_appointments(select(models.Appointment), hospital, week_start, week_end),
+         ["ix_appointments_date_status_patient"]),
+        ("GET /appointments (hc, one week)",
+         queries.filter_appointments(select(models.Appointment), hc, week_start, week_end),
+         ["ix_appointments_date_status_patient"]),
+        ("GET /appointments/calendar (hospital, month)",
+         queries.appointment_calendar(hospital, month_start, month_end, list(queries.CALENDAR_DIMENSIONS)),
+         ["ix_appointments_date_status_patient"]),
+        ("GET /appointments/calendar (hc, month, status only)",
+         queries.appointment_calendar(hc, month_start, month_end, ["status"]),
+         ["ix_appointments_date_status_patient"]),
+        ("GET /patients/page (hc, first page)",
+         queries.filter_patients(select(models.Patient), hc).order_by(models.Patient.id).limit(queries.PATIENT_PAGE_SIZE + 1),
+         ["ix_patients_hc_zone_id"]),
+        ("GET /patients/page (hc, total)",
+         select(func.count()).select_from(queries.filter_patients(select(models.Patient), hc).subquery()),
+         ["ix_patients_hc_zone_id"]),
+        ("GET /patients/{id}/vitals (one year)",
+         queries.patient_vitals(1, date(2025, 1, 1), date(2025, 12, 31)),
+         ["ix_appointments_patient_date"]),
+        ("GET /home-opd (hc)",
+         queries.filter_home_opd(select(models.HomeOPD), hc),
+         ["ix_home_opd_location_created_at"]),
+        ("GET /home-opd/page (hc, one month)",
+         queries.filter_home_opd(select(*queries.HOME_OPD_COLUMNS), hc, month_start, month_end)
+         .order_by(models.HomeOPD.id.desc()).limit(queries.HOME_OPD_PAGE_SIZE + 1),
+         ["ix_home_opd_location_created_at"]),
+    ]
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").fetchall()]
+
+
+def main():
+    args = parse_args()
+    if not args.keep and os.path.exists(args.db):
+        os.remove(args.db)
+    seeded = os.path.exists(args.db)
+
+    # Point the backend at the benchmark DB before it creates its engine
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    sys.path.insert(0, ROOT)
+    from backend import models, queries, database, migrations
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade_schema(database.engine, models.Base.metadata)
+
+    with database.SessionLocal() as db:
+        if not seeded:
+            seed(db, models, args)
+
+        failures = []
+        for name, stmt, expected in build_cases(models, queries):
+            plan = explain(db.connection(), stmt)
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                rows = db.execute(stmt).all()
+                timings.append((time.perf_counter() - t0) * 1000)
+
+            print(f"\n== {name}")
+            for line in plan:
+                print(f"   {line}")
+            print(f"   rows={len(rows)}  median={statistics.median(timings):.1f}ms  min={min(timings):.1f}ms")
+            if expected and not any(ix in line for ix in expected for line in plan):
+                failures.append(name)
+                print(f"   !! expected index not used: {', '.join(expected)}")
+
+    if not args.keep:
+        database.engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    if failures:
+        print(f"\n{len(failures)} queries lost their index: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Before/after benchmark for the compact list responses (?compact=true).
+
+Seeds a throwaway SQLite database with bench_queries.seed(), then calls /patients and
+/appointments through the app, once the regular way (ORM objects + Pydantic response
+models, nested patient per appointment) and once with ?compact=true (column rows + orjson,
+patients side table), and prints timings and payload sizes.
+
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --patients 100000 --appointments 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from bench_queries import ROOT, Principal, seed
+
+DEFAULT_DB = os.path.join(ROOT, "benchmarks", "bench_serialization.db")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--patients", type=int, default=20_000)
+    parser.add_argument("--appointments", type=int, default=200_000)
+    parser.add_argument("--home-opd", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Reuse an already seeded DB and keep it afterwards")
+    return parser.parse_args()
+
+
+def timed(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - t0) * 1000)
+        assert response.status_code == 200, response.text
+    return statistics.median(timings), len(response.content)
+
+
+def main():
+    args = parse_args()
+    if not args.keep and os.path.exists(args.db):
+        os.remove(args.db)
+    seeded = os.path.exists(args.db)
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    sys.path.insert(0, ROOT)
+    from fastapi.testclient import TestClient
+    from backend import main as app_module, models, database, serializers
+    from backend.user_auth import get_current_user
+
+    if not seeded:
+        with database.SessionLocal() as db:
+            seed(db, models, args)
+
+    app_module.app.dependency_overrides[get_current_user] = lambda: Principal("hospital")
+    client = TestClient(app_module.app)
+    print(f"JSON encoder for compact mode: {'orjson' if serializers.orjson else 'json (orjson not installed)'}")
+
+    cases = [
+        ("/patients (1000)", "/patients?limit=1000", "/patients?limit=1000&compact=true"),
+        ("/appointments (one month)",
+         "/appointments?start_date=2025-06-01&end_date=2025-06-30",
+         "/appointments?start_date=2025-06-01&end_date=2025-06-30&compact=true"),
+        ("/appointments (one week)",
+         "/appointments?start_date=2025-06-02&end_date=2025-06-08",
+         "/appointments?start_date=2025-06-02&end_date=2025-06-08&compact=true"),
+    ]
+    print(f"\n{'endpoint':<28}{'regular ms':>12}{'compact ms':>12}{'speedup':>9}{'regular KB':>12}{'compact KB':>12}")
+    for name, regular_url, compact_url in cases:
+        regular_ms, regular_bytes = timed(client, regular_url, args.repeat)
+        compact_ms, compact_bytes = timed(client, compact_url, args.repeat)
+        print(f"{name:<28}{regular_ms:>12.1f}{compact_ms:>12.1f}{regular_ms / compact_ms:>8.1f}x"
+              f"{regular_bytes / 1024:>12.0f}{compact_bytes / 1024:>12.0f}")
+
+    if not args.keep:
+        database.engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,9 @@ if not exist "frontend\dist" (
     exit /b 1
 )
 
+echo Precompressing assets (.gz/.br)...
+python -m backend.compression frontend\dist
+
 echo.
 echo [4/4] Instructions for PyInstaller...
 echo.
@@ -3,11 +3,25 @@ import axios from 'axios';
 import { Search, Pencil, Trash2 } from 'lucide-react';
 import { cn } from '../lib/utils';
 
+const PAGE_SIZE = 100;
+
+// The register is loaded a page at a time from /patients/page; the search box filters on the
+// server: 13 digits is a CID, other digits/latin letters an HN prefix, anything else part of a name
+const searchParams = (text) => {
+    const term = text.trim();
+    if (!term) return {};
+    if (/^\d{13}$/.test(term)) return { cid: term };
+    if (/^[0-9A-Za-z-]+$/.test(term)) return { hn: term };
+    return { name: term };
+};
+
 const PatientTable = ({ refreshTrigger, onSend, onEdit }) => {
     const [patients, setPatients] = useState([]);
-    const [filteredPatients, setFilteredPatients] = useState([]);
+    const [total, setTotal] = useState(0);
+    const [nextCursor, setNextCursor] = useState(null);
     const [search, setSearch] = useState("");
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     const [error, setError] = useState(null);
 
@@ -15,9 +29,12 @@ const PatientTable = ({ refreshTrigger, onSend, onEdit }) => {
         setLoading(true);
         setError(null);
         try {
-            const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients`);
-            setPatients(res.data);
-            setFilteredPatients(res.data);
+            const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients/page`, {
+                params: { limit: PAGE_SIZE, ...searchParams(search) }
+            });
+            setPatients(res.data.items);
+            setTotal(res.data.total);
+            setNextCursor(res.data.next_cursor);
         } catch (error) {
             console.error("Failed to fetch patients", error);
             setError(error.response?.data?.detail || error.message || "ไม่สามารถโหลดข้อมูลผู้ป่วยได้");
@@ -26,6 +43,22 @@ const PatientTable = ({ refreshTrigger, onSend, onEdit }) => {
         }
     };
 
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients/page`, {
+                params: { limit: PAGE_SIZE, cursor: nextCursor, include_total: false, ...searchParams(search) }
+            });
+            setPatients(prev => [...prev, ...res.data.items]);
+            setNextCursor(res.data.next_cursor);
+        } catch (error) {
+            console.error("Failed to fetch patients", error);
+            setError(error.response?.data?.detail || error.message || "ไม่สามารถโหลดข้อมูลผู้ป่วยได้");
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleDelete = async (patient) => {
         if (!window.confirm(`คุณแน่ใจหรือไม่ที่จะลบผู้ป่วย: ${patient.name}?`)) return;
         try {
@@ -38,21 +71,10 @@ const PatientTable = ({ refreshTrigger, onSend, onEdit }) => {
     };
 
     useEffect(() => {
-        fetchPatients();
-    }, [refreshTrigger]);
-
-    useEffect(() => {
-        if (!search) {
-            setFilteredPatients(patients);
-        } else {
-            const lower = search.toLowerCase();
-            setFilteredPatients(patients.filter(p =>
-                p.name.toLowerCase().includes(lower) ||
-                p.hn.toLowerCase().includes(lower) ||
-                p.hc_zone?.toLowerCase().includes(lower)
-            ));
-        }
-    }, [search, patients]);
+        // Wait for a pause in typing before asking the server
+        const timer = setTimeout(fetchPatients, search ? 300 : 0);
+        return () => clearTimeout(timer);
+    }, [refreshTrigger, search]);
 
     return (
         <div className="bg-white rounded-xl shadow-sm border border-slate-200 overflow-hidden">
@@ -88,10 +110,10 @@ const PatientTable = ({ refreshTrigger, onSend, onEdit }) => {
                             <tr><td colSpan="9" className="p-4 text-center">กำลังโหลด...</td></tr>
                         ) : error ? (
                             <tr><td colSpan="9" className="p-4 text-center text-red-500">เกิดข้อผิดพลาด: {error} <br /> <button onClick={fetchPatients} className="text-indigo-600 underline mt-2">ลองใหม่</button></td></tr>
-                        ) : filteredPatients.length === 0 ? (
+                        ) : patients.length === 0 ? (
                             <tr><td colSpan="9" className="p-4 text-center text-slate-400">ไม่พบข้อมูลผู้ป่วย</td></tr>
                         ) : (
-                            filteredPatients.map(p => (
+                            patients.map(p => (
                                 <tr key={p.id} className="hover:bg-slate-50">
                                     <td className="px-6 py-3 font-mono text-slate-600">{p.hn}</td>
                                     <td className="px-6 py-3 font-medium text-slate-900">{p.name}</td>
@@ -140,7 +162,16 @@ const PatientTable = ({ refreshTrigger, onSend, onEdit }) => {
                 </table>
             </div>
             <div className="p-3 bg-slate-50 border-t border-slate-200 text-xs text-slate-400 text-center">
-                แสดง {filteredPatients.length} รายการ
+                แสดง {patients.length} จาก {total} รายการ
+                {nextCursor !== null && !loading && (
+                    <button
+                        onClick={loadMore}
+                        disabled={loadingMore}
+                        className="ml-3 text-indigo-600 underline disabled:opacity-50"
+                    >
+                        {loadingMore ? "กำลังโหลด..." : "โหลดเพิ่ม"}
+                    </button>
+                )}
             </div>
         </div>
     );
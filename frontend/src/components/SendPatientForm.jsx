@@ -93,23 +93,29 @@ const SendPatientForm = ({ initialPatient }) => {
     const refreshList = () => setRefreshTrigger(prev => prev + 1);
 
     // Suggestion State
-    const [allPatients, setAllPatients] = useState([]);
     const [suggestions, setSuggestions] = useState([]);
 
+    const loadSuggestions = async (text) => {
+        try {
+            const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients/search`, {
+                params: { q: text, limit: 5 },
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            setSuggestions(res.data.results);
+        } catch (err) {
+            console.error("Failed to load patient suggestions", err);
+        }
+    };
+
     useEffect(() => {
-        // Load all patients for suggestions
-        const loadPatients = async () => {
-            try {
-                const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients`, {
-                    headers: { Authorization: `Bearer ${token}` }
-                });
-                setAllPatients(res.data);
-            } catch (err) {
-                console.error("Failed to load patients list", err);
-            }
-        };
-        loadPatients();
-    }, [token]);
+        // Ask /patients/search once typing pauses instead of keeping the whole register in memory
+        if (hnSearch.trim().length < 2) {
+            setSuggestions([]);
+            return;
+        }
+        const timer = setTimeout(() => loadSuggestions(hnSearch.trim()), 250);
+        return () => clearTimeout(timer);
+    }, [hnSearch, token]);
 
     // Load History
     useEffect(() => {
@@ -192,14 +198,13 @@ const SendPatientForm = ({ initialPatient }) => {
         setLoading(true);
         setMsg(null);
         try {
+            const searchTerm = hnSearch.trim();
+            // 13 digits is a CID, anything else an HN; exact lookup, not a prefix match
             const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients`, {
+                params: { ...(/^\d{13}$/.test(searchTerm) ? { cid: searchTerm } : { hn: searchTerm }), exact: true, limit: 1 },
                 headers: { Authorization: `Bearer ${token}` }
             });
-            const searchTerm = hnSearch.trim();
-            const found = res.data.find(p =>
-                String(p.hn).trim() === searchTerm ||
-                String(p.cid).trim() === searchTerm
-            );
+            const found = res.data[0];
 
             if (found) {
                 addToCart(found);
@@ -339,27 +344,9 @@ const SendPatientForm = ({ initialPatient }) => {
                                     type="text"
                                     placeholder="ระบุ HN / เลขบัตรประชาชน"
                                     value={hnSearch}
-                                    onChange={(e) => {
-                                        const val = e.target.value;
-                                        setHnSearch(val);
-                                        if (val.length > 1) {
-                                            const matches = allPatients.filter(p =>
-                                                p.hn.includes(val) ||
-                                                p.name.includes(val)
-                                            ).slice(0, 5);
-                                            setSuggestions(matches);
-                                        } else {
-                                            setSuggestions([]);
-                                        }
-                                    }}
+                                    onChange={(e) => setHnSearch(e.target.value)}
                                     onFocus={() => {
-                                        if (hnSearch.length > 1) {
-                                            const matches = allPatients.filter(p =>
-                                                p.hn.includes(hnSearch) ||
-                                                p.name.includes(hnSearch)
-                                            ).slice(0, 5);
-                                            setSuggestions(matches);
-                                        }
+                                        if (hnSearch.trim().length > 1) loadSuggestions(hnSearch.trim());
                                     }}
                                     onBlur={() => setTimeout(() => setSuggestions([]), 200)} // Delay to allow click
                                     className="w-full pl-10 pr-4 py-2 border border-slate-200 rounded-lg outline-none focus:ring-2 focus:ring-pink-200"
@@ -38,8 +38,10 @@ const HomeOPD = () => {
     const searchPatientByHN = async () => {
         if (!hnSearch) return;
         try {
-            const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients`);
-            const p = res.data.find(x => x.hn === hnSearch);
+            const res = await axios.get(`${window.globalConfig?.API_URL || import.meta.env.VITE_API_URL}/patients`, {
+                params: { hn: hnSearch.trim(), exact: true, limit: 1 }
+            });
+            const p = res.data[0];
             if (p) {
                 setFoundPatient(p);
                 setCid(p.cid || '');
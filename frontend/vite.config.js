@@ -4,4 +4,6 @@ import react from '@vitejs/plugin-react'
 // https://vite.dev/config/
 export default defineConfig({
   plugins: [react()],
+  // dist/.vite/manifest.json: the backend caches the files it lists as immutable
+  build: { manifest: true },
 })
@@ -20,6 +20,7 @@ CREATE TABLE IF NOT EXISTS users (
     location_name VARCHAR(255),
     name VARCHAR(255),
     position VARCHAR(255),
+    token_version INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -43,12 +44,15 @@ CREATE TABLE IF NOT EXISTS patients (
     color VARCHAR(50),
     created_at DATE,
     hc_zone VARCHAR(255),
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    row_version INTEGER
 );
 
 CREATE INDEX idx_patients_hn ON patients(hn);
 CREATE INDEX idx_patients_cid ON patients(cid);
 CREATE INDEX idx_patients_hc_zone ON patients(hc_zone);
+CREATE INDEX ix_patients_hc_zone_id ON patients(hc_zone, id);
+CREATE INDEX ix_patients_row_version ON patients(row_version);
 
 -- Appointments Table
 CREATE TABLE IF NOT EXISTS appointments (
@@ -66,12 +70,16 @@ CREATE TABLE IF NOT EXISTS appointments (
     req_bp BOOLEAN DEFAULT FALSE,
     req_bs BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    row_version INTEGER
 );
 
 CREATE INDEX idx_appointments_patient_id ON appointments(patient_id);
 CREATE INDEX idx_appointments_date ON appointments(appointment_date);
 CREATE INDEX idx_appointments_status ON appointments(status);
+CREATE INDEX ix_appointments_date_status_patient ON appointments(appointment_date, status, patient_id);
+CREATE INDEX ix_appointments_patient_date ON appointments(patient_id, appointment_date);
+CREATE INDEX ix_appointments_row_version ON appointments(row_version);
 
 -- Home OPD Table
 CREATE TABLE IF NOT EXISTS home_opd (
@@ -83,13 +91,97 @@ CREATE TABLE IF NOT EXISTS home_opd (
     note TEXT,
     source VARCHAR(50) CHECK (source IN ('hospital', 'hc')),
     location VARCHAR(255),
-    created_at VARCHAR(50),
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATE,
+    client_id VARCHAR(255),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    row_version INTEGER
 );
 
 CREATE INDEX idx_home_opd_patient_id ON home_opd(patient_id);
 CREATE INDEX idx_home_opd_cid ON home_opd(cid);
 CREATE INDEX idx_home_opd_location ON home_opd(location);
+CREATE INDEX ix_home_opd_location_created_at ON home_opd(location, created_at);
+CREATE UNIQUE INDEX ux_home_opd_client_id ON home_opd(client_id);
+CREATE INDEX ix_home_opd_row_version ON home_opd(row_version);
+
+-- Background Import Jobs Table
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id VARCHAR(64) PRIMARY KEY,
+    kind VARCHAR(50) DEFAULT 'patient_upload',
+    status VARCHAR(20) DEFAULT 'queued',
+    filename VARCHAR(255),
+    file_path TEXT,
+    created_by VARCHAR(255),
+    worker VARCHAR(255),
+    rows_total INTEGER,
+    rows_done INTEGER DEFAULT 0,
+    inserted INTEGER DEFAULT 0,
+    skipped INTEGER DEFAULT 0,
+    rejected INTEGER DEFAULT 0,
+    error TEXT,
+    report TEXT,
+    created_at TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX idx_import_jobs_status ON import_jobs(status);
+
+-- Zone Routing Table (tumbol/moo -> health centre), seeded from the ฐานข้อมูลตำบล CSV on first start
+CREATE TABLE IF NOT EXISTS zone_mappings (
+    id SERIAL PRIMARY KEY,
+    tumbol VARCHAR(255) NOT NULL,
+    moo VARCHAR(20) NOT NULL DEFAULT '',
+    hc_zone VARCHAR(255) NOT NULL,
+    CONSTRAINT uq_zone_mappings_tumbol_moo UNIQUE (tumbol, moo)
+);
+
+-- Version counters for cached data (bumped on every edit)
+CREATE TABLE IF NOT EXISTS data_versions (
+    key VARCHAR(255) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP
+);
+ALTER TABLE data_versions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+
+-- Deleted rows for /sync clients (row_version = change sequence from data_versions 'sync')
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id SERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    row_id INTEGER NOT NULL,
+    hc_zone VARCHAR(255),
+    location VARCHAR(255),
+    row_version INTEGER NOT NULL,
+    deleted_at TIMESTAMP
+);
+
+CREATE INDEX ix_sync_tombstones_row_version ON sync_tombstones(row_version);
+CREATE INDEX ix_sync_tombstones_hc_zone ON sync_tombstones(hc_zone);
+
+INSERT INTO data_versions (key, version) VALUES ('sync', 0) ON CONFLICT (key) DO NOTHING;
+
+-- Dashboard control-rate counters per zone/clinic/month (maintained by the backend, see backend/kpi.py)
+CREATE TABLE IF NOT EXISTS kpi_summary (
+    id SERIAL PRIMARY KEY,
+    hc_zone VARCHAR(255) NOT NULL DEFAULT '',
+    clinic VARCHAR(255) NOT NULL DEFAULT '',
+    month DATE NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    bp_measured INTEGER NOT NULL DEFAULT 0,
+    bp_controlled INTEGER NOT NULL DEFAULT 0,
+    bs_measured INTEGER NOT NULL DEFAULT 0,
+    bs_controlled INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP,
+    CONSTRAINT uq_kpi_summary_zone_clinic_month UNIQUE (hc_zone, clinic, month)
+);
+CREATE INDEX IF NOT EXISTS ix_kpi_summary_month ON kpi_summary(month);
+
+-- Patient search (GET /patients/search): trigram index over name/hn/cid/phone.
+-- The backend also creates these at startup when it has the rights to.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_patients_search_trgm ON patients USING gin (
+    (lower(coalesce(name, '') || ' ' || coalesce(hn, '') || ' ' || coalesce(cid, '') || ' ' || coalesce(phone, ''))) gin_trgm_ops
+);
 
 -- Create a default admin user
 -- Password is 'admin123' (you should change this immediately after first login)
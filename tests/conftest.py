@@ -0,0 +1,118 @@
+import itertools
+import os
+import sys
+import tempfile
+
+# The backend builds its engine and tables on import, so point it at a throwaway SQLite
+# file before anything imports it
+_TMP = tempfile.mkdtemp(prefix="ncd_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ["IMPORT_JOB_DIR"] = os.path.join(_TMP, "import_jobs")
+os.environ.setdefault("ACCESS_LOG", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from backend import main, models, database, http_cache
+from backend.seed import seed_users
+
+PASSWORD = "1234"  # seed.py
+HC_ZONE = "รพ.สต.บ้านปวนพุ"  # rph_puanpu
+OTHER_HC_ZONE = "รพ.สต.หลักร้อยหกสิบ"  # rph_160
+
+seed_users()
+
+# Rows the tests create; users, zone mappings and the counters stay
+DATA_TABLES = [models.Appointment, models.HomeOPD, models.Patient, models.SyncTombstone, models.ImportJob, models.KPISummary]
+
+
+@pytest.fixture(scope="session")
+def client():
+    # No "with": the startup handlers would resume import jobs and start the event broker
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="session")
+def async_client():
+    # The same routes with async_routes installed on aiosqlite, as with ASYNC_DB=1. A copy of
+    # the app, so the sync tests keep the sync routes; "with" keeps one event loop for the
+    # async engine's connections.
+    pytest.importorskip("aiosqlite")
+    from backend import async_routes
+    app = FastAPI()
+    app.router.routes = list(main.app.router.routes)
+    async_routes.install(app)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(params=["sync", "async"])
+def api(request):
+    """Client for tests that must pass on both the sync routes and the ASYNC_DB=1 ones."""
+    return request.getfixturevalue("client" if request.param == "sync" else "async_client")
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    with database.SessionLocal() as session:
+        for model in DATA_TABLES:
+            session.execute(delete(model))
+        # New versions, so nothing cached (ETags, the search index) outlives the rows
+        http_cache.touch_patient_zones(session, HC_ZONE, OTHER_HC_ZONE)
+        session.commit()
+
+
+def login(client, username):
+    response = client.post("/login", json={"username": username, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def hospital(client):
+    return login(client, "hospital")
+
+
+@pytest.fixture(scope="session")
+def hc(client):
+    return login(client, "rph_puanpu")
+
+
+@pytest.fixture(scope="session")
+def other_hc(client):
+    return login(client, "rph_160")
+
+
+@pytest.fixture(scope="session")
+def admin(client):
+    return login(client, "admin")
+
+
+_cids = itertools.count(1000000000001)
+
+
+def create_patient(client, headers, hn, zone=HC_ZONE, **fields):
+    body = {"hn": hn, "cid": str(next(_cids)), "name": f"ผู้ป่วย {hn}", "clinic": "เบาหวาน", "hc_zone": zone, **fields}
+    response = client.post("/patients", headers=headers, json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_appointment(client, headers, patient_id, day, **fields):
+    response = client.post("/appointments", headers=headers, json={"patient_id": patient_id, "appointment_date": str(day), **fields})
+    assert response.status_code == 200, response.text
+    return response.json()
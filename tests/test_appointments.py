@@ -0,0 +1,64 @@
+from collections import Counter
+from datetime import date
+
+from conftest import HC_ZONE, OTHER_HC_ZONE, create_appointment, create_patient
+
+DAY = date(2025, 6, 2)
+
+
+def test_create_and_list(api, client, hospital, hc):
+    ours = create_patient(client, hospital, "AP001", zone=HC_ZONE)
+    theirs = create_patient(client, hospital, "AP002", zone=OTHER_HC_ZONE)
+    created = []
+    for patient, day in ((ours, DAY), (ours, DAY.replace(day=20)), (theirs, DAY)):
+        response = api.post("/appointments", headers=hospital, json={"patient_id": patient["id"], "appointment_date": str(day), "req_bp": True})
+        assert response.status_code == 200, response.text
+        created.append(response.json())
+    assert (created[0]["status"], created[0]["patient"]["hn"]) == ("pending", "AP001")
+
+    response = api.get("/appointments", headers=hc)
+    assert sorted(a["id"] for a in response.json()) == [created[0]["id"], created[1]["id"]]
+    in_range = api.get("/appointments", headers=hc, params={"start_date": "2025-06-01", "end_date": "2025-06-10"}).json()
+    assert [a["id"] for a in in_range] == [created[0]["id"]]
+    # Compact: the same appointments, each patient once in a side table
+    compact = api.get("/appointments", headers=hospital, params={"compact": True}).json()
+    patients = {p["id"]: p for p in compact["patients"]}
+    assert len(patients) == 2
+    assert [{**a, "patient": patients[a["patient_id"]]} for a in compact["appointments"]] == api.get("/appointments", headers=hospital).json()
+
+
+def test_only_hospital_creates(api, client, hospital, hc):
+    patient = create_patient(client, hospital, "AP001")
+    response = api.post("/appointments", headers=hc, json={"patient_id": patient["id"], "appointment_date": str(DAY)})
+    assert response.status_code == 403
+    response = api.post("/appointments", headers=hospital, json={"patient_id": patient["id"], "appointment_date": "02/06/2025"})
+    assert response.status_code == 400
+
+
+def test_calendar_counts_match_list(client, hospital, hc):
+    ours = create_patient(client, hospital, "AP001", zone=HC_ZONE)
+    theirs = create_patient(client, hospital, "AP002", zone=OTHER_HC_ZONE)
+    appointments = [
+        (ours, DAY, True), (ours, DAY, False), (ours, DAY, True), (theirs, DAY, True),
+        (ours, date(2025, 6, 30), True), (ours, date(2025, 7, 1), True),
+    ]
+    for patient, day, req_bs in appointments:
+        create_appointment(client, hospital, patient["id"], day, req_bp=True, req_bs=req_bs)
+
+    def calendar(headers, **params):
+        response = client.get("/appointments/calendar", headers=headers, params={"start_date": "2025-06-01", **params})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    # Defaults to the rest of the start month, one bucket per day and dimension values
+    month = calendar(hospital)
+    assert (month["end_date"], month["total"]) == ("2025-06-30", 5)
+    listed = client.get("/appointments", headers=hospital, params={"start_date": "2025-06-01", "end_date": "2025-06-30"}).json()
+    expected = Counter((a["appointment_date"], a["status"], a["patient"]["hc_zone"], a["req_bp"], a["req_bs"]) for a in listed)
+    assert {(b["date"], b["status"], b["hc_zone"], b["req_bp"], b["req_bs"]): b["count"] for b in month["buckets"]} == expected
+
+    # HC users only see their zone; fewer dimensions merge buckets
+    assert [(b["date"], b["count"]) for b in calendar(hc, group_by="")["buckets"]] == [("2025-06-02", 3), ("2025-06-30", 1)]
+    assert [(b["req_bs"], b["count"]) for b in calendar(hc, end_date="2025-06-02", group_by="req_bs")["buckets"]] == [(False, 1), (True, 2)]
+    assert client.get("/appointments/calendar", headers=hc, params={"group_by": "clinic"}).status_code == 400
+    assert client.get("/appointments/calendar", headers=hc, params={"start_date": "2025-06-02", "end_date": "2025-06-01"}).status_code == 400
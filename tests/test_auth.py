@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+import pytest
+
+from backend import models, user_auth
+from conftest import HC_ZONE, OTHER_HC_ZONE, create_patient, login
+
+
+@pytest.fixture
+def claims_mode(monkeypatch):
+    monkeypatch.setattr(user_auth, "AUTH_MODE", "claims")
+    with user_auth._user_cache_lock:
+        user_auth._user_cache.clear()
+
+
+def token_for(username, db, **claims):
+    user = db.query(models.User).filter(models.User.username == username).one()
+    data = {"sub": username, "role": user.role, "loc": user.location_name or "", "ver": user.token_version or 0, **claims}
+    token = user_auth.create_access_token(data, expires_delta=timedelta(minutes=5))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_db_mode_reads_the_row(client, hospital, db):
+    create_patient(client, hospital, "A0001", zone=HC_ZONE)
+    create_patient(client, hospital, "A0002", zone=OTHER_HC_ZONE)
+    # The loc claim is ignored, the users row decides the zone
+    headers = token_for("rph_puanpu", db, loc=OTHER_HC_ZONE)
+    assert [p["hn"] for p in client.get("/patients", headers=headers).json()] == ["A0001"]
+
+
+def test_claims_mode_uses_token_claims(client, hospital, db, claims_mode):
+    create_patient(client, hospital, "A0001", zone=HC_ZONE)
+    create_patient(client, hospital, "A0002", zone=OTHER_HC_ZONE)
+    headers = token_for("rph_puanpu", db, loc=OTHER_HC_ZONE)
+    me = client.get("/me", headers=headers).json()
+    assert (me["role"], me["location"]) == ("hc", OTHER_HC_ZONE)
+    assert [p["hn"] for p in client.get("/patients", headers=headers).json()] == ["A0002"]
+
+
+def test_claims_mode_revokes_on_version_change(client, admin, claims_mode):
+    username = "rph_nongmakaew"
+    headers = login(client, username)
+    me = client.get("/me", headers=headers).json()
+    assert me["role"] == "hc"
+
+    users = {u["username"]: u for u in client.get("/users", headers=admin).json()}
+    user = users[username]
+    # A zone change bumps token_version: the cached row is dropped and the old token stops working
+    response = client.put(f"/users/{user['id']}", headers=admin, json={"location_name": OTHER_HC_ZONE})
+    assert response.status_code == 200, response.text
+    try:
+        assert client.get("/me", headers=headers).status_code == 401
+        assert client.get("/me", headers=login(client, username)).json()["location"] == OTHER_HC_ZONE
+    finally:
+        client.put(f"/users/{user['id']}", headers=admin, json={"location_name": me["location"]})
+
+
+def test_rejects_unknown_user_and_bad_signature(client, db, claims_mode):
+    headers = token_for("hospital", db, sub="nobody")
+    assert client.get("/me", headers=headers).status_code == 401
+    assert client.get("/me", headers={"Authorization": "Bearer not-a-token"}).status_code == 401
@@ -0,0 +1,59 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from backend import compression
+
+BODY = b'{"rows": [' + b'{"hn": "0001", "name": "test"},' * 100 + b'{}]}'
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+
+    @app.get("/json")
+    def json_body():
+        return Response(BODY, media_type="application/json", headers={"ETag": '"v1"'})
+
+    @app.get("/small")
+    def small():
+        return Response(b"{}", media_type="application/json", headers={"ETag": '"v1"'})
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([BODY]), media_type="text/event-stream")
+
+    return TestClient(compression.CompressionMiddleware(app))
+
+
+def test_compressed_etag_is_weak(app_client):
+    response = app_client.get("/json", headers=GZIP)
+    assert (response.headers["content-encoding"], response.headers["etag"]) == ("gzip", 'W/"v1"')
+    assert response.headers["vary"] == "Accept-Encoding" and response.content == BODY
+    assert len(compression.compress(BODY, "gzip")) == int(response.headers["content-length"])
+
+    # Sent as is: strong ETag kept
+    for path, headers in (("/json", {"Accept-Encoding": "identity"}), ("/small", GZIP)):
+        response = app_client.get(path, headers=headers)
+        assert "content-encoding" not in response.headers and response.headers["etag"] == '"v1"'
+
+
+def test_event_stream_not_compressed(app_client):
+    assert not compression._compressible("text/event-stream; charset=utf-8")
+    response = app_client.get("/events", headers=GZIP)
+    assert "content-encoding" not in response.headers and response.content == BODY
+
+
+def test_weak_etag_revalidates(client, hospital):
+    # The app's validators accept the weakened tag a compressing proxy or this middleware sends back
+    response = client.get("/patients", headers={**hospital, **GZIP}, params={"limit": 500})
+    etag = response.headers["etag"]
+    assert client.get("/patients", headers={**hospital, "If-None-Match": f"W/{etag.removeprefix('W/')}"}, params={"limit": 500}).status_code == 304
+
+
+def test_choose_encoding():
+    assert compression.choose_encoding("gzip;q=0, *;q=0.5", ("br", "gzip")) == "br"
+    assert compression.choose_encoding("br;q=0, gzip", ("br", "gzip")) == "gzip"
+    assert compression.choose_encoding("identity", ("br", "gzip")) is None
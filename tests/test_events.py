@@ -0,0 +1,64 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+from backend import events
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for RedisBroker: the publish script and a pub/sub feed."""
+    counters = {}
+    messages = []
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def register_script(self, script):
+        def run(keys, args):
+            self.counters[keys[0]] = self.counters.get(keys[0], 0) + 1
+            self.messages.append(f"{self.counters[keys[0]]} {args[1]}".encode())
+            return self.counters[keys[0]]
+        return run
+
+    def pubsub(self, **kwargs):
+        return types.SimpleNamespace(subscribe=lambda channel: None, close=lambda: None,
+                                     listen=lambda: ({"data": m} for m in self.messages))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    FakeRedis.counters, FakeRedis.messages = {}, []
+    monkeypatch.setitem(sys.modules, "redis", types.SimpleNamespace(Redis=FakeRedis))
+
+
+def test_redis_broker_uses_shared_ids(fake_redis):
+    # Two workers publishing through the same Redis: ids continue across them
+    received = events.EventBus()
+    first = events.RedisBroker(received, "redis://localhost", "test")
+    second = events.RedisBroker(events.EventBus(), "redis://localhost", "test")
+    first.publish({"type": "appointment.completed", "hc_zone": "z"})
+    second.publish({"type": "appointment.completed", "hc_zone": "z"})
+
+    first._pubsub = first.client.pubsub()
+    first._listen()
+    assert [e["id"] for e in received._history] == [1, 2]
+
+
+def test_replay_after_last_event_id():
+    bus = events.EventBus()
+    for event_id in (7, 8, 9):
+        bus.dispatch({"type": "appointment.completed", "hc_zone": "z"}, event_id)
+
+    async def backlog():
+        sub = bus.subscribe(zone="z", last_event_id=7)
+        return [sub.queue.get_nowait()["id"] for _ in range(sub.queue.qsize())]
+    assert asyncio.run(backlog()) == [8, 9]
+
+
+def test_missing_redis_package(monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", None)
+    with pytest.raises(RuntimeError, match="pip install redis"):
+        events.RedisBroker(events.EventBus(), "redis://localhost", "test")
@@ -0,0 +1,40 @@
+from conftest import HC_ZONE, OTHER_HC_ZONE, create_patient
+
+
+def add(api, headers, **body):
+    response = api.post("/home-opd", headers=headers, json={"type": "patient", **body})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def ids(response):
+    assert response.status_code == 200, response.text
+    return sorted(item["id"] for item in response.json())
+
+
+def test_create_and_zone_listing(api, client, hospital, hc, other_hc):
+    ours = create_patient(client, hospital, "H0001", zone=HC_ZONE)
+    theirs = create_patient(client, hospital, "H0002", zone=OTHER_HC_ZONE)
+    linked = add(api, hospital, patient_id=ours["id"])          # hospital entry for one of our patients
+    local = add(api, hc, cid="3100000000099", name="ผู้มาเยี่ยม")  # entered at our location
+    elsewhere = add(api, other_hc, patient_id=theirs["id"])
+    assert (linked["source"], local["source"], local["location"]) == ("hospital", "hc", HC_ZONE)
+
+    assert ids(api.get("/home-opd", headers=hc)) == sorted([linked["id"], local["id"]])
+    assert ids(api.get("/home-opd", headers=other_hc)) == [elsewhere["id"]]
+    assert ids(api.get("/home-opd", headers=hospital)) == sorted([linked["id"], local["id"], elsewhere["id"]])
+    assert api.post("/home-opd", headers=hc, json={"type": "patient"}).status_code == 400
+
+
+def test_page(api, client, hospital, hc):
+    patient = create_patient(client, hospital, "H0001")
+    items = [add(api, hc, patient_id=patient["id"], type=t) for t in ("patient", "osm", "patient")]
+
+    page = api.get("/home-opd/page", headers=hc, params={"limit": 2}).json()
+    # Newest first
+    assert ([i["id"] for i in page["items"]], page["total"]) == ([items[2]["id"], items[1]["id"]], 3)
+    page = api.get("/home-opd/page", headers=hc, params={"limit": 2, "cursor": page["next_cursor"]}).json()
+    assert ([i["id"] for i in page["items"]], page["next_cursor"]) == ([items[0]["id"]], None)
+
+    page = api.get("/home-opd/page", headers=hospital, params={"type": "osm", "hc_zone": HC_ZONE}).json()
+    assert [i["id"] for i in page["items"]] == [items[1]["id"]]
@@ -0,0 +1,63 @@
+from backend import models
+from conftest import OTHER_HC_ZONE, create_patient
+
+
+def etag(client, headers, url):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.headers["etag"]
+
+
+def revalidate(client, headers, url, tag):
+    return client.get(url, headers={**headers, "If-None-Match": tag}).status_code
+
+
+def test_not_modified_until_a_write(client, hospital, hc):
+    create_patient(client, hospital, "E0001")
+    tag = etag(client, hc, "/patients")
+    assert revalidate(client, hc, "/patients", tag) == 304
+
+    create_patient(client, hospital, "E0002")
+    assert revalidate(client, hc, "/patients", tag) == 200
+
+
+def test_zone_views_and_all_zones_view(client, hospital, hc):
+    hospital_tag, hc_tag = etag(client, hospital, "/patients"), etag(client, hc, "/patients")
+
+    # Another zone's write: the HC's copy stays valid, the hospital's all-zones copy doesn't
+    create_patient(client, hospital, "E0001", zone=OTHER_HC_ZONE)
+    assert revalidate(client, hc, "/patients", hc_tag) == 304
+    assert revalidate(client, hospital, "/patients", hospital_tag) == 200
+
+    # A patient without a zone changes the all-zones view too
+    hospital_tag = etag(client, hospital, "/patients")
+    create_patient(client, hospital, "E0002", zone=None)
+    assert revalidate(client, hospital, "/patients", hospital_tag) == 200
+
+
+def test_writes_only_lock_zone_rows(client, hospital, db):
+    create_patient(client, hospital, "E0001")
+    create_patient(client, hospital, "E0002", zone=None)
+    keys = [key for (key,) in db.query(models.DataVersion.key).filter(models.DataVersion.key.startswith("etag:"))]
+    assert keys and not any(key.endswith(":*") for key in keys)
+
+
+def test_kpi_rebuild_invalidates_dashboard(client, admin, hc):
+    for headers in (admin, hc):
+        tag = etag(client, headers, "/dashboard/kpi")
+        assert revalidate(client, headers, "/dashboard/kpi", tag) == 304
+        assert client.post("/admin/kpi/rebuild", headers=admin).status_code == 200
+        assert revalidate(client, headers, "/dashboard/kpi", tag) == 200
+
+
+def test_write_in_the_same_second_is_not_hidden(client, hospital, hc):
+    create_patient(client, hospital, "E0001")
+    first = client.get("/patients", headers=hc)
+    last_modified = first.headers["last-modified"]
+
+    # Within the same second as the response above: Last-Modified can't tell them apart
+    create_patient(client, hospital, "E0002")
+    response = client.get("/patients", headers={**hc, "If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert [p["hn"] for p in response.json()] == ["E0001", "E0002"]
+    assert revalidate(client, hc, "/patients", first.headers["etag"]) == 200
@@ -0,0 +1,148 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from backend import jobs, models, patient_import
+from conftest import HC_ZONE
+
+HEADER = "HN,เลขบัตรประชาชน,ชื่อ-นามสกุล,ตำบล,หมู่\n"
+
+
+def csv_rows(count, start=1):
+    # Tumbol/moo of the bundled zone CSV, so the rows route to a real zone
+    return "".join(f"T{i:05d},{3100000000000 + i},ผู้ป่วย {i},ปวนพุ,1\n" for i in range(start, start + count))
+
+
+def write_csv(text):
+    path = os.path.join(jobs.job_dir(), f"{uuid.uuid4().hex}.csv")
+    with open(path, "w", encoding="utf-8-sig") as f:
+        f.write(text)
+    return path
+
+
+def wait_for_job(db, job_id, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.expire_all()
+        job = db.get(models.ImportJob, job_id)
+        if job.status in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} still {job.status} after {timeout}s")
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def add_job(db, path, status="running", worker=None, **fields):
+    job = models.ImportJob(id=uuid.uuid4().hex, status=status, filename="register.csv", file_path=path,
+                           worker=worker, created_at=datetime.utcnow(), **fields)
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def hns(db):
+    return sorted(hn for (hn,) in db.query(models.Patient.hn))
+
+
+# --- Upload ---
+def test_upload_counts_and_caps_report(client, hospital, monkeypatch):
+    monkeypatch.setattr(patient_import, "REPORT_LIMIT", 2)
+    text = HEADER + csv_rows(3) + "".join(f"X{i},,ไม่มีบัตร {i},ปวนพุ,1\n" for i in range(4))
+    response = client.post("/patients/upload", headers=hospital, files={"file": ("register.csv", text.encode("utf-8"))})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["inserted"], body["rejected"], body["skipped"], body["rows"]) == (3, 4, 0, 7)
+    assert len(body["report"]) == 2 and body["report_truncated"]
+
+    # Same file again: everything already exists
+    response = client.post("/patients/upload", headers=hospital, files={"file": ("register.csv", (HEADER + csv_rows(3)).encode("utf-8"))})
+    assert (response.json()["inserted"], response.json()["skipped"]) == (0, 3)
+
+
+def test_upload_unreadable_file(client, hospital):
+    response = client.post("/patients/upload", headers=hospital, files={"file": ("register.xlsx", b"not a spreadsheet")})
+    assert response.status_code == 400
+    assert "Excel" in response.json()["detail"] and "CSV" in response.json()["detail"]
+
+
+def test_stream_upload(client, hospital, db):
+    response = client.post("/patients/upload?stream=true", headers=hospital,
+                           files={"file": ("register.csv", (HEADER + csv_rows(5)).encode("utf-8"))})
+    assert response.status_code == 200, response.text
+    assert response.json()["inserted"] == 5
+    assert db.query(models.Patient).filter(models.Patient.hc_zone == HC_ZONE).count() == 5
+
+
+# --- Background jobs ---
+def test_background_import(client, hospital, db):
+    response = client.post("/patients/upload?background=true", headers=hospital,
+                           files={"file": ("register.csv", (HEADER + csv_rows(25)).encode("utf-8"))})
+    assert response.status_code == 202, response.text
+    job = wait_for_job(db, response.json()["job_id"])
+    assert job.status == "completed", job.error
+    assert (job.rows_done, job.inserted) == (25, 25)
+    assert not os.path.exists(job.file_path)
+
+    status = client.get(f"/jobs/{job.id}", headers=hospital).json()
+    assert status["status"] == "completed" and status["progress"] == 100.0
+
+
+def test_import_file_skip_rows(db):
+    path = write_csv(HEADER + csv_rows(7))
+    result = patient_import.import_file(db, path, chunk_rows=2, skip_rows=3)
+    assert (result["rows"], result["inserted"]) == (4, 4)
+    assert hns(db) == ["T00004", "T00005", "T00006", "T00007"]
+
+
+def test_resume_orphaned_job(db):
+    # Crashed after committing the first 2 rows: those are in the table and in the job row
+    path = write_csv(HEADER + csv_rows(5))
+    patient_import.import_file(db, write_csv(HEADER + csv_rows(2)))
+    job_id = add_job(db, path, worker=f"{socket.gethostname()}:{dead_pid()}", rows_total=5, rows_done=2, inserted=2)
+
+    assert jobs.resume_pending_jobs() == [job_id]
+    job = wait_for_job(db, job_id)
+    assert job.status == "completed", job.error
+    assert (job.rows_done, job.inserted, job.skipped) == (5, 5, 0)
+    assert hns(db) == [f"T{i:05d}" for i in range(1, 6)]
+
+
+def test_resume_requeues_queued_job(db):
+    job_id = add_job(db, write_csv(HEADER + csv_rows(3)), status="queued")
+    assert jobs.resume_pending_jobs() == [job_id]
+    assert wait_for_job(db, job_id).inserted == 3
+
+
+def test_resume_skips_live_jobs(db):
+    path = write_csv(HEADER + csv_rows(3))
+    ours = add_job(db, path, worker=jobs.WORKER_ID)
+    other_host = add_job(db, path, worker=f"not-{socket.gethostname()}:1")
+    assert jobs.resume_pending_jobs() == []
+    db.expire_all()
+    assert {db.get(models.ImportJob, i).status for i in (ours, other_host)} == {"running"}
+
+
+def test_resume_fails_job_without_file(db):
+    job_id = add_job(db, os.path.join(jobs.job_dir(), "gone.csv"), worker=f"{socket.gethostname()}:{dead_pid()}")
+    assert jobs.resume_pending_jobs() == []
+    db.expire_all()
+    job = db.get(models.ImportJob, job_id)
+    assert job.status == "failed" and "missing" in job.error
+
+
+def test_orphan_detection():
+    host = socket.gethostname()
+    assert jobs._is_orphaned(models.ImportJob(worker=None))
+    assert jobs._is_orphaned(models.ImportJob(worker=f"{host}:{dead_pid()}"))
+    assert not jobs._is_orphaned(models.ImportJob(worker=jobs.WORKER_ID))
+    assert not jobs._is_orphaned(models.ImportJob(worker=f"{host}:{os.getppid()}"))
+    assert not jobs._is_orphaned(models.ImportJob(worker=f"other-{host}:{dead_pid()}"))
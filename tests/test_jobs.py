@@ -0,0 +1,67 @@
+import os
+import socket
+
+import pytest
+
+from backend import jobs, models
+
+HOST = socket.gethostname()
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs._executor, "submit", lambda fn, job_id: calls.append(job_id))
+    return calls
+
+
+def dead_pid():
+    pid = 4194304  # Above Linux's default pid_max
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid += 1
+
+
+def test_resume_pending_jobs(db, tmp_path, submitted):
+    upload = tmp_path / "upload.csv"
+    upload.write_text("hn\n")
+    jobs_by_id = {
+        "queued": ("queued", None, upload),
+        "dead": ("running", f"{HOST}:{dead_pid()}", upload),
+        "no_worker": ("running", None, upload),
+        "ours": ("running", jobs.WORKER_ID, upload),
+        "other_host": ("running", "another-host:1", upload),  # Can't tell, left to that host
+        "alive": ("running", f"{HOST}:{os.getppid()}", upload),
+        "file_gone": ("running", f"{HOST}:{dead_pid()}", tmp_path / "missing.csv"),
+        "done": ("completed", None, upload),
+    }
+    for job_id, (status, worker, path) in jobs_by_id.items():
+        db.add(models.ImportJob(id=job_id, status=status, worker=worker, file_path=str(path), rows_done=10))
+    db.commit()
+
+    assert sorted(jobs.resume_pending_jobs()) == sorted(submitted) == ["dead", "no_worker", "queued"]
+    db.expire_all()
+    status = {job.id: (job.status, job.error) for job in db.query(models.ImportJob)}
+    assert status["dead"] == ("queued", None)
+    assert {status[j][0] for j in ("ours", "other_host", "alive")} == {"running"}
+    assert status["file_gone"] == ("failed", "Upload file missing after restart")
+
+
+def test_resumed_job_skips_imported_rows(db, tmp_path, client, hospital):
+    upload = tmp_path / "upload.csv"
+    upload.write_text("HN,เลขบัตรประชาชน,ชื่อ-นามสกุล,ตำบล,หมู่\nJ0001,3100000000001,ก,ปวนพุ,1\nJ0002,3100000000002,ข,ปวนพุ,1\nJ0003,3100000000003,ค,ปวนพุ,1\n", encoding="utf-8")
+    # Interrupted after the first row was committed
+    db.add(models.ImportJob(id="resumed", status="queued", file_path=str(upload), rows_done=1, inserted=1))
+    db.commit()
+
+    jobs.run_import_job("resumed")
+    db.expire_all()
+    job = db.get(models.ImportJob, "resumed")
+    assert (job.status, job.rows_done, job.inserted, job.worker) == ("completed", 3, 3, jobs.WORKER_ID)
+    assert not upload.exists()
+    assert sorted(p["hn"] for p in client.get("/patients", headers=hospital).json()) == ["J0002", "J0003"]
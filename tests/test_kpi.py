@@ -0,0 +1,62 @@
+from datetime import date
+
+from backend import kpi, models
+from conftest import HC_ZONE, OTHER_HC_ZONE, create_appointment, create_patient
+
+JUNE, JULY = date(2025, 6, 2), date(2025, 7, 7)
+
+
+def summary(db):
+    db.expire_all()
+    return sorted(
+        (row.hc_zone, row.clinic, row.month, *(getattr(row, c) for c in kpi.COUNTERS))
+        for row in db.query(models.KPISummary)
+    )
+
+
+def visit(client, headers, appointment_id, **values):
+    response = client.put(f"/appointments/{appointment_id}/visit", headers=headers, json=values)
+    assert response.status_code == 200, response.text
+
+
+def test_counters_match_rebuild(client, hospital, hc, db):
+    first = create_patient(client, hospital, "K0001")
+    second = create_patient(client, hospital, "K0002", clinic="ความดัน")
+    a, b, c = (create_appointment(client, hospital, first["id"], day)["id"] for day in (JUNE, JUNE.replace(day=20), JULY))
+    d = create_appointment(client, hospital, second["id"], JUNE)["id"]
+
+    visit(client, hc, a, bp_sys=150, bp_dia=95, bp_sys_2=135, bp_dia_2=85, blood_sugar=110)  # Second reading counts
+    visit(client, hc, b, bp_sys=120, bp_dia=80, blood_sugar=200)
+    visit(client, hc, d, bp_sys=160, bp_dia=100)
+    # Re-recorded: the first values are taken out again
+    visit(client, hc, b, bp_sys=145, bp_dia=80)
+    response = client.put("/appointments/visits", headers=hc, json={"items": [{"id": c, "blood_sugar": 90}]})
+    assert response.json()["updated"] == 1
+    assert (HC_ZONE, "เบาหวาน", date(2025, 6, 1), 2, 2, 1, 1, 1) in summary(db)
+
+    # Referred back after completion: leaves July's bucket, which is deleted once empty
+    assert client.put(f"/appointments/{c}/refer-back", headers=hc, json={"note": "ส่งกลับ"}).status_code == 200
+    assert not [row for row in summary(db) if row[2] == date(2025, 7, 1)]
+
+    # Moved to another zone and clinic, then deleted: the counters follow the patient
+    response = client.put(f"/patients/{first['id']}", headers=hospital, json={**first, "hc_zone": OTHER_HC_ZONE, "clinic": "ความดัน"})
+    assert response.status_code == 200, response.text
+    assert [row[:2] for row in summary(db)] == [(HC_ZONE, "ความดัน"), (OTHER_HC_ZONE, "ความดัน")]
+    assert client.delete(f"/patients/{second['id']}", headers=hospital).status_code == 200
+
+    incremental = summary(db)
+    assert kpi.rebuild(db) == len(incremental)
+    assert summary(db) == incremental
+
+
+def test_dashboard_rates(client, hospital, hc, admin):
+    patient = create_patient(client, hospital, "K0001")
+    for values in ({"bp_sys": 130, "bp_dia": 80}, {"bp_sys": 150, "bp_dia": 80, "blood_sugar": 100}):
+        visit(client, hc, create_appointment(client, hospital, patient["id"], JUNE)["id"], **values)
+
+    params = {"start_month": "2025-01", "end_month": "2025-12", "group_by": "hc_zone"}
+    report = client.get("/dashboard/kpi", headers=hc, params=params).json()
+    assert [b["hc_zone"] for b in report["buckets"]] == [HC_ZONE]
+    total = report["total"]
+    assert (total["completed"], total["bp_measured"], total["bp_controlled"], total["bp_control_rate"]) == (2, 2, 1, 0.5)
+    assert client.get("/dashboard/kpi", headers=admin, params={**params, "group_by": "ward"}).status_code == 400
@@ -0,0 +1,115 @@
+import json
+import logging
+import queue
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import logs
+
+
+@pytest.fixture
+def access_lines():
+    # The app's own pipeline: records are prepared on the queue handler, formatted as JSON
+    records = queue.Queue()
+    handler = logs.QueueHandler(records)
+    logs.access_logger.addHandler(handler)
+    level = logs.access_logger.level
+    logs.access_logger.setLevel(logging.INFO)
+    formatter = logs.JSONFormatter()
+    yield lambda: [json.loads(formatter.format(records.get_nowait())) for _ in range(records.qsize())]
+    logs.access_logger.removeHandler(handler)
+    logs.access_logger.setLevel(level)
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        logs.bind(user="hospital", zone=None)
+        return {"id": item_id}
+
+    return TestClient(logs.RequestLogMiddleware(app, access_log=True))
+
+
+def test_request_id_round_trip(client, hospital, app_client):
+    response = client.get("/me", headers={**hospital, logs.REQUEST_ID_HEADER: "trace-42"})
+    assert (response.status_code, response.headers[logs.REQUEST_ID_HEADER]) == (200, "trace-42")
+    # Generated when missing or unusable
+    generated = app_client.get("/items/1").headers[logs.REQUEST_ID_HEADER]
+    assert len(generated) == 16 and generated != app_client.get("/items/1").headers[logs.REQUEST_ID_HEADER]
+    assert app_client.get("/items/1", headers={logs.REQUEST_ID_HEADER: "x" * 65}).headers[logs.REQUEST_ID_HEADER] != "x" * 65
+
+
+def test_access_line(app_client, access_lines):
+    response = app_client.get("/items/7?access_token=secret&q=1", headers={logs.REQUEST_ID_HEADER: "trace-7"})
+    assert response.status_code == 200
+    [line] = access_lines()
+    assert set(line) == {"ts", "level", "logger", "msg", "method", "route", "status", "duration_ms", "request_id", "user"}
+    assert (line["level"], line["logger"], line["msg"]) == ("INFO", "backend.access", "GET /items/7 200")
+    assert (line["route"], line["status"], line["request_id"], line["user"]) == ("/items/{item_id}", 200, "trace-7", "hospital")
+    assert isinstance(line["duration_ms"], float)
+    # The query string (tokens, search terms) never reaches the log
+    assert "secret" not in json.dumps(line) and "q=1" not in json.dumps(line)
+
+
+def test_pool_counters(client, admin):
+    before = client.get("/admin/db-pool", headers=admin).json()
+    after = client.get("/admin/db-pool", headers=admin).json()
+    assert after["dialect"] == "sqlite" and after["pool_class"]
+    # Each request checks a connection out and back in
+    assert after["checkouts"] > before["checkouts"] and after["checkins"] > before["checkins"]
+    assert after["connects"] >= 1 and after["invalidations"] == before["invalidations"]
+
+
+def test_records_resolved_on_the_request_thread(app_client, access_lines):
+    app = app_client.app.app
+
+    @app.get("/fail")
+    def fail():
+        logs.bind(user="hc", zone="รพ.สต.ก")
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logs.access_logger.exception("Failed for %s", {"hn": "0001"}, extra={"zone": "explicit"})
+        return {}
+
+    app_client.get("/fail", headers={logs.REQUEST_ID_HEADER: "trace-9"})
+    error, access = access_lines()
+    # Message, traceback and request context are filled in before queueing; extra= wins
+    assert error["msg"] == "Failed for {'hn': '0001'}" and "ZeroDivisionError" in error["exc"]
+    assert (error["request_id"], error["user"], error["zone"]) == ("trace-9", "hc", "explicit")
+    assert access["zone"] == "รพ.สต.ก"
+
+
+def test_full_queue_drops(monkeypatch):
+    monkeypatch.setattr(logs.QueueHandler, "dropped", 0)
+    handler = logs.QueueHandler(queue.Queue(1))
+    record = logging.LogRecord("backend.test", logging.INFO, __file__, 1, "line", None, None)
+    for _ in range(3):
+        handler.handle(record)
+    assert (handler.queue.qsize(), logs.QueueHandler.dropped) == (1, 2)
+
+
+def test_setup_writes_json_with_level_overrides(tmp_path, monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(logs, "_listener", None)
+    monkeypatch.setattr(logs, "LOG_FILE", str(tmp_path / "app.log"))
+    monkeypatch.setattr(logs, "LOG_LEVELS", "backend.quiet=WARNING, backend.loud=debug")
+    monkeypatch.setattr(root, "handlers", [])
+    monkeypatch.setattr(root, "level", root.level)
+    try:
+        logs.setup()
+        logs.setup()  # Second call is a no-op
+        logging.getLogger("backend.quiet").info("hidden")
+        logging.getLogger("backend.loud").debug("shown %d", 1)
+    finally:
+        logs.shutdown()
+        for name in ("backend.quiet", "backend.loud"):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+    assert len(root.handlers) == 1
+    lines = [json.loads(line) for line in (tmp_path / "app.log").read_text(encoding="utf-8").splitlines()]
+    assert [(line["logger"], line["level"], line["msg"]) for line in lines] == [("backend.loud", "DEBUG", "shown 1")]
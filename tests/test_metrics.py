@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+from backend import main, metrics
+
+
+def test_no_token_allows_only_loopback(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 403
+    assert TestClient(main.app, client=("203.0.113.5", 50000)).get("/metrics").status_code == 403
+    for host in ("127.0.0.1", "::1"):
+        response = TestClient(main.app, client=(host, 50000)).get("/metrics")
+        assert response.status_code == 200 and "http_requests_total" in response.text
+
+
+def test_token_required_when_set(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    local = TestClient(main.app, client=("127.0.0.1", 50000))
+    assert local.get("/metrics").status_code == 401
+    assert local.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert local.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+
+from sqlalchemy import Date, String
+from sqlalchemy.dialects import postgresql
+
+from backend import database, migrations, models
+
+
+class PostgresEngine:
+    # The suite has no PostgreSQL: just enough of an engine to record the statements
+    dialect = postgresql.dialect()
+
+    def __init__(self):
+        self.statements = []
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+class OldInspector:
+    # home_opd as created before created_at became a Date
+    def get_table_names(self):
+        return ["home_opd"]
+
+    def get_columns(self, table_name):
+        return [
+            {"name": c.name, "type": String() if c.name == "created_at" else c.type}
+            for c in models.HomeOPD.__table__.columns
+        ]
+
+
+def test_convert_date_columns(monkeypatch):
+    engine = PostgresEngine()
+    monkeypatch.setattr(migrations, "inspect", lambda bind: OldInspector())
+    assert migrations.convert_date_columns(engine, models.Base.metadata) == ["home_opd.created_at"]
+    # Blank strings become NULL instead of failing the cast
+    assert engine.statements == [
+        "ALTER TABLE home_opd ALTER COLUMN created_at TYPE DATE USING NULLIF(TRIM(created_at), '')::DATE"
+    ]
+
+    # Already converted: nothing to do
+    monkeypatch.setattr(OldInspector, "get_columns", lambda self, name: [{"name": "created_at", "type": Date()}])
+    assert migrations.convert_date_columns(PostgresEngine(), models.Base.metadata) == []
+
+
+def test_sqlite_dates_left_alone(db):
+    assert migrations.convert_date_columns(database.engine, models.Base.metadata) == []
+    assert migrations.upgrade_schema(database.engine, models.Base.metadata) == []
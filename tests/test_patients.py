@@ -0,0 +1,99 @@
+import json
+from datetime import date, datetime
+
+from backend import queries, serializers
+from conftest import HC_ZONE, OTHER_HC_ZONE, PASSWORD, create_patient
+
+
+def hns(response):
+    assert response.status_code == 200, response.text
+    return [p["hn"] for p in response.json()]
+
+
+def test_login(api):
+    response = api.post("/login", json={"username": "rph_puanpu", "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["user"] == {"username": "rph_puanpu", "role": "hc", "location": HC_ZONE}
+    me = api.get("/me", headers={"Authorization": f"Bearer {body['access_token']}"})
+    assert me.json()["location"] == HC_ZONE
+    assert api.post("/login", json={"username": "rph_puanpu", "password": "wrong"}).status_code == 400
+
+
+def test_pages_follow_next_cursor(api, client, hospital, monkeypatch):
+    monkeypatch.setattr(queries, "PATIENT_PAGE_SIZE", 2)
+    for i in range(5):
+        create_patient(client, hospital, f"P{i:04d}")
+
+    seen, params = [], {}
+    while True:
+        response = api.get("/patients", headers=hospital, params=params)
+        seen += hns(response)
+        if queries.NEXT_CURSOR_HEADER not in response.headers:
+            break
+        params = {"cursor": response.headers[queries.NEXT_CURSOR_HEADER]}
+    assert seen == [f"P{i:04d}" for i in range(5)]
+
+
+def test_page_endpoint(api, client, hospital, hc):
+    for i in range(3):
+        create_patient(client, hospital, f"P{i:04d}")
+    create_patient(client, hospital, "P0003", zone=OTHER_HC_ZONE)
+
+    page = api.get("/patients/page", headers=hc, params={"limit": 2}).json()
+    assert ([p["hn"] for p in page["items"]], page["total"]) == (["P0000", "P0001"], 3)
+    page = api.get("/patients/page", headers=hc, params={"limit": 2, "cursor": page["next_cursor"], "include_total": False}).json()
+    assert ([p["hn"] for p in page["items"]], page["next_cursor"], page["total"]) == (["P0002"], None, None)
+    # Compact rows are the same JSON
+    compact = api.get("/patients", headers=hc, params={"compact": True}).json()
+    assert compact == api.get("/patients", headers=hc).json()
+
+
+def test_upload(api, hospital, hc):
+    text = "HN,เลขบัตรประชาชน,ชื่อ-นามสกุล,ตำบล,หมู่\nU0001,3100000000001,ผู้ป่วย,ปวนพุ,1\nU0002,,ไม่มีบัตร,ปวนพุ,1\n"
+    for params in ({}, {"stream": True}):
+        response = api.post("/patients/upload", headers=hospital, params=params, files={"file": ("register.csv", text.encode("utf-8"))})
+        assert response.status_code == 200, response.text
+        assert (response.json()["rows"], response.json()["rejected"]) == (2, 1)
+    assert hns(api.get("/patients", headers=hc)) == ["U0001"]
+    assert api.post("/patients/upload", headers=hc, files={"file": ("register.csv", text.encode("utf-8"))}).status_code == 403
+    response = api.post("/patients/upload", headers=hospital, files={"file": ("register.xlsx", b"not a spreadsheet")})
+    assert response.status_code == 400
+
+
+def test_exact_hn_beyond_first_prefix_page(api, client, hospital, hc, monkeypatch):
+    monkeypatch.setattr(queries, "PATIENT_PAGE_SIZE", 2)
+    # Created first, so they fill the prefix match's first page
+    for i in range(3):
+        create_patient(client, hospital, f"P1{i}")
+    create_patient(client, hospital, "P1")
+    create_patient(client, hospital, "P2", zone=OTHER_HC_ZONE)
+
+    assert "P1" not in hns(api.get("/patients", headers=hc, params={"hn": "P1"}))
+    assert hns(api.get("/patients", headers=hc, params={"hn": " P1 ", "exact": True})) == ["P1"]
+    # Still limited to the caller's zone
+    assert hns(api.get("/patients", headers=hc, params={"hn": "P2", "exact": True})) == []
+
+    patient = api.get("/patients", headers=hc, params={"hn": "P1", "exact": True}).json()[0]
+    assert hns(api.get("/patients", headers=hc, params={"cid": patient["cid"], "exact": True})) == ["P1"]
+
+
+def test_compact_matches_full_rows(client, hospital, monkeypatch):
+    monkeypatch.setattr(queries, "PATIENT_PAGE_SIZE", 2)
+    create_patient(client, hospital, "CP001", name="สมชาย ใจดี", created_at="2025-06-02", phone=None)
+    for hn in ("CP002", "CP003"):
+        create_patient(client, hospital, hn)
+    full = client.get("/patients", headers=hospital)
+    compact = client.get("/patients", headers=hospital, params={"compact": True})
+    assert compact.json() == full.json() and len(full.json()) == 2
+    assert compact.headers[queries.NEXT_CURSOR_HEADER] == full.headers[queries.NEXT_CURSOR_HEADER]
+
+
+def test_dumps_without_orjson(monkeypatch):
+    content = {"name": "สมชาย", "created_at": date(2025, 6, 2), "updated_at": datetime(2025, 6, 2, 8, 30), "bp_sys": None}
+    expected = json.loads(serializers.dumps(content))
+    monkeypatch.setattr(serializers, "orjson", None)
+    monkeypatch.setattr(serializers, "json", json, raising=False)
+    # Same JSON from the stdlib encoder, Thai text kept as UTF-8
+    assert json.loads(serializers.dumps(content)) == expected
+    assert "สมชาย".encode() in serializers.dumps(content)
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql
+
+from backend import models, search
+from conftest import OTHER_HC_ZONE, create_patient
+
+
+def find(client, headers, q, **params):
+    response = client.get("/patients/search", headers=headers, params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [p["hn"] for p in response.json()["results"]]
+
+
+@pytest.fixture
+def few_candidates(monkeypatch):
+    # One candidate row per result, so a common substring has more matches than are read
+    monkeypatch.setattr(search, "CANDIDATES", 1)
+
+
+def test_common_substring_keeps_best_match(client, hospital, few_candidates):
+    for i in range(6):
+        create_patient(client, hospital, f"Q{i:04d}", name=f"นางสาวสมศรี นามสกุลยาวมาก {i}")
+    create_patient(client, hospital, "Q9999", name="สมศรี")
+    assert find(client, hospital, "สมศรี", limit=1) == ["Q9999"]
+
+
+def test_identifier_prefix_found_first(client, hospital, few_candidates):
+    # Every HN contains "q00", only one starts with the typed one
+    for i in range(6):
+        create_patient(client, hospital, f"XQ00{i}", name="ผู้ป่วย")
+    create_patient(client, hospital, "Q0042", name="ผู้ป่วย")
+    assert find(client, hospital, "q004", limit=1) == ["Q0042"]
+
+
+def test_ngram_index_follows_writes(client, hospital, monkeypatch):
+    monkeypatch.setattr(search, "backend", "ngram")
+    patient = create_patient(client, hospital, "N0001", name="ประเสริฐ")
+    assert find(client, hospital, "ประเสริฐ") == ["N0001"]
+
+    response = client.put(f"/patients/{patient['id']}", headers=hospital, json={**patient, "name": "บุญมี"})
+    assert response.status_code == 200, response.text
+    assert find(client, hospital, "ประเสริฐ") == []
+    assert find(client, hospital, "บุญมี") == ["N0001"]
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    monkeypatch.setattr(search, "backend", "ngram")
+    calls = []
+    rebuild = search.NgramIndex._rebuild
+    monkeypatch.setattr(search.NgramIndex, "_rebuild", lambda self, db, seq: (calls.append(seq), rebuild(self, db, seq)))
+    return calls
+
+
+def test_ngram_index_applies_changed_rows(client, hospital, hc, db, rebuilds):
+    first = create_patient(client, hospital, "N0001", name="ประเสริฐ")
+    assert find(client, hospital, "ประเสริฐ") == ["N0001"]
+    built = len(rebuilds)
+
+    # Writes after the first build only touch the changed patients
+    create_patient(client, hospital, "N0002", name="ประเสริฐศักดิ์")
+    moved = client.put(f"/patients/{first['id']}", headers=hospital, json={**first, "hc_zone": OTHER_HC_ZONE})
+    assert moved.status_code == 200, moved.text
+    assert find(client, hc, "ประเสริฐ") == ["N0002"]
+    assert client.delete(f"/patients/{first['id']}", headers=hospital).status_code == 200
+    assert find(client, hospital, "ประเสริฐ") == ["N0002"]
+    assert len(rebuilds) == built
+
+    # Deleted behind the index's back (no tombstone): the count check rebuilds it
+    db.execute(delete(models.Patient))
+    search.http_cache.touch(db, "patients", [None])
+    db.commit()
+    assert find(client, hospital, "ประเสริฐ") == []
+    assert len(rebuilds) == built + 1
+
+
+def test_pg_trgm_sql():
+    # Checked as compiled SQL: the suite has no PostgreSQL to run it against
+    stmt = search._pg_trgm_stmt("สม_ชาย", "z", 5).compile(dialect=postgresql.dialect())
+    sql = " ".join(str(stmt).split())
+    document = search.PG_DOCUMENT
+    # Substring (escaped LIKE) or word-similarity match on the indexed expression, in the zone,
+    # best score first
+    assert f"WHERE ({document} LIKE " in sql and f"OR %(q)s::VARCHAR <%% {document}) AND patients.hc_zone = " in sql
+    assert f"ORDER BY word_similarity(" in sql and sql.endswith(f"{document}) DESC, patients.id LIMIT %(param_1)s::INTEGER")
+    assert sorted(stmt.params.values(), key=str) == sorted(["%สม\\_ชาย%", "สม_ชาย", "z", "สม_ชาย", 5], key=str)
+    # Same expression as ix_patients_search_trgm, or the index can't be used
+    assert f"(({document}) gin_trgm_ops)" in search.PG_SETUP[1]
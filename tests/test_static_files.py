@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from backend import http_cache, main, static_files
+
+PAGE = {"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"}
+API = {"Accept": "application/json, text/plain, */*"}
+
+
+def write(directory, name, content):
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def dist(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    write(directory, "index.html", b"<!doctype html><div id=root></div>")
+    write(directory, "assets/index-3f2a9c1b.js", b"console.log(1)")
+    write(directory, "favicon-20240101.png", b"png")  # From public/: hash-like name, not hashed
+    manifest = static_files.StaticManifest(directory)
+    manifest.build()
+    monkeypatch.setattr(main, "static_manifest", manifest)
+    return manifest
+
+
+def test_files_and_index_fallback(client, dist):
+    response = client.get("/assets/index-3f2a9c1b.js")
+    assert (response.status_code, response.text) == (200, "console.log(1)")
+    assert client.get("/assets/index-3f2a9c1b.js", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Client-side routes load the app, a missing bundle file doesn't
+    page = client.get("/patients/42", headers=PAGE)
+    assert page.status_code == 200 and "id=root" in page.text
+    assert client.get("/assets/index-00000000.js", headers=PAGE).status_code == 404
+
+
+def test_unknown_api_path_is_json_404(client, dist):
+    response = client.get("/patientz", headers=API)
+    assert (response.status_code, response.json()) == (404, {"detail": "Not Found"})
+
+
+def test_cache_control_without_manifest(dist):
+    assert dist.files["assets/index-3f2a9c1b.js"].headers["Cache-Control"] == http_cache.IMMUTABLE
+    assert dist.files["favicon-20240101.png"].headers["Cache-Control"] == http_cache.REVALIDATE
+    assert dist.files["index.html"].headers["Cache-Control"] == http_cache.REVALIDATE
+
+
+def test_cache_control_from_vite_manifest(dist):
+    write(dist.directory, "assets/copied-from-public.js", b"")
+    write(dist.directory, static_files.VITE_MANIFEST, json.dumps({
+        "index.html": {"file": "assets/index-3f2a9c1b.js", "css": ["assets/index-77aa00ff.css"], "isEntry": True},
+    }).encode())
+    write(dist.directory, "assets/index-77aa00ff.css", b"body{}")
+    dist.build()
+    cache_control = {path: entry.headers["Cache-Control"] for path, entry in dist.files.items()}
+    assert cache_control["assets/index-3f2a9c1b.js"] == cache_control["assets/index-77aa00ff.css"] == http_cache.IMMUTABLE
+    assert cache_control["assets/copied-from-public.js"] == http_cache.REVALIDATE
+
+
+def test_large_files_served_from_disk(client, dist, monkeypatch):
+    monkeypatch.setattr(static_files, "STATIC_MEMORY_MAX", 10)
+    body = os.urandom(3 * 1024 * 1024)
+    write(dist.directory, "assets/big-0badc0de.bin", body)
+    dist.build()
+    entry = dist.files["assets/big-0badc0de.bin"]
+    assert entry.body is None and entry.etag == '"' + hashlib.sha1(body).hexdigest()[:24] + '"'
+    assert client.get("/assets/big-0badc0de.bin").content == body
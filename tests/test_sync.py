@@ -0,0 +1,116 @@
+from datetime import date
+
+import pytest
+
+from backend import models, sync
+from conftest import HC_ZONE, OTHER_HC_ZONE, create_appointment, create_patient
+
+DAY = date(2025, 6, 2)
+
+
+def pull(client, headers, since=None):
+    response = client.get("/sync", headers=headers, params={"since": since} if since else {})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def push(client, headers, changes):
+    response = client.post("/sync", headers=headers, json={"changes": changes})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def deleted(delta, table):
+    return sorted(d["id"] for d in delta["deleted"] if d["table"] == table)
+
+
+@pytest.fixture
+def no_pending_rows(db):
+    yield
+    # Every committed row got its real sequence number
+    db.expire_all()
+    for table in sync.SYNC_TABLES:
+        assert db.execute(table.select().where(table.c.row_version == sync.PENDING)).first() is None
+
+
+def test_delta_has_only_newer_rows(client, hospital, hc, no_pending_rows):
+    first = create_patient(client, hospital, "S0001")
+    create_appointment(client, hospital, first["id"], DAY)
+    full = pull(client, hc)
+    assert full["full"] and [p["hn"] for p in full["patients"]] == ["S0001"] and len(full["appointments"]) == 1
+
+    second = create_patient(client, hospital, "S0002")
+    appointment = create_appointment(client, hospital, second["id"], DAY)
+    create_patient(client, hospital, "S0003", zone=OTHER_HC_ZONE)
+    delta = pull(client, hc, full["cursor"])
+    assert not delta["full"]
+    assert [p["hn"] for p in delta["patients"]] == ["S0002"]
+    assert [a["id"] for a in delta["appointments"]] == [appointment["id"]]
+    assert delta["cursor"] > full["cursor"]
+    assert all(0 < row["row_version"] <= delta["cursor"] for row in delta["patients"] + delta["appointments"])
+
+    assert pull(client, hc, delta["cursor"])["patients"] == []
+
+
+def test_moved_patient_reaches_new_zone(client, hospital, hc, other_hc, no_pending_rows):
+    patient = create_patient(client, hospital, "S0001", tumbol="ปวนพุ", moo="1")
+    appointment_ids = [create_appointment(client, hospital, patient["id"], DAY.replace(day=d))["id"] for d in (2, 9, 16, 23)]
+    linked = client.post("/home-opd", headers=hospital, json={"patient_id": patient["id"], "type": "patient"}).json()
+    # Entered by the old zone at its own location: it keeps seeing that one
+    local = client.post("/home-opd", headers=hc, json={"patient_id": patient["id"], "type": "patient"}).json()
+    old_cursor, new_cursor = pull(client, hc)["cursor"], pull(client, other_hc)["cursor"]
+
+    response = client.put(f"/patients/{patient['id']}", headers=hospital, json={**patient, "hc_zone": OTHER_HC_ZONE})
+    assert response.status_code == 200, response.text
+
+    delta = pull(client, other_hc, new_cursor)
+    assert [p["id"] for p in delta["patients"]] == [patient["id"]]
+    assert sorted(a["id"] for a in delta["appointments"]) == appointment_ids
+    assert sorted(h["id"] for h in delta["home_opd"]) == sorted([linked["id"], local["id"]])
+    # Same as a full download for that zone
+    full = pull(client, other_hc)
+    assert len(full["appointments"]) == len(delta["appointments"]) == 4
+
+    delta = pull(client, hc, old_cursor)
+    assert delta["patients"] == [] and delta["appointments"] == []
+    assert deleted(delta, "patients") == [patient["id"]]
+    assert deleted(delta, "appointments") == appointment_ids
+    assert deleted(delta, "home_opd") == [linked["id"]]
+
+
+def test_push_returns_committed_version(client, hospital, hc, no_pending_rows):
+    patient = create_patient(client, hospital, "S0001")
+    appointment = create_appointment(client, hospital, patient["id"], DAY)
+    base = pull(client, hc)["appointments"][0]["row_version"]
+
+    result = push(client, hc, [
+        {"op": "visit", "id": appointment["id"], "base_version": base, "data": {"bp_sys": 130, "bp_dia": 80}},
+        {"op": "home_opd", "client_id": "c-1", "data": {"patient_id": patient["id"], "type": "patient"}},
+    ])
+    applied = result["results"]
+    assert [r["status"] for r in applied] == ["applied", "applied"]
+    assert applied[0]["row_version"] == applied[1]["row_version"] == result["cursor"] > base
+    assert pull(client, hc, base)["appointments"][0]["row_version"] == applied[0]["row_version"]
+
+    # An edit based on the old version now conflicts; resending the same values doesn't
+    conflict = push(client, hc, [{"op": "visit", "id": appointment["id"], "base_version": base, "data": {"bp_sys": 150, "bp_dia": 95}}])
+    assert conflict["results"][0]["status"] == "conflict"
+    assert conflict["results"][0]["current"]["bp_sys"] == 130
+    retry = push(client, hc, [{"op": "visit", "id": appointment["id"], "base_version": base, "data": {"bp_sys": 130, "bp_dia": 80}}])
+    assert retry["results"][0]["status"] == "applied"
+
+
+def test_deleted_rows_are_tombstoned(client, hospital, hc, no_pending_rows):
+    patient = create_patient(client, hospital, "S0001")
+    appointment = create_appointment(client, hospital, patient["id"], DAY)
+    cursor = pull(client, hc)["cursor"]
+    assert client.delete(f"/appointments/{appointment['id']}", headers=hospital).status_code == 200
+    assert deleted(pull(client, hc, cursor), "appointments") == [appointment["id"]]
+
+
+def test_rolled_back_write_takes_no_number(db):
+    before = sync.current_seq(db)
+    db.add(models.Patient(hn="S0001", cid="3100000000001", name="ผู้ป่วย", hc_zone=HC_ZONE))
+    db.flush()
+    db.rollback()
+    assert sync.current_seq(db) == before
@@ -0,0 +1,99 @@
+from datetime import date
+
+import pytest
+
+from backend import models, queries
+from conftest import HC_ZONE, OTHER_HC_ZONE, create_appointment, create_patient
+
+DAY = date(2025, 6, 2)
+
+
+@pytest.fixture
+def appointments(client, hospital):
+    ours = create_patient(client, hospital, "V0001", zone=HC_ZONE)
+    theirs = create_patient(client, hospital, "V0002", zone=OTHER_HC_ZONE)
+    return {
+        "ours": [create_appointment(client, hospital, ours["id"], DAY)["id"], create_appointment(client, hospital, ours["id"], DAY.replace(day=9))["id"]],
+        "theirs": create_appointment(client, hospital, theirs["id"], DAY)["id"],
+    }
+
+
+def visits(client, headers, items):
+    response = client.put("/appointments/visits", headers=headers, json={"items": items})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def appointments_version(db):
+    db.expire_all()
+    return db.query(models.DataVersion.version).filter(models.DataVersion.key == f"etag:appointments:{HC_ZONE}").scalar()
+
+
+def test_records_results(client, hc, db, appointments):
+    a, b = appointments["ours"]
+    result = visits(client, hc, [{"id": a, "bp_sys": 150, "bp_dia": 95}, {"id": b, "bp_sys": 128, "bp_dia": 80, "blood_sugar": 110}])
+    assert (result["updated"], result["unchanged"], result["failed"]) == (2, 0, 0)
+    row = db.get(models.Appointment, b)
+    assert (row.status, row.bp_sys, row.bp_dia, row.blood_sugar) == ("completed", 128, 80, 110)
+
+
+def test_resend_is_idempotent(client, hc, db, appointments):
+    items = [{"id": a, "bp_sys": 140, "bp_dia": 90} for a in appointments["ours"]]
+    visits(client, hc, items)
+    version = appointments_version(db)
+    row_version = db.get(models.Appointment, items[0]["id"]).row_version
+
+    # A client retrying after a lost response sends the same batch again: nothing is written
+    result = visits(client, hc, items)
+    assert (result["updated"], result["unchanged"], result["failed"]) == (0, 2, 0)
+    assert {item["status"] for item in result["items"]} == {"unchanged"}
+    assert appointments_version(db) == version
+    assert db.get(models.Appointment, items[0]["id"]).row_version == row_version
+
+    # Different values are an update again
+    result = visits(client, hc, [{**items[0], "bp_sys": 132}])
+    assert result["updated"] == 1
+    assert appointments_version(db) == version + 1
+
+
+def test_partial_failure(client, hc, db, appointments):
+    a, b = appointments["ours"]
+    result = visits(client, hc, [
+        {"id": a, "bp_sys": 130, "bp_dia": 85},
+        {"id": appointments["theirs"], "bp_sys": 130, "bp_dia": 85},
+        {"id": 999999, "bp_sys": 130, "bp_dia": 85},
+        {"id": a, "bp_sys": 170, "bp_dia": 100},
+    ])
+    assert [item["status"] for item in result["items"]] == ["updated", "forbidden", "not_found", "duplicate"]
+    assert (result["updated"], result["unchanged"], result["failed"]) == (1, 0, 3)
+
+    db.expire_all()
+    # The valid item is saved with its first values, the rejected ones are untouched
+    assert (db.get(models.Appointment, a).status, db.get(models.Appointment, a).bp_sys) == ("completed", 130)
+    assert db.get(models.Appointment, b).status == "pending"
+    assert db.get(models.Appointment, appointments["theirs"]).status == "pending"
+
+
+def test_hospital_can_record_any_zone(client, hospital, appointments):
+    result = visits(client, hospital, [{"id": appointments["theirs"], "bp_sys": 120, "bp_dia": 70}])
+    assert result["updated"] == 1
+
+
+def test_batch_size_limit(client, hc, appointments, monkeypatch):
+    monkeypatch.setattr(queries, "VISIT_BATCH_MAX", 1)
+    items = [{"id": a, "bp_sys": 120} for a in appointments["ours"]]
+    response = client.put("/appointments/visits", headers=hc, json={"items": items})
+    assert response.status_code == 400
+
+
+def test_vitals_keep_whole_readings(client, hc, db, appointments):
+    a, b = appointments["ours"]
+    visits(client, hc, [{"id": a, "bp_sys": 150, "bp_dia": 95}, {"id": b, "bp_sys": 128, "bp_dia": 81, "blood_sugar": 110}])
+    patient_id = db.get(models.Appointment, a).patient_id
+
+    vitals = client.get(f"/patients/{patient_id}/vitals", headers=hc).json()
+    assert (vitals["sys"], vitals["dia"], vitals["sugar"]) == ([150, 128], [95, 81], [None, 110])
+    assert all(type(v) is int for v in vitals["sys"] + vitals["dia"] + vitals["sugar"][1:])
+    # Averaged groups keep their decimals
+    vitals = client.get(f"/patients/{patient_id}/vitals", headers=hc, params={"max_points": 1}).json()
+    assert vitals["downsampled"] and vitals["dia"] == [88.0]
@@ -0,0 +1,50 @@
+import pytest
+
+from backend import models, zones
+
+TUMBOL = "ทดสอบ"
+
+
+def resolve(client, headers, tumbol, moo=None):
+    response = client.get("/zones/resolve", headers=headers, params={"tumbol": tumbol, "moo": moo})
+    assert response.status_code == 200, response.text
+    return response.json()["hc_zone"]
+
+
+@pytest.fixture
+def clock(monkeypatch, db):
+    now = [1000.0]
+    monkeypatch.setattr(zones.time, "monotonic", lambda: now[0])
+    zones.invalidate_cache()
+    yield now
+    # Mappings aren't among the cleaned tables
+    db.query(models.ZoneMapping).filter(models.ZoneMapping.tumbol == TUMBOL).delete()
+    db.commit()
+    zones.invalidate_cache()
+
+
+def test_upsert_is_seen_at_once(client, hospital, admin, clock):
+    assert resolve(client, hospital, TUMBOL, "3") == zones.DEFAULT_ZONE
+    # Whole-tumbol fallback, then a moo-level row; written as the CSV spells them
+    client.put("/zones/mappings", headers=admin, json={"tumbol": f"ตำบล{TUMBOL}", "moo": "", "hc_zone": "รพ.สต.ก"})
+    response = client.put("/zones/mappings", headers=admin, json={"tumbol": TUMBOL, "moo": "หมู่ 03", "hc_zone": "รพ.สต.ข"})
+    assert response.status_code == 200, response.text
+    assert (resolve(client, hospital, TUMBOL, "3"), resolve(client, hospital, TUMBOL, "4")) == ("รพ.สต.ข", "รพ.สต.ก")
+
+    # Same key again: updated, not duplicated
+    again = client.put("/zones/mappings", headers=admin, json={"tumbol": TUMBOL, "moo": "3", "hc_zone": "รพ.สต.ค"}).json()
+    assert again["id"] == response.json()["id"] and resolve(client, hospital, TUMBOL, "ม.3") == "รพ.สต.ค"
+    assert client.delete(f"/zones/mappings/{again['id']}", headers=admin).status_code == 200
+    assert resolve(client, hospital, TUMBOL, "3") == "รพ.สต.ก"
+
+
+def test_other_worker_edit_seen_after_ttl(client, hospital, db, clock):
+    assert resolve(client, hospital, TUMBOL) == zones.DEFAULT_ZONE
+    # Written by another process: this one's cache isn't invalidated, only the version moves
+    db.add(models.ZoneMapping(tumbol=TUMBOL, moo="", hc_zone="รพ.สต.ก"))
+    zones.bump_data_version(db, zones.VERSION_KEY)
+    db.commit()
+    clock[0] += zones.ZONE_CACHE_TTL - 1
+    assert resolve(client, hospital, TUMBOL) == zones.DEFAULT_ZONE
+    clock[0] += 1
+    assert resolve(client, hospital, TUMBOL) == "รพ.สต.ก"